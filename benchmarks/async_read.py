@@ -0,0 +1,119 @@
+"""
+Сравнение пропускной способности и памяти: синхронные эндпоинты под
+gunicorn (WSGI) против async-эндпоинтов под gunicorn + uvicorn (ASGI).
+
+Оба сервера поднимаются docker compose (сервисы web и asgi) или вручную:
+    gunicorn config.wsgi:application -w 2 -b 127.0.0.1:8000
+    gunicorn config.asgi:application -w 2 -k uvicorn.workers.UvicornWorker -b 127.0.0.1:8001
+
+Запуск (токен — access из /api/token/):
+    python benchmarks/async_read.py --token <JWT> \\
+        --target wsgi=http://127.0.0.1:8000/api/courses/ \\
+        --target asgi=http://127.0.0.1:8001/api/async/courses/ \\
+        --concurrency 50 --requests 2000
+
+Память на запрос в обработке оценивается как прирост суммарного RSS процессов
+сервера под нагрузкой относительно простоя, делённый на concurrency.
+Процессы ищутся по подстроке командной строки (--pids-match).
+"""
+import argparse
+import os
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def server_rss_kb(match):
+    """Суммарный RSS (КБ) процессов, в командной строке которых есть ``match``."""
+    total = 0
+    for pid in filter(str.isdigit, os.listdir('/proc')):
+        try:
+            with open(f'/proc/{pid}/cmdline', 'rb') as f:
+                cmdline = f.read().replace(b'\0', b' ').decode(errors='ignore')
+            if match not in cmdline or 'async_read.py' in cmdline:
+                continue
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            continue
+    return total
+
+
+def run(url, token, concurrency, total, pids_match):
+    headers = {'Authorization': f'Bearer {token}'}
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        request = urllib.request.Request(url, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+        except Exception:
+            with lock:
+                errors += 1
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    idle_rss = server_rss_kb(pids_match) if pids_match else 0
+    peak_rss = idle_rss
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak_rss
+        while not stop.is_set():
+            peak_rss = max(peak_rss, server_rss_kb(pids_match))
+            time.sleep(0.2)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if pids_match:
+        sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    latencies.sort()
+    result = {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0,
+        'errors': errors,
+    }
+    if pids_match:
+        result['idle_rss_mb'] = idle_rss / 1024
+        result['peak_rss_mb'] = peak_rss / 1024
+        result['kb_per_inflight'] = (peak_rss - idle_rss) / concurrency
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', action='append', required=True, help='имя=URL, можно несколько')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--pids-match', action='append', default=[],
+                        help='имя=подстрока командной строки процессов сервера (для замера RSS)')
+    args = parser.parse_args()
+
+    matches = dict(item.split('=', 1) for item in args.pids_match)
+    for target in args.target:
+        name, url = target.split('=', 1)
+        result = run(url, args.token, args.concurrency, args.requests, matches.get(name))
+        line = ', '.join(f'{key}={value:.1f}' if isinstance(value, float) else f'{key}={value}'
+                         for key, value in result.items())
+        print(f'{name}: {line}')
+
+
+if __name__ == '__main__':
+    main()
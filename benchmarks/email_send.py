@@ -0,0 +1,107 @@
+"""
+Скорость рассылки: send_mail с новым соединением на письмо против
+PooledMailer (config/mailer.py) — пул потоков с переиспользуемыми
+соединениями.
+
+    pip install aiosmtpd
+    python benchmarks/email_send.py --messages 500 --latency-ms 20 --workers 8
+
+Локальный SMTP-сервер aiosmtpd с AUTH изображает внешний: ``--latency-ms``
+— задержка ответа на DATA, ``--connect-ms`` — на приветствие (TCP/TLS и
+AUTH у настоящего сервера), ``--tempfail`` — доля писем, получающих
+временный отказ 451 (проверка повторов с задержкой).
+"""
+import argparse
+import os
+import random
+import sys
+import logging
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def start_server(port, latency, connect_delay, tempfail):
+    import asyncio
+
+    # aiosmtpd пишет предупреждения на каждую сессию с AUTH
+    logging.getLogger('mail.log').setLevel(logging.ERROR)
+
+    from aiosmtpd.controller import Controller
+    from aiosmtpd.smtp import SMTP, AuthResult
+
+    class Handler:
+        received = 0
+
+        async def handle_EHLO(self, server, session, envelope, hostname, responses):
+            await asyncio.sleep(connect_delay)
+            session.host_name = hostname
+            return responses
+
+        async def handle_DATA(self, server, session, envelope):
+            await asyncio.sleep(latency)
+            if random.random() < tempfail:
+                return '451 Try again later'
+            Handler.received += 1
+            return '250 OK'
+
+    class AuthController(Controller):
+        def factory(self):
+            return SMTP(self.handler, authenticator=lambda *args: AuthResult(success=True),
+                        auth_require_tls=False, **self.SMTP_kwargs)
+
+    controller = AuthController(Handler(), hostname='127.0.0.1', port=port)
+    controller.start()
+    return controller, Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--per-connection', type=int, default=100)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--connect-ms', type=float, default=30)
+    parser.add_argument('--tempfail', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=8025)
+    args = parser.parse_args()
+
+    import django
+    from django.conf import settings
+
+    settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    settings.EMAIL_HOST, settings.EMAIL_PORT = '127.0.0.1', args.port
+    settings.EMAIL_HOST_USER, settings.EMAIL_HOST_PASSWORD = 'bench', 'bench'
+    settings.EMAIL_USE_TLS = False
+    django.setup()
+    from django.core.mail import EmailMessage, send_mail
+
+    from config.mailer import PooledMailer
+
+    controller, handler = start_server(args.port, args.latency_ms / 1000, args.connect_ms / 1000, args.tempfail)
+    recipients = [f'user{i}@example.com' for i in range(args.messages)]
+    try:
+        started = time.perf_counter()
+        for email in recipients:
+            send_mail('Обновление курса', 'Текст', 'noreply@example.com', [email], fail_silently=True)
+        elapsed = time.perf_counter() - started
+        print(f'send_mail (соединение на письмо): {args.messages / elapsed:.0f} писем/с, '
+              f'доставлено {handler.received}')
+
+        handler.received = 0
+        mailer = PooledMailer(workers=args.workers, per_connection=args.per_connection, backoff=0.05)
+        messages = [EmailMessage('Обновление курса', 'Текст', 'noreply@example.com', [email]) for email in recipients]
+        started = time.perf_counter()
+        sent, failed = mailer.send(messages)
+        elapsed = time.perf_counter() - started
+        print(f'PooledMailer ({args.workers} потоков): {args.messages / elapsed:.0f} писем/с, '
+              f'доставлено {handler.received}, не отправлено {failed}')
+    finally:
+        controller.stop()
+
+
+if __name__ == '__main__':
+    main()
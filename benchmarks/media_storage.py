@@ -0,0 +1,69 @@
+"""
+Пропускная способность загрузки и экономия места: FileSystemStorage против
+ContentAddressedStorage (config/storage.py).
+
+    python manage.py migrate
+    python benchmarks/media_storage.py --files 300 --size-kb 512 --unique 0.3
+
+Сохраняет ``--files`` файлов размером ``--size-kb``, из которых уникальна
+доля ``--unique`` (остальные — повторы, как одно превью у многих уроков).
+Файлы пишутся во временный каталог; строки MediaBlob откатываются.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+
+def disk_usage(root):
+    return sum(path.stat().st_size for path in Path(root).rglob('*') if path.is_file())
+
+
+def run(storage, payloads):
+    from django.core.files.base import ContentFile
+
+    started = time.perf_counter()
+    for index, payload in enumerate(payloads):
+        storage.save(f'lessons/preview-{index}.jpg', ContentFile(payload))
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--unique', type=float, default=0.3)
+    args = parser.parse_args()
+
+    import django
+
+    django.setup()
+    from django.core.files.storage import FileSystemStorage
+    from django.db import transaction
+
+    from config.storage import ContentAddressedStorage
+
+    unique = [os.urandom(args.size_kb * 1024) for _ in range(max(1, int(args.files * args.unique)))]
+    payloads = unique + [random.choice(unique) for _ in range(args.files - len(unique))]
+    random.shuffle(payloads)
+    total_mb = args.files * args.size_kb / 1024
+
+    for name, storage_class in (('FileSystemStorage', FileSystemStorage),
+                                ('ContentAddressedStorage', ContentAddressedStorage)):
+        with tempfile.TemporaryDirectory() as root, transaction.atomic():
+            elapsed = run(storage_class(location=root), payloads)
+            used = disk_usage(root) / 1024 / 1024
+            print(f'{name}: {total_mb / elapsed:.0f} МБ/с ({args.files / elapsed:.0f} файлов/с), '
+                  f'на диске {used:.1f} МБ из {total_mb:.1f} МБ')
+            transaction.set_rollback(True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Бюджет запуска: время импорта (python -X importtime) и память воркеров gunicorn.
+
+    python benchmarks/startup.py                    # только импорт
+    python benchmarks/startup.py --gunicorn 4       # + RSS/PSS воркеров с preload и без
+
+Импорт меряется для того, что делает каждый процесс: django.setup() и загрузка
+URLconf (все представления и сериализаторы). Для gunicorn сравниваются режимы
+GUNICORN_PRELOAD=1 (preload + gc.freeze, см. gunicorn.conf.py) и =0; PSS
+учитывает общие copy-on-write страницы пропорционально, поэтому показывает
+реальную экономию памяти лучше, чем RSS.
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+IMPORT_SNIPPET = (
+    "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings'); "
+    "import django; django.setup(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+
+
+def measure_imports(runs, top):
+    totals = []
+    modules = {}
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', IMPORT_SNIPPET],
+            cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        )
+        total = 0
+        for line in proc.stderr.splitlines():
+            # import time: <self us> | <cumulative us> | <отступ по вложенности><модуль>
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative_us, name = line[len('import time:'):].split('|')
+            cumulative_us = int(cumulative_us)
+            if not name[1:].startswith(' '):
+                total += cumulative_us
+            name = name.strip()
+            modules[name] = max(modules.get(name, 0), cumulative_us)
+        totals.append(total / 1000)
+
+    print(f'Импорт (django.setup + URLconf), {runs} запусков: '
+          f'медиана {statistics.median(totals):.0f} мс, мин {min(totals):.0f} мс')
+    print(f'Самые тяжёлые модули (кумулятивно, мс), топ-{top}:')
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:top]:
+        print(f'  {cumulative / 1000:8.1f}  {name}')
+
+
+def _memory_kb(pid):
+    values = {}
+    for filename, keys in (('status', ('VmRSS',)), ('smaps_rollup', ('Pss',))):
+        try:
+            with open(f'/proc/{pid}/{filename}') as f:
+                for line in f:
+                    key = line.split(':')[0]
+                    if key in keys:
+                        values[key] = int(line.split()[1])
+        except OSError:
+            pass
+    return values
+
+
+def measure_gunicorn(workers, port, preload):
+    env = dict(os.environ, GUNICORN_PRELOAD='1' if preload else '0')
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+         '--workers', str(workers), '--bind', f'127.0.0.1:{port}'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        started = time.perf_counter()
+        children = []
+        while time.perf_counter() - started < 60:
+            children = subprocess.run(
+                ['pgrep', '-P', str(proc.pid)], capture_output=True, text=True,
+            ).stdout.split()
+            if len(children) >= workers:
+                break
+            time.sleep(0.2)
+        # Воркеры без preload загружают URLconf на первом запросе — прогреваем все
+        time.sleep(2)
+        for _ in range(workers * 4):
+            subprocess.run(['curl', '-s', '-o', '/dev/null', f'http://127.0.0.1:{port}/api/'], check=False)
+        time.sleep(1)
+        ready = time.perf_counter() - started
+
+        stats = [_memory_kb(pid) for pid in children]
+        rss = [item.get('VmRSS', 0) for item in stats]
+        pss = [item.get('Pss', 0) for item in stats]
+        mode = 'preload + gc.freeze' if preload else 'без preload'
+        print(f'gunicorn {workers} воркеров, {mode}: готов за {ready:.1f} с, '
+              f'RSS на воркер {statistics.mean(rss) / 1024:.1f} МБ, '
+              f'PSS на воркер {statistics.mean(pss) / 1024:.1f} МБ, '
+              f'суммарный PSS {sum(pss) / 1024:.1f} МБ')
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--gunicorn', type=int, default=0, metavar='WORKERS')
+    parser.add_argument('--port', type=int, default=8799)
+    args = parser.parse_args()
+
+    measure_imports(args.runs, args.top)
+    if args.gunicorn:
+        measure_gunicorn(args.gunicorn, args.port, preload=False)
+        measure_gunicorn(args.gunicorn, args.port, preload=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Общие настройки админки для больших таблиц.
+
+- ``LargeTableAdminMixin`` — список без точных COUNT(*): число строк берётся
+  из оценки планировщика (config/pagination.py), общий счётчик таблицы
+  («из N») не запрашивается.
+- ``background_action`` — массовое действие, которое не выполняется в запросе:
+  id выбранных объектов (в том числе «выбрать все» по фильтру) пачками по
+  ADMIN_BULK_CHUNK_SIZE ставятся задачей Celery через outbox.
+"""
+from django.conf import settings
+from django.contrib import admin, messages
+from django.db import transaction
+
+from config import outbox
+from config.pagination import EstimatedCountPaginator
+
+
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_actions(self, request):
+        # delete_selected строит страницу подтверждения со всеми объектами и
+        # удаляет их в запросе — на больших таблицах используются фоновые действия
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
+
+
+def enqueue_chunks(queryset, task, *args) -> int:
+    """Ставит task(ids, *args) для id queryset пачками; возвращает число объектов."""
+    size = settings.ADMIN_BULK_CHUNK_SIZE
+    queued = 0
+    chunk = []
+    with transaction.atomic():
+        for pk in queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=size):
+            chunk.append(pk)
+            if len(chunk) == size:
+                outbox.enqueue(task, chunk, *args)
+                queued += len(chunk)
+                chunk = []
+        if chunk:
+            outbox.enqueue(task, chunk, *args)
+            queued += len(chunk)
+    return queued
+
+
+def background_action(task, description, *args, name=None):
+    """Действие админки, выполняемое задачей ``task(ids, *args)`` в фоне."""
+
+    def action(modeladmin, request, queryset):
+        queued = enqueue_chunks(queryset, task, *args)
+        modeladmin.message_user(request, f'{description}: поставлено в очередь объектов — {queued}.', messages.SUCCESS)
+
+    action.__name__ = name or f'{task.name.rsplit(".", 1)[-1]}_background'
+    return admin.action(description=f'{description} (в фоне)')(action)
@@ -0,0 +1,106 @@
+"""
+Общие части асинхронных (ASGI) эндпоинтов чтения.
+
+DRF 3.14 не поддерживает async-представления, поэтому горячие эндпоинты
+чтения реализованы на django.views.View с async-обработчиками и async ORM
+(aget, async for). Формат ответов совпадает с синхронными DRF-версиями:
+та же JWT-аутентификация, те же сериализаторы и формат пагинации.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from config.pagination import estimated_count
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+        headers=headers,
+    )
+
+
+async def is_moderator(user) -> bool:
+    """Асинхронная проверка членства в группе moderators (кэшируется на объекте)."""
+    if not hasattr(user, '_is_moderator'):
+        user._is_moderator = await user.groups.filter(name='moderators').aexists()
+    return user._is_moderator
+
+
+class AsyncAPIView(View):
+    """
+    База для async-эндпоинтов: аутентификация JWT перед обработчиком.
+    Пользователь доступен как ``request.user``; без валидного токена — 401,
+    как у IsAuthenticated в синхронных представлениях.
+    """
+    http_method_names = ['get', 'head', 'options']
+    authentication = JWTAuthentication()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            result = await sync_to_async(self.authentication.authenticate)(request)
+        except exceptions.AuthenticationFailed as exc:
+            return self.unauthorized(exc.detail)
+        if result is None:
+            return self.unauthorized(exceptions.NotAuthenticated.default_detail)
+        request.user, request.auth = result
+        return await super().dispatch(request, *args, **kwargs)
+
+    def unauthorized(self, detail):
+        return json_response(
+            {'detail': detail},
+            status=401,
+            headers={'WWW-Authenticate': self.authentication.authenticate_header(None)},
+        )
+
+
+async def paginate(request, queryset, pagination_class):
+    """
+    Асинхронный аналог PageNumberPagination: возвращает (страница, тело ответа
+    без results) или (None, None) для несуществующей страницы.
+    """
+    paginator = pagination_class()
+    page_size = paginator.page_size
+    raw_size = request.GET.get(paginator.page_size_query_param)
+    if raw_size and raw_size.isdigit() and int(raw_size) > 0:
+        page_size = min(int(raw_size), paginator.max_page_size)
+
+    count, count_is_estimate = await sync_to_async(estimated_count)(queryset)
+    raw_page = request.GET.get(paginator.page_query_param, '1')
+    page_number = int(raw_page) if raw_page.isdigit() else 0
+    offset = (page_number - 1) * page_size
+    if count_is_estimate:
+        # Как EstimatedCountPaginator: лишняя строка вместо проверки по оценке
+        if page_number < 1:
+            return None, None
+        items = [obj async for obj in queryset[offset:offset + page_size + 1]]
+        if not items and page_number > 1:
+            return None, None
+        has_next = len(items) > page_size
+        items = items[:page_size]
+        if not has_next:
+            count, count_is_estimate = offset + len(items), False
+    else:
+        last_page = max((count + page_size - 1) // page_size, 1)
+        if not 1 <= page_number <= last_page:
+            return None, None
+        items = [obj async for obj in queryset[offset:offset + page_size]]
+        has_next = page_number < last_page
+
+    url = request.build_absolute_uri()
+    next_url = None
+    if has_next:
+        next_url = replace_query_param(url, paginator.page_query_param, page_number + 1)
+    if page_number <= 1:
+        previous_url = None
+    elif page_number == 2:
+        previous_url = remove_query_param(url, paginator.page_query_param)
+    else:
+        previous_url = replace_query_param(url, paginator.page_query_param, page_number - 1)
+    return items, {'count': count, 'count_is_estimate': count_is_estimate, 'next': next_url, 'previous': previous_url}
@@ -11,6 +11,9 @@ app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
+# Метрики задач (сигналы Celery) — см. config/task_metrics.py
+from . import task_metrics  # noqa: E402,F401
+
 
 @app.task(bind=True)
 def debug_task(self):
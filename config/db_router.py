@@ -0,0 +1,185 @@
+"""
+Маршрутизация чтения на реплики БД.
+
+Реплики перечислены в DATABASE_REPLICAS (см. settings: SQLITE_REPLICA_PATHS
+или POSTGRES_REPLICA_HOSTS). Запись всегда идёт в default. Чтение уходит на
+реплику только в явно разрешённом контексте:
+
+- ReplicaRoutingMiddleware — безопасные методы HTTP (GET, HEAD, OPTIONS);
+- use_replica() — например, в Celery-задачах, которые только читают.
+
+Чтобы пользователь сразу видел свои изменения (read-your-writes), после
+успешного небезопасного запроса его чтения REPLICA_STICKY_SECONDS идут в
+primary. Метка хранится в общем для всех воркеров кэше REPLICA_STICKY_CACHE
+(Redis, ключ по id пользователя). Если кэш недоступен, чтения идут в primary.
+"""
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_state = ContextVar('db_replica_state', default=None)
+
+
+class _ReadState:
+    """Разрешение читать с реплики в текущем контексте (запрос или блок use_replica)."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.sticky = None
+
+    def primary_required(self):
+        """True, если пользователь запроса недавно писал и должен читать из primary."""
+        if self.sticky is None:
+            user_id = _resolved_user_id(self.request)
+            if user_id is None:
+                # Пользователь ещё не известен (DRF аутентифицирует внутри view) — решим позже
+                return False
+            try:
+                self.sticky = _sticky_cache().get(_sticky_key(user_id)) is not None
+            except Exception:
+                # Без метки нельзя гарантировать read-your-writes — читаем из primary
+                logger.warning('Кэш меток primary недоступен', exc_info=True)
+                self.sticky = True
+        return self.sticky
+
+
+def _sticky_cache():
+    return caches[settings.REPLICA_STICKY_CACHE]
+
+
+def _sticky_key(user_id):
+    return f'db:primary:{user_id}'
+
+
+def _resolved_user_id(request):
+    """
+    id пользователя запроса, если он уже определён. Ленивый request.user от
+    AuthenticationMiddleware не вычисляется (это лишний запрос к сессии);
+    DRF после аутентификации записывает в request.user настоящего пользователя.
+    """
+    if request is None:
+        return None
+    user = request.__dict__.get('user')
+    if user is None:
+        return None
+    if isinstance(user, SimpleLazyObject):
+        if user._wrapped is empty:
+            return None
+        user = user._wrapped
+    if not getattr(user, 'is_authenticated', False):
+        return None
+    return user.pk
+
+
+def mark_primary_sticky(user_id):
+    """Направляет чтения пользователя в primary на REPLICA_STICKY_SECONDS."""
+    try:
+        _sticky_cache().set(_sticky_key(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+    except Exception:
+        # Запись уже выполнена: ответ не должен превращаться в ошибку
+        logger.warning('Не удалось сохранить метку primary', exc_info=True)
+
+
+@contextmanager
+def use_replica():
+    """Разрешает чтение с реплики внутри блока (для задач, которые только читают)."""
+    token = _state.set(_ReadState())
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Принудительное чтение из primary внутри блока."""
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+    """Роутер: чтение — реплика в разрешённом контексте, иначе и запись — default."""
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        state = _state.get()
+        if not replicas or state is None:
+            return DEFAULT_DB_ALIAS
+        # Внутри транзакции читаем то, что пишем
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or state.primary_required():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему репликацией из primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Чтения безопасных запросов — на реплику; после успешного небезопасного
+    запроса пользователь «прилипает» к primary. Без реплик исключается из цепочки.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _state.set(_ReadState(request) if request.method in SAFE_METHODS else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        self._after_write(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = _state.set(_ReadState(request) if request.method in SAFE_METHODS else None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        self._after_write(request, response)
+        return response
+
+    @staticmethod
+    def _after_write(request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400:
+            return
+        user_id = _resolved_user_id(request)
+        if user_id is not None:
+            mark_primary_sticky(user_id)
@@ -0,0 +1,77 @@
+"""
+Идемпотентное создание объектов по заголовку ``Idempotency-Key``.
+
+Клиент, повторяющий POST после таймаута, передаёт тот же ключ. Первый
+запрос в одной транзакции записывает ключ (users.IdempotencyKey), создаёт
+объект и сохраняет ответ; повтор получает сохранённый ответ с заголовком
+``Idempotent-Replayed: true`` без повторной записи в БД и вызовов Stripe.
+
+Одновременные дубликаты не гонятся: вставка того же ключа ждёт на
+уникальном индексе, пока транзакция первого запроса не завершится
+(PostgreSQL), и затем читает готовый ответ. Если первый запрос упал,
+его ключ откатывается вместе с транзакцией и дубликат выполняется сам.
+Сохраняются только успешные ответы; ошибки валидации не побочны и
+повторяются обычным образом.
+
+Тот же ключ с другим телом запроса — ответ 422.
+"""
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request) -> str:
+    data = request.data.dict() if hasattr(request.data, 'dict') else request.data
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class IdempotentCreateMixin:
+    """Для create() представлений DRF; ``idempotency_scope`` разделяет ключи эндпоинтов."""
+    idempotency_scope = None
+
+    def create(self, request, *args, **kwargs):
+        from users.models import IdempotencyKey
+
+        key = request.headers.get(HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} длиннее {MAX_KEY_LENGTH} символов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        lookup = {'user': request.user, 'scope': self.idempotency_scope, 'key': key}
+        fingerprint = request_fingerprint(request)
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    record = IdempotencyKey.objects.create(fingerprint=fingerprint, **lookup)
+            except IntegrityError:
+                record = None
+            if record is not None:
+                response = super().create(request, *args, **kwargs)
+                if status.is_success(response.status_code):
+                    record.status_code = response.status_code
+                    record.response_body = json.loads(JSONRenderer().render(response.data))
+                    record.save(update_fields=['status_code', 'response_body'])
+                else:
+                    record.delete()
+                return response
+
+        record = IdempotencyKey.objects.filter(**lookup).first()
+        if record is not None and record.fingerprint != fingerprint:
+            return Response({'error': f'{HEADER} уже использован с другим запросом.'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        if record is None or record.status_code is None:
+            # Первый запрос ещё выполняется или только что завершился ошибкой
+            # (без ожидания на уникальном индексе, например SQLite)
+            return Response({'error': 'Запрос с этим ключом ещё выполняется.'},
+                            status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+        return Response(record.response_body, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
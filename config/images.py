@@ -0,0 +1,237 @@
+"""
+Варианты изображений: превью курсов и уроков, аватары пользователей.
+
+Для загруженного файла генерируются уменьшенные копии фиксированного
+размера в JPEG и WebP и крошечная заглушка (data URI для показа до загрузки
+картинки). Описание вариантов хранится в JSON-поле модели рядом с
+исходным полем (``preview`` -> ``preview_variants``).
+
+Обработка идемпотентна: имена вариантов содержат хэш исходного файла, и
+если вариант для текущего файла уже есть, повторный запуск ничего не делает.
+Декодирование и масштабирование (CPU) выполняются в пуле процессов
+(IMAGE_PROCESS_POOL_SIZE; 0 — в текущем процессе).
+"""
+import base64
+import hashlib
+import io
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from rest_framework import serializers
+
+# Размеры вариантов (ширина, высота) по полю изображения модели
+VARIANT_SIZES = {
+    ('materials.course', 'preview'): {'thumb': (320, 180), 'card': (640, 360)},
+    ('materials.lesson', 'preview'): {'thumb': (320, 180), 'card': (640, 360)},
+    ('users.user', 'avatar'): {'small': (64, 64), 'medium': (256, 256)},
+}
+PLACEHOLDER_WIDTH = 16
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def sniff_image_type(head: bytes):
+    """MIME-тип изображения по сигнатуре первых байтов файла или None."""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    return None
+
+
+def variants_field_name(field_name: str) -> str:
+    return f'{field_name}_variants'
+
+
+def _to_rgb(image):
+    from PIL import Image
+
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+
+def render_variants(data: bytes, sizes: dict) -> dict:
+    """
+    Чистая функция для пула процессов: исходные байты -> варианты.
+    Возвращает {'width', 'height', 'placeholder', 'sizes': {имя: {формат: байты, ...}}}.
+    """
+    from PIL import Image, ImageOps
+
+    image = Image.open(io.BytesIO(data))
+    result = {'width': image.width, 'height': image.height, 'sizes': {}}
+    largest = max(sizes.values())
+    # JPEG декодируется сразу в уменьшенном масштабе (DCT scaling) — в разы быстрее
+    image.draft('RGB', (largest[0] * 2, largest[1] * 2))
+    image = _to_rgb(ImageOps.exif_transpose(image))
+    for name, (width, height) in sizes.items():
+        variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        result['sizes'][name] = {
+            'width': width,
+            'height': height,
+            'jpeg': _encode(variant, 'jpeg'),
+            'webp': _encode(variant, 'webp'),
+        }
+    width, height = min(sizes.values())
+    tiny = ImageOps.fit(image, (PLACEHOLDER_WIDTH, max(1, PLACEHOLDER_WIDTH * height // width)), Image.BILINEAR)
+    result['placeholder'] = 'data:image/webp;base64,' + base64.b64encode(_encode(tiny, 'webp')).decode()
+    return result
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_POOL_SIZE)
+    return _pool
+
+
+def _render(data, sizes):
+    if settings.IMAGE_PROCESS_POOL_SIZE <= 0:
+        return render_variants(data, sizes)
+    return _executor().submit(render_variants, data, sizes).result()
+
+
+def has_updated_at(model) -> bool:
+    """Есть ли у модели отметка изменения, по которой работает дельта-синхронизация."""
+    return any(field.name == 'updated_at' for field in model._meta.concrete_fields)
+
+
+def needs_variants(instance, field_name: str) -> bool:
+    """True, если варианты не соответствуют текущему файлу поля (или файл удалён)."""
+    source = getattr(instance, field_name).name or ''
+    variants = getattr(instance, variants_field_name(field_name)) or {}
+    return variants.get('source', '') != source
+
+
+def process_image_field(instance, field_name: str, force: bool = False) -> bool:
+    """
+    Генерирует варианты для ``instance.<field_name>`` и сохраняет их описание.
+    Возвращает True, если описание изменилось.
+    """
+    model = type(instance)
+    field_file = getattr(instance, field_name)
+    variants_name = variants_field_name(field_name)
+    old = getattr(instance, variants_name) or {}
+    storage = field_file.storage
+
+    if not field_file.name:
+        variants = {}
+    else:
+        with field_file.open('rb') as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        if not force and old.get('source') == field_file.name and old.get('hash') == digest:
+            return False
+
+        sizes = VARIANT_SIZES[model._meta.label_lower, field_name]
+        directory, filename = posixpath.split(field_file.name)
+        stem = posixpath.splitext(filename)[0]
+        variants = {'source': field_file.name, 'hash': digest, 'sizes': {}}
+        for name, (width, height) in sizes.items():
+            variants['sizes'][name] = {
+                'width': width,
+                'height': height,
+                'jpeg': posixpath.join(directory, 'variants', f'{stem}-{digest}-{name}.jpg'),
+                'webp': posixpath.join(directory, 'variants', f'{stem}-{digest}-{name}.webp'),
+            }
+        if not force and old.get('hash') == digest and all(storage.exists(path) for path in stored_paths(old)):
+            # То же содержимое под другим именем — готовые варианты переиспользуются
+            variants.update(sizes=old['sizes'], width=old.get('width'), height=old.get('height'),
+                            placeholder=old.get('placeholder'))
+            old = {}
+        else:
+            rendered = _render(data, sizes)
+            _release(storage, old)
+            old = {}
+            for name, size in variants['sizes'].items():
+                for fmt in ('jpeg', 'webp'):
+                    if storage.exists(size[fmt]):
+                        storage.delete(size[fmt])
+                    # Хранилище может выбрать своё имя (например, по хэшу содержимого)
+                    size[fmt] = storage.save(size[fmt], ContentFile(rendered['sizes'][name][fmt]))
+            variants.update(width=rendered['width'], height=rendered['height'], placeholder=rendered['placeholder'])
+
+    _release(storage, old)
+    # update() без сигналов: сохранение вариантов не перезапускает обработку.
+    # auto_now при update() не срабатывает — updated_at ставится явно, иначе
+    # дельта-синхронизация не увидит новые варианты
+    values = {variants_name: variants}
+    if has_updated_at(model):
+        values['updated_at'] = timezone.now()
+    model._default_manager.filter(pk=instance.pk).update(**values)
+    changed = getattr(instance, variants_name) != variants
+    setattr(instance, variants_name, variants)
+    return changed
+
+
+def stored_paths(variants):
+    return {
+        path
+        for size in (variants.get('sizes') or {}).values()
+        for key, path in size.items()
+        if key in ('jpeg', 'webp')
+    }
+
+
+def _release(storage, variants):
+    """Удаляет файлы вариантов (в хранилище с дедупликацией — снимает ссылки)."""
+    for path in stored_paths(variants):
+        if storage.exists(path):
+            storage.delete(path)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Варианты изображения в ответе API: заглушка и абсолютные URL уменьшенных
+    копий (как ImageField DRF при наличии request в контексте).
+    ``image_field`` — имя исходного поля (его storage строит URL).
+    """
+
+    def __init__(self, image_field, **kwargs):
+        self.image_field = image_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        if not value or not value.get('sizes'):
+            return None
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        request = self.context.get('request')
+
+        def url(path):
+            location = storage.url(path)
+            return request.build_absolute_uri(location) if request is not None else location
+
+        result = {'placeholder': value.get('placeholder')}
+        for name, size in value['sizes'].items():
+            result[name] = {
+                'width': size['width'],
+                'height': size['height'],
+                'jpeg': url(size['jpeg']),
+                'webp': url(size['webp']),
+            }
+        return result
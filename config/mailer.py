@@ -0,0 +1,112 @@
+"""
+Массовая отправка писем через пул SMTP-соединений.
+
+``send_mail`` открывает новое соединение (TCP, TLS, AUTH) на каждый вызов,
+а воркер Celery запущен с ``-P solo``. PooledMailer отправляет отдельное
+письмо каждому получателю из пула потоков (MAIL_SEND_WORKERS); у каждого
+потока своё соединение из ``get_connection()`` (бэкенд SMTP Django не
+потокобезопасен), которое переиспользуется для следующих писем и
+переоткрывается после MAIL_MESSAGES_PER_CONNECTION писем — многие серверы
+ограничивают число писем на сессию.
+
+Временные ошибки (ответ 4xx, обрыв соединения) повторяются с
+экспоненциальной задержкой до MAIL_MAX_RETRIES раз на новом соединении;
+постоянные (5xx) считаются неудачей письма без повторов.
+"""
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+
+def is_transient(exc) -> bool:
+    """
+    Временная ли ошибка SMTP (стоит повторить позже). SMTPException — подкласс
+    OSError, поэтому ошибки SMTP разбираются до проверки сетевых: по коду
+    ответа (4xx — повтор, 5xx — постоянная), обрыв сессии — повтор, прочие
+    ошибки протокола (например, сервер не поддерживает AUTH) — постоянные.
+    """
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        codes = [code for code, _ in exc.recipients.values()]
+        return bool(codes) and all(400 <= code < 500 for code in codes)
+    if isinstance(exc, smtplib.SMTPResponseException):
+        if 400 <= exc.smtp_code < 500:
+            return True
+        if 500 <= exc.smtp_code < 600:
+            return False
+        # Код не получен (-1): сервер оборвал приветствие — как обрыв соединения
+        return isinstance(exc, smtplib.SMTPConnectError)
+    if isinstance(exc, smtplib.SMTPException):
+        return isinstance(exc, smtplib.SMTPServerDisconnected)
+    return isinstance(exc, OSError)
+
+
+class PooledMailer:
+    """Отправка списка EmailMessage из пула потоков со своими соединениями."""
+
+    def __init__(self, workers=None, per_connection=None, max_retries=None, backoff=None, **connection_kwargs):
+        self.workers = workers or settings.MAIL_SEND_WORKERS
+        self.per_connection = per_connection or settings.MAIL_MESSAGES_PER_CONNECTION
+        self.max_retries = settings.MAIL_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.MAIL_RETRY_BACKOFF if backoff is None else backoff
+        self.connection_kwargs = connection_kwargs
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'connection', None) is None or local.sent >= self.per_connection:
+            self._close_local()
+            local.connection = get_connection(fail_silently=False, **self.connection_kwargs)
+            local.connection.open()
+            local.sent = 0
+            with self._lock:
+                self._connections.append(local.connection)
+        return local.connection
+
+    def _close_local(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _send_one(self, message) -> bool:
+        for attempt in range(self.max_retries + 1):
+            try:
+                connection = self._connection()
+                sent = connection.send_messages([message])
+                self._local.sent += 1
+                return bool(sent)
+            except Exception as exc:
+                # После ошибки состояние сессии неизвестно — следующая попытка на новом соединении
+                self._close_local()
+                if not is_transient(exc) or attempt == self.max_retries:
+                    return False
+                time.sleep(self.backoff * 2 ** attempt)
+        return False
+
+    def send(self, messages) -> tuple:
+        """Отправляет письма. Возвращает (отправлено, не отправлено)."""
+        messages = list(messages)
+        if not messages:
+            return 0, 0
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(messages))) as pool:
+                results = list(pool.map(self._send_one, messages))
+        finally:
+            with self._lock:
+                connections, self._connections = self._connections, []
+            for connection in connections:
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+        sent = sum(results)
+        return sent, len(results) - sent
@@ -0,0 +1,209 @@
+"""
+Метрики приложения в формате Prometheus (эндпоинт /metrics).
+
+Под gunicorn каждый воркер — отдельный процесс, поэтому при заданной
+переменной окружения PROMETHEUS_MULTIPROC_DIR prometheus_client пишет
+значения в mmap-файлы этого каталога, а /metrics агрегирует их по всем
+процессам (см. gunicorn.conf.py: очистка каталога и mark_process_dead).
+Без переменной метрики живут в памяти текущего процесса (runserver, тесты).
+
+Метка route — имя URL из materials/urls.py и users/urls.py
+(course-list, lesson-retrieve, payment-status, ...).
+"""
+import glob
+import os
+import threading
+from contextlib import ExitStack
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Время обработки HTTP-запроса',
+    ['route', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+REQUESTS = Counter(
+    'http_requests_total',
+    'HTTP-запросы по маршруту и коду ответа',
+    ['route', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries',
+    'Число SQL-запросов на один HTTP-запрос',
+    ['route'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100),
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total',
+    'Обращения к кэшам приложения (hit ratio = hit / (hit + miss))',
+    ['cache', 'result'],
+)
+
+
+_in_progress = None
+_in_progress_lock = threading.Lock()
+
+
+def requests_in_progress() -> Gauge:
+    """
+    Gauge запросов в обработке. Создаётся при первом запросе, а не при импорте:
+    метрика без меток в multiprocess-режиме сразу открывает mmap-файл в
+    PROMETHEUS_MULTIPROC_DIR, а импорт URLconf (manage.py migrate, check)
+    не должен зависеть от этого каталога.
+    """
+    global _in_progress
+    if _in_progress is None:
+        with _in_progress_lock:
+            if _in_progress is None:
+                _in_progress = Gauge(
+                    'http_requests_in_progress',
+                    'HTTP-запросы в обработке',
+                    multiprocess_mode='livesum',
+                )
+    return _in_progress
+
+
+def record_cache(cache_name: str, hit: bool) -> None:
+    """
+    Учитывает попадание/промах кэша ``cache_name``: subscriptions
+    (materials/subscriptions.py), pagination_estimate (config/pagination.py).
+    """
+    CACHE_REQUESTS.labels(cache=cache_name, result='hit' if hit else 'miss').inc()
+
+
+def route_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    if 'admin' in match.namespaces:
+        return 'admin'
+    return match.url_name or '<unnamed>'
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Собирает латентность, коды ответов, число SQL-запросов и in-flight запросы.
+    Поддерживает ASGI: в async-цепочке запросы ORM выполняются в отдельном
+    потоке, поэтому гистограмма числа SQL-запросов там не заполняется.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = _QueryCounter()
+        in_progress = requests_in_progress()
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+        finally:
+            in_progress.dec()
+        elapsed = perf_counter() - start
+
+        route = route_label(request)
+        REQUEST_LATENCY.labels(route=route, method=request.method).observe(elapsed)
+        REQUESTS.labels(route=route, method=request.method, status=str(response.status_code)).inc()
+        REQUEST_DB_QUERIES.labels(route=route).observe(queries.count)
+        return response
+
+    async def __acall__(self, request):
+        in_progress = requests_in_progress()
+        in_progress.inc()
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            in_progress.dec()
+        elapsed = perf_counter() - start
+
+        route = route_label(request)
+        REQUEST_LATENCY.labels(route=route, method=request.method).observe(elapsed)
+        REQUESTS.labels(route=route, method=request.method, status=str(response.status_code)).inc()
+        return response
+
+
+def get_registry():
+    """
+    Реестр для выдачи: агрегированный по процессам или in-process.
+    METRICS_EXTRA_DIRS — каталоги других групп процессов (например, воркеров
+    Celery в соседнем контейнере), которые выводятся вместе с метриками web.
+    Каждый контейнер группы пишет в свой подкаталог (очищает при старте
+    только его), поэтому читаются и файлы каталога, и его подкаталоги.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        dirs = [os.environ['PROMETHEUS_MULTIPROC_DIR']]
+        for path in settings.METRICS_EXTRA_DIRS:
+            dirs += _metric_dirs(path)
+        registry.register(_DirsCollector(dirs))
+        return registry
+    return REGISTRY
+
+
+def _metric_dirs(path):
+    if not os.path.isdir(path):
+        return []
+    with os.scandir(path) as entries:
+        return [path] + sorted(entry.path for entry in entries if entry.is_dir())
+
+
+class _DirsCollector:
+    """Сливает файлы метрик нескольких каталогов в одни семейства (без дублей серий)."""
+
+    def __init__(self, dirs):
+        self.dirs = dirs
+
+    def collect(self):
+        files = []
+        for path in self.dirs:
+            files += glob.glob(os.path.join(path, '*.db'))
+        return multiprocess.MultiProcessCollector.merge(files, accumulate=True)
+
+
+def metrics_view(request):
+    """Внутренний эндпоинт /metrics; доступен только с адресов METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    try:
+        output = generate_latest(get_registry())
+    except FileNotFoundError:
+        # Соседний контейнер перезапустился и очистил свой подкаталог во время чтения
+        output = generate_latest(get_registry())
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
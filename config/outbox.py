@@ -0,0 +1,85 @@
+"""
+Транзакционный outbox для задач Celery.
+
+Вместо ``task.delay()`` внутри запроса представление пишет строку
+materials.OutboxMessage в той же транзакции, что и изменение данных
+(``enqueue``). Запись не ждёт брокер, задача не уйдёт до фиксации
+транзакции и не потеряется при кратковременной недоступности Redis.
+
+Задача dispatch_outbox (Celery beat, каждые OUTBOX_DISPATCH_SECONDS)
+забирает готовые строки пачками через ``SELECT ... FOR UPDATE SKIP LOCKED``
+— параллельные диспетчеры не отправляют одно сообщение дважды — и
+публикует их в брокер. Отправленные строки удаляются; при ошибке брокера
+следующая попытка откладывается с экспоненциальной задержкой.
+Доставка «хотя бы один раз»: задачи должны быть идемпотентны.
+
+Без celery-beat (CELERY_TASK_ALWAYS_EAGER, разработка) диспетчер никто не
+запускает, поэтому при OUTBOX_DISPATCH_ON_COMMIT (по умолчанию включён в
+режиме eager) отправка выполняется сразу после фиксации транзакции.
+"""
+from datetime import timedelta
+
+from celery import current_app
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+MAX_BACKOFF_SECONDS = 300
+
+
+def enqueue(task, *args, **kwargs):
+    """Ставит задачу в outbox (вызывать внутри транзакции изменения)."""
+    from materials.models import OutboxMessage
+
+    message = OutboxMessage.objects.create(task=task.name, args=list(args), kwargs=kwargs)
+    if settings.OUTBOX_DISPATCH_ON_COMMIT:
+        transaction.on_commit(_dispatch_on_commit)
+    return message
+
+
+def _dispatch_on_commit():
+    # Несколько сообщений одной транзакции: первый вызов отправит все, остальные ничего не найдут
+    dispatch(settings.OUTBOX_BATCH_SIZE)
+
+
+def _publish(message):
+    task = current_app.tasks.get(message.task)
+    if task is None:
+        raise LookupError(f'Неизвестная задача {message.task}')
+    # apply_async учитывает task_always_eager (в отличие от send_task)
+    task.apply_async(args=message.args, kwargs=message.kwargs)
+
+
+def dispatch(batch_size: int, max_batches: int = 10) -> tuple:
+    """Отправляет готовые сообщения. Возвращает (отправлено, ошибок)."""
+    from materials.models import OutboxMessage
+
+    published = failed = 0
+    for _ in range(max_batches):
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True)
+                .filter(available_at__lte=now).order_by('available_at', 'id')[:batch_size]
+            )
+            if not batch:
+                break
+            sent, retry = [], []
+            for message in batch:
+                try:
+                    _publish(message)
+                except Exception as exc:
+                    message.attempts += 1
+                    message.last_error = f'{type(exc).__name__}: {exc}'
+                    delay = min(2 ** message.attempts, MAX_BACKOFF_SECONDS)
+                    message.available_at = now + timedelta(seconds=delay)
+                    retry.append(message)
+                else:
+                    sent.append(message.pk)
+            OutboxMessage.objects.filter(pk__in=sent).delete()
+            OutboxMessage.objects.bulk_update(retry, ['attempts', 'last_error', 'available_at'])
+        published += len(sent)
+        failed += len(retry)
+        if len(batch) < batch_size:
+            break
+    return published, failed
@@ -0,0 +1,162 @@
+"""
+Пагинация с оценкой общего числа строк вместо точного ``COUNT(*)``.
+
+Точный COUNT на PostgreSQL — полный проход по таблице или индексу даже ради
+первой страницы. Вместо него берётся оценка планировщика:
+
+- запрос без условий — ``pg_class.reltuples`` таблицы (на SQLite —
+  ``sqlite_stat1`` после ANALYZE);
+- запрос с фильтрами — оценка строк из ``EXPLAIN (FORMAT JSON)``.
+
+Оценка кэшируется на PAGINATION_COUNT_CACHE_TTL секунд. Если она меньше
+PAGINATION_EXACT_COUNT_THRESHOLD (или её нет: таблица ещё не
+анализировалась, другая СУБД), считается точный COUNT — на небольших
+выборках он дешёв. В ответе ``count_is_estimate`` отмечает приблизительное
+значение ``count``.
+
+При оценке номер страницы не ограничивается сверху, а наличие следующей
+страницы определяется выборкой одной лишней строки, поэтому ссылки
+``next``/``previous`` точны независимо от погрешности оценки. Если страница
+оказалась последней, ``count`` уточняется по её содержимому.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+from config.metrics import record_cache
+
+
+def _table_estimate(connection, table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # -1: таблица ещё не анализировалась (PostgreSQL 14+)
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+            row = cursor.fetchone()
+            # Первое число stat — количество строк таблицы
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+def _plan_estimate(queryset):
+    plan = json.loads(queryset.explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def planner_estimate(queryset):
+    """Оценка числа строк выборки (кэшируется) или None, если оценки нет."""
+    connection = connections[queryset.db]
+    query = queryset.query
+    unfiltered = not query.where and not query.distinct and not query.combinator
+    if not unfiltered and connection.vendor != 'postgresql':
+        return None
+    sql, params = query.sql_with_params()
+    digest = hashlib.sha1(f'{queryset.db}:{sql}:{params!r}'.encode()).hexdigest()
+    key = f'pagination:estimate:{digest}'
+    estimate = cache.get(key)
+    record_cache('pagination_estimate', estimate is not None)
+    if estimate is None:
+        try:
+            if unfiltered:
+                estimate = _table_estimate(connection, queryset.model._meta.db_table)
+            else:
+                estimate = _plan_estimate(queryset)
+        except DatabaseError:
+            estimate = None
+        if estimate is None:
+            return None
+        cache.set(key, estimate, settings.PAGINATION_COUNT_CACHE_TTL)
+    return estimate
+
+
+def estimated_count(queryset):
+    """(число строк, это оценка) — точный COUNT только ниже порога."""
+    estimate = planner_estimate(queryset)
+    if estimate is None or estimate < settings.PAGINATION_EXACT_COUNT_THRESHOLD:
+        return queryset.count(), False
+    return estimate, True
+
+
+class EstimatedPage(Page):
+    """Страница, у которой наличие следующей известно по лишней строке выборки."""
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator Django с ``count`` из estimated_count()."""
+
+    @cached_property
+    def _counted(self):
+        return estimated_count(self.object_list)
+
+    @cached_property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def count_is_estimate(self):
+        return self._counted[1]
+
+    def validate_number(self, number):
+        if not self.count_is_estimate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.count_is_estimate:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            raise EmptyPage('That page contains no results')
+        has_next = len(items) > self.per_page
+        if not has_next:
+            # Последняя страница: общее число известно точно
+            self.__dict__['count'] = bottom + len(items)
+            self.__dict__['_counted'] = (self.count, False)
+        return EstimatedPage(items[:self.per_page], number, self, has_next)
+
+
+class EstimatedCountPagination(PageNumberPagination):
+    """PageNumberPagination с оценкой ``count`` и флагом ``count_is_estimate``."""
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_estimate': self.page.paginator.count_is_estimate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count_is_estimate'] = {'type': 'boolean', 'example': False}
+        return response
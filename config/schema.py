@@ -0,0 +1,104 @@
+"""
+Предсобранная OpenAPI-схема.
+
+drf_yasg при каждом запросе схемы обходит все представления и сериализаторы.
+Здесь схема генерируется один раз на версию кода (команда generate_schema
+при сборке образа или лениво при первом запросе) и отдаётся как статичный
+файл с ETag; UI Swagger/ReDoc загружают её по SPEC_URL (см. SWAGGER_SETTINGS).
+"""
+import hashlib
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+from drf_yasg import openapi
+
+api_info = openapi.Info(
+    title="Educational Platform API",
+    default_version='v1',
+    description="API для платформы курсов и уроков: пользователи, курсы, уроки, подписки, платежи (в т.ч. Stripe).",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@example.local"),
+    license=openapi.License(name="BSD License"),
+)
+
+FORMATS = {
+    'json': 'application/json',
+    'yaml': 'application/yaml',
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def code_version() -> str:
+    """
+    Версия кода для ключа схемы: APP_VERSION из окружения (например, SHA коммита)
+    или хэш исходников приложений.
+    """
+    version = os.environ.get('APP_VERSION')
+    if version:
+        return version
+    digest = hashlib.sha1()
+    for package in ('config', 'materials', 'users'):
+        for path in sorted((Path(settings.BASE_DIR) / package).rglob('*.py')):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+def schema_path(fmt: str, version: str = None) -> Path:
+    return Path(settings.SCHEMA_ROOT) / f'openapi-{version or code_version()}.{fmt}'
+
+
+def generate_schema(version: str = None) -> dict:
+    """Генерирует схему и записывает JSON и YAML; возвращает {формат: путь}."""
+    # Генератор и кодеки (yaml) нужны только при сборке схемы — импортируем лениво
+    from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    schema = OpenAPISchemaGenerator(api_info).get_schema(request=None, public=True)
+    root = Path(settings.SCHEMA_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    codecs = {'json': OpenAPICodecJson, 'yaml': OpenAPICodecYaml}
+    paths = {}
+    for fmt, codec_class in codecs.items():
+        path = schema_path(fmt, version)
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        tmp_path.write_bytes(codec_class(validators=[]).encode(schema))
+        os.replace(tmp_path, path)
+        paths[fmt] = path
+    return paths
+
+
+def load_schema(fmt: str) -> bytes:
+    """Содержимое схемы текущей версии; при отсутствии файла — генерация (один раз на процесс)."""
+    if fmt not in _loaded:
+        with _lock:
+            if fmt not in _loaded:
+                path = schema_path(fmt)
+                if not path.exists():
+                    generate_schema()
+                _loaded[fmt] = path.read_bytes()
+    return _loaded[fmt]
+
+
+def _etag(request, format):
+    return f'{code_version()}-{format.lstrip(".")}'
+
+
+@condition(etag_func=_etag)
+def schema_file_view(request, format):
+    """Отдаёт предсобранную схему (``/swagger.json``, ``/swagger.yaml``) с ETag."""
+    fmt = format.lstrip('.')
+    if fmt not in FORMATS:
+        raise Http404
+    response = HttpResponse(load_schema(fmt), content_type=FORMATS[fmt])
+    patch_cache_control(response, public=True, max_age=settings.SCHEMA_CACHE_MAX_AGE)
+    return response
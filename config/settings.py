@@ -21,8 +21,13 @@ _default_redis = os.environ.get(
     'REDIS_URL',
     os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
 )
+REDIS_URL = _default_redis
 CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', _default_redis)
-CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+# memory:// (CI) — брокер без бэкенда результатов, для него берём кэш в памяти
+CELERY_RESULT_BACKEND = os.environ.get(
+    'CELERY_RESULT_BACKEND',
+    'cache+memory://' if CELERY_BROKER_URL.startswith('memory://') else CELERY_BROKER_URL,
+)
 # Режим «eager»: задачи выполняются сразу в процессе (не нужны Redis и celery worker)
 CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '0') == '1'
 
@@ -70,12 +75,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Профилирование (Server-Timing); при SERVER_TIMING_ENABLED=0 исключается из цепочки
+    'config.profiling.ServerTimingMiddleware',
+    'config.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Чтения безопасных запросов — на реплики; без DATABASE_REPLICAS исключается из цепочки
+    'config.db_router.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -125,6 +135,40 @@ else:
         }
     }
 
+# Реплики только для чтения (config/db_router.py): хосты PostgreSQL или, для
+# локального запуска, файлы SQLite — через запятую. В тестах реплики
+# зеркалируют default (TEST.MIRROR), отдельные тестовые БД не создаются.
+_replica_hosts = [host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',') if host]
+_sqlite_replicas = [path for path in os.environ.get('SQLITE_REPLICA_PATHS', '').split(',') if path]
+if _pg_host:
+    _replicas = [dict(DATABASES['default'], HOST=host) for host in _replica_hosts]
+else:
+    _replicas = [dict(DATABASES['default'], NAME=path) for path in _sqlite_replicas]
+DATABASE_REPLICAS = []
+for _number, _replica in enumerate(_replicas, start=1):
+    DATABASES[f'replica{_number}'] = dict(_replica, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{_number}')
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter'] if DATABASE_REPLICAS else []
+# После записи чтения пользователя идут в primary столько секунд (задержка репликации)
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+# Метка «писал недавно» должна быть видна всем воркерам — только общий кэш
+REPLICA_STICKY_CACHE = 'shared'
+
+# Кэш: default — по умолчанию в памяти процесса, CACHE_REDIS=1 — общий Redis.
+# shared — всегда Redis: данные, которые должны совпадать во всех воркерах
+# (например, «липкость» к primary после записи)
+_redis_cache = {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': REDIS_URL,
+}
+CACHES = {
+    'default': (
+        _redis_cache if os.environ.get('CACHE_REDIS', '0') == '1'
+        else {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    ),
+    'shared': _redis_cache,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -184,15 +228,85 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Ограничение частоты запросов (config/throttling.py): memory (в процессе) или redis
+THROTTLE_BACKEND = os.environ.get('THROTTLE_BACKEND', 'memory')
+# rate — скорость пополнения, burst — ёмкость ведра, keys — по кому считать (user, ip, login)
+THROTTLES = {
+    'subscription': {
+        'rate': os.environ.get('THROTTLE_SUBSCRIPTION_RATE', '30/min'), 'burst': 10, 'keys': ['user', 'ip'],
+    },
+    'payment_create': {
+        'rate': os.environ.get('THROTTLE_PAYMENT_RATE', '10/min'), 'burst': 5, 'keys': ['user', 'ip'],
+    },
+    'token_obtain': {
+        'rate': os.environ.get('THROTTLE_TOKEN_RATE', '10/min'), 'burst': 5, 'keys': ['ip', 'login'],
+    },
+}
+
+# Срок хранения ключей Idempotency-Key и ответов для повтора (config/idempotency.py)
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', '24')))
+
 # JWT settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# OpenAPI: схема генерируется один раз на версию кода (manage.py generate_schema)
+SCHEMA_ROOT = Path(os.environ.get('SCHEMA_ROOT', BASE_DIR / 'schema'))
+SCHEMA_CACHE_MAX_AGE = 60 * 60
+SWAGGER_SETTINGS = {
+    'SPEC_URL': ('schema-json', {'format': '.json'}),
+}
+
+# Автодополнение названий: memory (индекс в процессе) или redis (общий для воркеров)
+AUTOCOMPLETE_BACKEND = os.environ.get('AUTOCOMPLETE_BACKEND', 'memory')
+# Перестройка индекса (в памяти — фоновым потоком каждого процесса, чтобы подхватить
+# записи из других процессов; в Redis — задачей по расписанию), 0 — никогда
+AUTOCOMPLETE_REBUILD_SECONDS = int(os.environ.get('AUTOCOMPLETE_REBUILD_SECONDS', '300'))
+
+# Кэш id курсов с подпиской пользователя для is_subscribed (materials/subscriptions.py).
+# Подписка сбрасывает ключ; в кэше процесса (не Redis) другие воркеры этого не
+# видят, поэтому там множество живёт SUBSCRIPTIONS_LOCAL_CACHE_TTL секунд
+SUBSCRIPTIONS_CACHE = 'default'
+SUBSCRIPTIONS_CACHE_TTL = int(os.environ.get('SUBSCRIPTIONS_CACHE_TTL', str(60 * 60)))
+SUBSCRIPTIONS_LOCAL_CACHE_TTL = int(os.environ.get('SUBSCRIPTIONS_LOCAL_CACHE_TTL', '5'))
+
+# Дельта-синхронизация (materials/sync.py): срок хранения записей об удалениях
+# (более старый токен требует полной синхронизации) и перекрытие окна изменений
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', '30'))
+SYNC_OVERLAP_SECONDS = int(os.environ.get('SYNC_OVERLAP_SECONDS', '5'))
+
+# Пагинация (config/pagination.py): точный COUNT только если оценка планировщика
+# меньше порога; оценки кэшируются на указанное число секунд
+PAGINATION_EXACT_COUNT_THRESHOLD = int(os.environ.get('PAGINATION_EXACT_COUNT_THRESHOLD', '10000'))
+PAGINATION_COUNT_CACHE_TTL = int(os.environ.get('PAGINATION_COUNT_CACHE_TTL', '60'))
+
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Дедупликация медиа по содержимому (config/storage.py); файлы без ссылок удаляет manage.py media_gc
+MEDIA_DEDUP = os.environ.get('MEDIA_DEDUP', '0') == '1'
+STORAGES = {
+    'default': {
+        'BACKEND': (
+            'config.storage.ContentAddressedStorage' if MEDIA_DEDUP
+            else 'django.core.files.storage.FileSystemStorage'
+        ),
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+# Загрузка изображений частями (users/views.py, UploadSession*): файлы собираются
+# во временном каталоге, лимиты проверяются до чтения тела запроса
+UPLOAD_TMP_DIR = Path(os.environ.get('UPLOAD_TMP_DIR', BASE_DIR / 'tmp_uploads'))
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 10 * 1024 * 1024))
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get('UPLOAD_CHUNK_MAX_SIZE', 2 * 1024 * 1024))
+UPLOAD_ALLOWED_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'image/gif']
+UPLOAD_SESSION_TTL = timedelta(hours=24)
+# Процессы для декодирования/масштабирования изображений в Celery-задачах (0 — в процессе задачи)
+IMAGE_PROCESS_POOL_SIZE = int(os.environ.get('IMAGE_PROCESS_POOL_SIZE', '2'))
 
 # CORS
 CORS_ALLOWED_ORIGINS = [
@@ -208,14 +322,114 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 минут
 
+# Транзакционный outbox задач (config/outbox.py): период и размер пачки отправки.
+# Без celery-beat (режим eager, разработка) сообщения отправляются сразу после
+# фиксации транзакции
+OUTBOX_DISPATCH_SECONDS = int(os.environ.get('OUTBOX_DISPATCH_SECONDS', '5'))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+OUTBOX_DISPATCH_ON_COMMIT = os.environ.get(
+    'OUTBOX_DISPATCH_ON_COMMIT', '1' if CELERY_TASK_ALWAYS_EAGER else '0',
+) == '1'
+
 # Расписание периодических задач (в настройках celery-beat)
 CELERY_BEAT_SCHEDULE = {
     'deactivate-inactive-users': {
         'task': 'users.tasks.deactivate_inactive_users',
         'schedule': timedelta(days=1),
     },
+    'cleanup-upload-sessions': {
+        'task': 'users.tasks.cleanup_upload_sessions',
+        'schedule': timedelta(hours=1),
+    },
+    'repair-course-counters': {
+        'task': 'materials.tasks.repair_course_counters',
+        'schedule': timedelta(hours=1),
+    },
+    'refresh-course-leaderboards': {
+        'task': 'materials.tasks.refresh_course_leaderboards',
+        'schedule': timedelta(minutes=15),
+    },
+    'cleanup-idempotency-keys': {
+        'task': 'users.tasks.cleanup_idempotency_keys',
+        'schedule': timedelta(hours=1),
+    },
+    'dispatch-outbox': {
+        'task': 'materials.tasks.dispatch_outbox',
+        'schedule': timedelta(seconds=OUTBOX_DISPATCH_SECONDS),
+    },
+    'purge-sync-tombstones': {
+        'task': 'materials.tasks.purge_sync_tombstones',
+        'schedule': timedelta(days=1),
+    },
+    'rebuild-autocomplete-index': {
+        'task': 'materials.tasks.rebuild_autocomplete_index',
+        'schedule': timedelta(seconds=AUTOCOMPLETE_REBUILD_SECONDS or 300),
+    },
+    'resume-course-deletions': {
+        'task': 'materials.tasks.resume_course_deletions',
+        'schedule': timedelta(minutes=5),
+    },
+}
+
+# Фоновое удаление курсов (materials/deletion.py): порог числа уроков, подписок и
+# оплат, с которого DELETE отвечает 202, размер пачки и срок, после которого
+# задание без прогресса считается прерванным и запускается снова
+COURSE_DELETE_CHUNKED_THRESHOLD = int(os.environ.get('COURSE_DELETE_CHUNKED_THRESHOLD', '1000'))
+COURSE_DELETE_BATCH_SIZE = int(os.environ.get('COURSE_DELETE_BATCH_SIZE', '500'))
+COURSE_DELETE_STALE_MINUTES = int(os.environ.get('COURSE_DELETE_STALE_MINUTES', '10'))
+
+# Архив платежей (users/archive.py, manage.py archive_payments / restore_payments):
+# в БД остаются платежи за последние PAYMENT_ARCHIVE_MONTHS месяцев
+PAYMENT_ARCHIVE_DIR = Path(os.environ.get('PAYMENT_ARCHIVE_DIR', BASE_DIR / 'archive' / 'payments'))
+PAYMENT_ARCHIVE_MONTHS = int(os.environ.get('PAYMENT_ARCHIVE_MONTHS', '12'))
+
+# Массовые действия админки выполняются в фоне пачками по столько объектов (config/admin_tools.py)
+ADMIN_BULK_CHUNK_SIZE = int(os.environ.get('ADMIN_BULK_CHUNK_SIZE', '1000'))
+
+# Рейтинг популярности курсов: число мест в каждом окне (materials/counters.py)
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '100'))
+
+# Профилирование запросов: заголовок Server-Timing и строка лога с разбивкой по фазам
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', '0') == '1'
+
+# Метрики Prometheus (/metrics). Для gunicorn с несколькими воркерами задайте
+# PROMETHEUS_MULTIPROC_DIR — значения агрегируются по процессам.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_ALLOWED_IPS = [
+    ip.strip()
+    for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+    if ip.strip()
+]
+METRICS_EXTRA_DIRS = [
+    path.strip()
+    for path in os.environ.get('METRICS_EXTRA_DIRS', '').split(',')
+    if path.strip()
+]
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'config.profiling': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
 }
 
 # Email (для рассылки уведомлений; в разработке — в консоль)
 EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@example.com')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '0') == '1'
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '30'))
+
+# Массовая рассылка (config/mailer.py): потоки-отправители (у каждого своё
+# соединение), писем на одно соединение, повторы временных ошибок (4xx)
+MAIL_SEND_WORKERS = int(os.environ.get('MAIL_SEND_WORKERS', '4'))
+MAIL_MESSAGES_PER_CONNECTION = int(os.environ.get('MAIL_MESSAGES_PER_CONNECTION', '100'))
+MAIL_MAX_RETRIES = int(os.environ.get('MAIL_MAX_RETRIES', '3'))
+MAIL_RETRY_BACKOFF = float(os.environ.get('MAIL_RETRY_BACKOFF', '1.0'))
@@ -0,0 +1,201 @@
+"""
+Хранилище медиа с дедупликацией по содержимому (MEDIA_DEDUP=1).
+
+Загружаемый файл хэшируется (SHA-256) по мере записи во временный файл и
+сохраняется один раз под именем ``blobs/<ab>/<cd>/<digest><ext>``; повторная
+загрузка того же содержимого только увеличивает счётчик ссылок в
+materials.MediaBlob. delete() лишь уменьшает счётчик — файлы без ссылок
+удаляет отложенно команда ``manage.py media_gc``.
+
+Счётчики уменьшаются сигналами при замене или удалении файла в полях
+моделей (connect_signals). Если они разойдутся с реальностью (например,
+откат транзакции после загрузки), ``media_gc --recount`` пересчитывает их
+по ссылкам из всех FileField и описаний вариантов изображений.
+"""
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.signals import setting_changed
+from django.db import IntegrityError, transaction
+from django.db.models import F, FileField
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+BLOB_PREFIX = 'blobs/'
+
+
+def blob_name(digest: str, ext: str) -> str:
+    return f'{BLOB_PREFIX}{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, хранящий каждое уникальное содержимое один раз."""
+
+    def _save(self, name, content):
+        from materials.models import MediaBlob
+
+        tmp_dir = self.path(f'{BLOB_PREFIX}tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'seek') and content.seekable():
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+            try:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+
+        final_name = blob_name(digest.hexdigest(), posixpath.splitext(name)[1])
+        self._incref(MediaBlob, final_name, size, tmp.name)
+        return final_name
+
+    def _incref(self, model, name, size, tmp_path):
+        """
+        Добавляет ссылку на блоб и кладёт файл на место, если его нет.
+        Всё — под блокировкой строки блоба: media_gc удаляет строку и файл
+        под той же блокировкой, поэтому не может удалить файл между проверкой
+        его наличия и новой ссылкой.
+        """
+        with transaction.atomic():
+            while True:
+                blob = model.objects.select_for_update().filter(name=name).first()
+                if blob is not None:
+                    model.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1, updated_at=timezone.now())
+                    break
+                try:
+                    with transaction.atomic():
+                        model.objects.create(name=name, size=size, refcount=1)
+                    break
+                except IntegrityError:
+                    # Строку только что создал параллельный запрос — блокируем её
+                    continue
+            self._place(tmp_path, name)
+
+    def _place(self, tmp_path, name):
+        final_path = self.path(name)
+        if os.path.exists(final_path):
+            os.unlink(tmp_path)
+            return
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        file_move_safe(tmp_path, final_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(final_path, self.file_permissions_mode)
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым (_save) — подбирать свободное не нужно
+        return name
+
+    def delete(self, name):
+        """Снимает ссылку на блоб; сам файл удаляет media_gc. Прочие файлы — как обычно."""
+        if not name:
+            return
+        if not name.startswith(BLOB_PREFIX):
+            super().delete(name)
+            return
+        from materials.models import MediaBlob
+
+        MediaBlob.objects.filter(name=name, refcount__gt=0).update(
+            refcount=F('refcount') - 1, updated_at=timezone.now(),
+        )
+
+    def purge(self, name):
+        """Физическое удаление файла блоба (только из media_gc, под блокировкой строки блоба)."""
+        super().delete(name)
+
+
+_fields_cache = {}
+
+
+@receiver(setting_changed)
+def _reset_fields_cache(setting, **kwargs):
+    if setting == 'STORAGES':
+        _fields_cache.clear()
+
+
+def _file_fields(model):
+    """Имена FileField модели, хранящихся в ContentAddressedStorage."""
+    fields = _fields_cache.get(model)
+    if fields is None:
+        fields = _fields_cache[model] = [
+            field.attname for field in model._meta.concrete_fields
+            if isinstance(field, FileField) and isinstance(field.storage, ContentAddressedStorage)
+        ]
+    return fields
+
+
+def _variants(instance, attname):
+    from config.images import stored_paths, variants_field_name
+
+    return stored_paths(getattr(instance, variants_field_name(attname), None) or {})
+
+
+def _remember_names(sender, instance, **kwargs):
+    fields = _file_fields(sender)
+    if fields:
+        instance._cas_names = {name: instance.__dict__.get(name) for name in fields}
+
+
+def _release_replaced(sender, instance, update_fields=None, **kwargs):
+    fields = _file_fields(sender)
+    if not fields:
+        return
+    old_names = getattr(instance, '_cas_names', {})
+    for attname in fields:
+        if update_fields is not None and attname not in update_fields:
+            continue
+        old = old_names.get(attname)
+        old = getattr(old, 'name', old)
+        new = getattr(instance, attname).name
+        if old and old != new:
+            getattr(instance, attname).storage.delete(old)
+    _remember_names(sender, instance)
+
+
+def _release_deleted(sender, instance, **kwargs):
+    for attname in _file_fields(sender):
+        field_file = getattr(instance, attname)
+        for name in {field_file.name, *_variants(instance, attname)}:
+            if name:
+                field_file.storage.delete(name)
+
+
+def connect_signals():
+    """Подключает учёт ссылок при замене и удалении файлов (MaterialsConfig.ready при MEDIA_DEDUP)."""
+    post_init.connect(_remember_names, dispatch_uid='cas_remember_names')
+    post_save.connect(_release_replaced, dispatch_uid='cas_release_replaced')
+    post_delete.connect(_release_deleted, dispatch_uid='cas_release_deleted')
+
+
+def disconnect_signals():
+    post_init.disconnect(dispatch_uid='cas_remember_names')
+    post_save.disconnect(dispatch_uid='cas_release_replaced')
+    post_delete.disconnect(dispatch_uid='cas_release_deleted')
+
+
+def iter_references():
+    """Имена файлов блобов, на которые ссылаются модели (поля и варианты изображений)."""
+    from config.images import stored_paths, variants_field_name
+
+    for model in apps.get_models():
+        for attname in _file_fields(model):
+            names = model._default_manager.exclude(**{attname: ''}).exclude(**{f'{attname}__isnull': True})
+            for name in names.values_list(attname, flat=True).iterator():
+                if name.startswith(BLOB_PREFIX):
+                    yield name
+            variants_name = variants_field_name(attname)
+            if any(field.name == variants_name for field in model._meta.concrete_fields):
+                for variants in model._default_manager.values_list(variants_name, flat=True).iterator():
+                    for name in stored_paths(variants or {}):
+                        if name.startswith(BLOB_PREFIX):
+                            yield name
@@ -0,0 +1,107 @@
+"""
+Метрики задач Celery: ожидание в очереди, время выполнения, размер результата,
+повторы/ошибки и прикладные счётчики (например, число отправленных писем).
+
+Обработчики сигналов подключаются при импорте модуля из config/celery.py.
+Время ожидания считается по заголовку ``enqueued_at``, который добавляется
+при публикации задачи (before_task_publish), и поэтому включает время в Redis.
+Значения выводятся через тот же /metrics (см. config.metrics.get_registry)
+и командой ``python manage.py celery_stats``.
+"""
+import json
+import os
+import time
+
+from celery import current_task
+from celery.signals import (
+    before_task_publish,
+    task_failure,
+    task_postrun,
+    task_prerun,
+    task_retry,
+    worker_init,
+    worker_process_shutdown,
+)
+from prometheus_client import Counter, Histogram, multiprocess
+
+TASK_QUEUE_WAIT = Histogram(
+    'celery_task_queue_wait_seconds',
+    'Время от публикации задачи до начала выполнения',
+    ['task'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0),
+)
+TASK_RUNTIME = Histogram(
+    'celery_task_runtime_seconds',
+    'Время выполнения задачи',
+    ['task', 'state'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 1800.0),
+)
+TASK_RESULT_BYTES = Histogram(
+    'celery_task_result_bytes',
+    'Размер результата задачи в JSON',
+    ['task'],
+    buckets=(16, 64, 256, 1024, 4096, 16384, 65536, 262144),
+)
+TASK_RETRIES = Counter('celery_task_retries_total', 'Повторы задач', ['task'])
+TASK_FAILURES = Counter('celery_task_failures_total', 'Ошибки задач', ['task', 'exception'])
+TASK_ITEMS = Counter('celery_task_items_total', 'Прикладные счётчики задач', ['task', 'item'])
+
+_started = {}
+
+
+def record_task_items(item: str, count: int = 1) -> None:
+    """Увеличивает прикладной счётчик текущей задачи (например, ``emails_sent``)."""
+    task_name = current_task.name if current_task else 'unknown'
+    TASK_ITEMS.labels(task=task_name, item=item).inc(count)
+
+
+@before_task_publish.connect
+def _stamp_enqueued_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('enqueued_at', time.time())
+
+
+@task_prerun.connect
+def _on_prerun(task_id=None, task=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+    enqueued_at = getattr(task.request, 'enqueued_at', None)
+    # Для отложенных задач (eta/countdown) ожидание в очереди не показательно
+    if enqueued_at and not task.request.eta:
+        TASK_QUEUE_WAIT.labels(task=task.name).observe(max(time.time() - enqueued_at, 0.0))
+
+
+@task_postrun.connect
+def _on_postrun(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is not None:
+        TASK_RUNTIME.labels(task=task.name, state=state or 'UNKNOWN').observe(time.perf_counter() - started)
+    if state == 'SUCCESS':
+        TASK_RESULT_BYTES.labels(task=task.name).observe(len(json.dumps(retval, default=str)))
+
+
+@task_retry.connect
+def _on_retry(sender=None, **kwargs):
+    TASK_RETRIES.labels(task=sender.name).inc()
+
+
+@task_failure.connect
+def _on_failure(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.labels(task=sender.name, exception=type(exception).__name__).inc()
+
+
+@worker_init.connect
+def _ensure_multiprocess_dir(**kwargs):
+    """
+    Только создаёт каталог, не очищая: его читает web, а очистку метрик
+    прошлого запуска делает команда контейнера до старта воркера — каждый
+    контейнер в своём подкаталоге (см. docker-compose.yml).
+    """
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+
+
+@worker_process_shutdown.connect
+def _mark_process_dead(pid=None, **kwargs):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid or os.getpid())
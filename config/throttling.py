@@ -0,0 +1,181 @@
+"""
+Ограничение частоты запросов к дорогим эндпоинтам записи (token bucket).
+
+У каждого ключа (пользователь, IP-адрес, логин при получении токена) своё
+«ведро» ёмкостью ``burst`` запросов, которое пополняется со скоростью
+``rate`` (например, ``'10/min'``). Запрос проходит, только если во всех его
+вёдрах есть жетон. Настройки по эндпоинтам — THROTTLES[scope].
+
+Хранилище (THROTTLE_BACKEND):
+
+- ``redis`` — общее для всех воркеров: пополнение и списание выполняются
+  атомарно Lua-скриптом, время берётся с сервера Redis (TIME), поэтому
+  расхождение часов между узлами не влияет. При недоступности Redis
+  используется локальное хранилище процесса;
+- ``memory`` — в памяти процесса (разработка, тесты): лимит на воркер.
+
+Отказ — ответ 429 с заголовком Retry-After (DRF, через wait()) и счётчик
+``http_throttled_total`` в /metrics.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from prometheus_client import Counter
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = Counter(
+    'http_throttled_total',
+    'Запросы, отклонённые ограничением частоты',
+    ['scope', 'key'],
+)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(wait)
+"""
+
+
+def parse_rate(rate: str) -> tuple:
+    """'10/min' -> (10, жетонов в секунду)."""
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period[0]]
+
+
+class MemoryBuckets:
+    """Вёдра в памяти процесса."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate) -> float:
+        """Списывает жетон; возвращает 0 или сколько секунд ждать следующего."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > 100_000:
+                # Ключи полных вёдер не несут состояния
+                self._buckets = {k: v for k, v in self._buckets.items() if v[0] < capacity}
+            return (1 - tokens) / rate
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBuckets:
+    """Вёдра в Redis (hash на ключ), атомарное обновление Lua-скриптом."""
+
+    def __init__(self, url, prefix='throttle'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+        self._prefix = prefix
+        self._fallback = MemoryBuckets()
+
+    def take(self, key, capacity, rate) -> float:
+        import redis
+
+        try:
+            return float(self._script(keys=[f'{self._prefix}:{key}'], args=[capacity, rate]))
+        except redis.RedisError:
+            logger.warning('Redis недоступен, ограничение частоты по локальному хранилищу', exc_info=True)
+            return self._fallback.take(key, capacity, rate)
+
+    def reset(self):
+        self._fallback.reset()
+
+
+_buckets = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global _buckets
+    if _buckets is None:
+        with _buckets_lock:
+            if _buckets is None:
+                if settings.THROTTLE_BACKEND == 'redis':
+                    _buckets = RedisBuckets(settings.REDIS_URL)
+                else:
+                    _buckets = MemoryBuckets()
+    return _buckets
+
+
+def reset():
+    """Сбрасывает локальные вёдра (тесты)."""
+    get_buckets().reset()
+
+
+class BucketThrottle(BaseThrottle):
+    """
+    Throttle DRF по ``view.throttle_scope``. Ключи из THROTTLES[scope]['keys']:
+    ``user`` (аутентифицированный пользователь), ``ip`` (с учётом NUM_PROXIES),
+    ``login`` (поле логина в теле запроса — перебор паролей к одной учётной записи).
+    """
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_keys(self, request, view, kinds):
+        for kind in kinds:
+            if kind == 'user':
+                if request.user and request.user.is_authenticated:
+                    yield kind, f'user:{request.user.pk}'
+            elif kind == 'ip':
+                yield kind, f'ip:{self.get_ident(request)}'
+            elif kind == 'login':
+                login = request.data.get(getattr(view, 'throttle_login_field', 'email'))
+                if isinstance(login, str) and login:
+                    yield kind, f'login:{login.strip().lower()}'
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        config = settings.THROTTLES.get(scope) if scope else None
+        if not config:
+            return True
+        count, rate = parse_rate(config['rate'])
+        # По умолчанию весь лимит периода можно выбрать сразу
+        capacity = config.get('burst', count)
+        buckets = get_buckets()
+        waits = []
+        # Жетон списывается из всех вёдер запроса, даже если одно из них пусто
+        for kind, key in self.get_keys(request, view, config.get('keys', ['user', 'ip'])):
+            wait = buckets.take(f'{scope}:{key}', capacity, rate)
+            if wait:
+                THROTTLED.labels(scope=scope, key=kind).inc()
+                waits.append(wait)
+        if waits:
+            self.retry_after = max(waits)
+            return False
+        return True
+
+    def wait(self):
+        return self.retry_after
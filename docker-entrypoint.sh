@@ -0,0 +1,9 @@
+#!/bin/sh
+# Каталог mmap-файлов prometheus_client (PROMETHEUS_MULTIPROC_DIR) должен
+# существовать до импорта Django: метрики открывают в нём файлы при первой
+# записи, а gunicorn/celery создают его слишком поздно (после импорта приложения).
+set -e
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+exec "$@"
@@ -0,0 +1,69 @@
+"""
+Конфигурация gunicorn (подхватывается автоматически из рабочего каталога).
+
+Приложение загружается в мастер-процессе до fork (preload_app), вместе с
+URLconf, представлениями и сериализаторами. Сборщик мусора в мастере
+отключён, а перед fork все объекты замораживаются (gc.freeze), чтобы GC
+воркеров не трогал их заголовки и страницы памяти оставались общими
+(copy-on-write). GUNICORN_PRELOAD=0 возвращает загрузку в каждом воркере.
+
+Каталог метрик (PROMETHEUS_MULTIPROC_DIR) готовится при чтении этого файла:
+с preload_app приложение импортируется раньше хука on_starting.
+"""
+import gc
+import os
+import shutil
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Очищаем каталог метрик прошлого запуска, чтобы не суммировать старые
+# значения. Только при первом чтении конфигурации: перечитывание по HUP и
+# новый мастер при USR2 не должны удалять файлы работающих воркеров.
+_multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if _multiproc_dir:
+    if not os.environ.get('GUNICORN_METRICS_DIR_READY'):
+        shutil.rmtree(_multiproc_dir, ignore_errors=True)
+        os.environ['GUNICORN_METRICS_DIR_READY'] = '1'
+    os.makedirs(_multiproc_dir, exist_ok=True)
+
+if preload_app:
+    gc.disable()
+
+
+def when_ready(server):
+    """
+    Прогрев в мастере до fork воркеров: импорт URLconf со всеми представлениями
+    и построение индекса автодополнения (соединения с БД закрываются, чтобы
+    воркеры не унаследовали их).
+    """
+    if preload_app:
+        from django.db import connections
+        from django.urls import get_resolver
+
+        from materials.autocomplete import get_index
+
+        get_resolver().url_patterns
+        try:
+            get_index().ensure_built(wait=True)
+        except Exception:
+            server.log.exception('Не удалось построить индекс автодополнения')
+        finally:
+            connections.close_all()
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        gc.enable()
+
+
+def child_exit(server, worker):
+    """Помечаем метрики завершившегося воркера (для livesum-gauge)."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,23 +1,45 @@
 from django.contrib import admin
-from .models import Course, Lesson, Subscription
+
+from config.admin_tools import LargeTableAdminMixin, background_action
+from .models import Course, CourseDeletion, Lesson, Subscription
+from .tasks import delete_courses
 
 
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
-    list_display = ('title', 'description')
-    list_filter = ('title',)
-    search_fields = ('title', 'description')
+class CourseAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'owner', 'subscriber_count', 'lesson_count', 'deleted_at')
+    list_select_related = ('owner',)
+    # Поиск и виджеты автодополнения — по названию (триграммный индекс на PostgreSQL)
+    search_fields = ('title',)
+    autocomplete_fields = ('owner',)
+    ordering = ('-id',)
+    actions = [background_action(delete_courses, 'Удалить курсы')]
 
 
 @admin.register(Lesson)
-class LessonAdmin(admin.ModelAdmin):
+class LessonAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'course', 'video_url')
-    list_filter = ('course',)
-    search_fields = ('title', 'description')
+    list_select_related = ('course',)
+    search_fields = ('title',)
+    autocomplete_fields = ('course', 'owner')
+    ordering = ('-id',)
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'course', 'created_at')
-    list_filter = ('course', 'created_at')
+    list_select_related = ('user', 'course')
+    list_filter = ('created_at',)
     search_fields = ('user__email', 'course__title')
+    autocomplete_fields = ('user', 'course')
+
+
+@admin.register(CourseDeletion)
+class CourseDeletionAdmin(admin.ModelAdmin):
+    list_display = ('course_id', 'status', 'lessons_deleted', 'subscriptions_deleted', 'payments_detached',
+                    'updated_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = [field.name for field in CourseDeletion._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,73 @@
+"""
+Асинхронные (ASGI) эндпоинты чтения курсов и уроков.
+Ответы совпадают с CourseViewSet (list/retrieve) и LessonList/RetrieveAPIView.
+"""
+from config.async_api import AsyncAPIView, is_moderator, json_response, paginate
+from .models import Course, Lesson
+from .paginators import MaterialsPagination
+from .serializers import CourseSerializer, LessonSerializer
+from .subscriptions import asubscribed_course_ids
+
+
+async def _course_context(request):
+    """Контекст сериализатора курса: id курсов с подпиской — из кэша или одним запросом."""
+    return {
+        'request': request,
+        'subscribed_course_ids': await asubscribed_course_ids(request.user),
+    }
+
+
+async def _lesson_queryset(request):
+    """Модераторы видят все уроки, остальные — только свои."""
+    queryset = Lesson.objects.filter(course__deleted_at__isnull=True).order_by('pk')
+    if not await is_moderator(request.user):
+        queryset = queryset.filter(owner=request.user)
+    return queryset
+
+
+class AsyncCourseListView(AsyncAPIView):
+    """Список курсов (async)"""
+
+    async def get(self, request):
+        queryset = Course.objects.filter(deleted_at__isnull=True).order_by('pk').prefetch_related('lessons')
+        courses, page = await paginate(request, queryset, MaterialsPagination)
+        if courses is None:
+            return json_response({'detail': 'Invalid page.'}, status=404)
+        context = await _course_context(request)
+        page['results'] = CourseSerializer(courses, many=True, context=context).data
+        return json_response(page)
+
+
+class AsyncCourseRetrieveView(AsyncAPIView):
+    """Детали курса (async)"""
+
+    async def get(self, request, pk):
+        try:
+            course = await Course.objects.prefetch_related('lessons').aget(pk=pk, deleted_at__isnull=True)
+        except Course.DoesNotExist:
+            return json_response({'detail': 'Not found.'}, status=404)
+        context = await _course_context(request)
+        return json_response(CourseSerializer(course, context=context).data)
+
+
+class AsyncLessonListView(AsyncAPIView):
+    """Список уроков (async)"""
+
+    async def get(self, request):
+        lessons, page = await paginate(request, await _lesson_queryset(request), MaterialsPagination)
+        if lessons is None:
+            return json_response({'detail': 'Invalid page.'}, status=404)
+        page['results'] = LessonSerializer(lessons, many=True, context={'request': request}).data
+        return json_response(page)
+
+
+class AsyncLessonRetrieveView(AsyncAPIView):
+    """Один урок (async)"""
+
+    async def get(self, request, pk):
+        queryset = await _lesson_queryset(request)
+        try:
+            lesson = await queryset.aget(pk=pk)
+        except Lesson.DoesNotExist:
+            return json_response({'detail': 'Not found.'}, status=404)
+        return json_response(LessonSerializer(lesson, context={'request': request}).data)
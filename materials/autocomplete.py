@@ -0,0 +1,472 @@
+"""
+Автодополнение названий курсов и уроков без обращения к БД.
+
+Индекс — отсортированный массив ключей (нормализованное название и его
+«хвосты» с начала каждого слова). Вес элемента — число подписчиков курса
+(для урока — его курса). Работа запроса ограничена независимо от числа
+совпадений:
+
+- префиксу, которому при построении соответствует больше SCAN_LIMIT
+  ключей («тяжёлому»), заранее сопоставлен узел — TOP_K лучших элементов
+  по весу; ответ — начало списка узла;
+- остальные префиксы ищутся проходом по не более чем SCAN_LIMIT соседним
+  ключам (по построению это все совпадения), ранжируется найденное.
+
+Сохранение и удаление элементов обновляют узлы на месте (вставка с
+обрезкой до TOP_K). Узел, потерявший элементы, до перестройки отдаёт
+меньше TOP_K (и не знает о вытесненных ранее), а префикс, ставший тяжёлым
+после построения, — лучшие из первых SCAN_LIMIT ключей; периодическая
+перестройка восстанавливает точный порядок.
+
+Бэкенды (AUTOCOMPLETE_BACKEND):
+- ``memory`` — индекс в памяти процесса. Строится в мастере gunicorn до
+  fork (см. gunicorn.conf.py), обновляется сигналами save/delete Course и
+  Lesson (materials/signals.py). Сигналы видит только процесс, где
+  произошла запись, поэтому остальные воркеры перестраивают индекс раз в
+  AUTOCOMPLETE_REBUILD_SECONDS.
+- ``redis`` — общий для всех воркеров индекс: ключи и узлы — sorted set с
+  нулевыми весами (ZRANGEBYLEX с LIMIT), данные элементов — в hash. Веса
+  обновляет периодическая задача rebuild_autocomplete_index.
+
+Запрос никогда не ждёт построения: ``lookup`` отвечает по текущему индексу
+(до первого построения — пустым списком), а перестройку запускает в фоновом
+потоке.
+"""
+import bisect
+import heapq
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_WORD_KEYS = 8
+SCAN_LIMIT = 200
+TOP_K = 50
+WEIGHT_LIMIT = 10 ** 10 - 1
+# Больше любого символа ключа: верхняя граница диапазона префикса
+PREFIX_END = '\U0010ffff'
+
+
+def normalize(text: str) -> str:
+    """Ключ для сравнения: регистр и ё не различаются, пробелы схлопнуты."""
+    return ' '.join((text or '').casefold().replace('ё', 'е').split())
+
+
+def title_keys(title: str) -> list:
+    """Ключи названия: всё название и его продолжения с начала каждого слова."""
+    words = normalize(title).split(' ')
+    return [' '.join(words[i:]) for i in range(min(len(words), MAX_WORD_KEYS)) if words[i]]
+
+
+def _course_weights(course_ids=None) -> dict:
+    from .models import Course
+
+    queryset = Course.objects.all()
+    if course_ids is not None:
+        queryset = queryset.filter(pk__in=course_ids)
+    return dict(queryset.values_list('pk', 'subscriber_count'))
+
+
+def iter_items():
+    """Все элементы индекса из БД: (kind, id, title, course_id, weight)."""
+    from .models import Course, Lesson
+
+    weights = _course_weights()
+    for pk, title in Course.objects.filter(deleted_at__isnull=True).values_list('pk', 'title').iterator():
+        yield 'course', pk, title, pk, weights.get(pk, 0)
+    lessons = Lesson.objects.filter(course__deleted_at__isnull=True)
+    for pk, title, course_id in lessons.values_list('pk', 'title', 'course_id').iterator():
+        yield 'lesson', pk, title, course_id, weights.get(course_id, 0)
+
+
+def item_for(instance):
+    """Элемент индекса для сохранённого курса или урока."""
+    kind = instance._meta.model_name
+    course_id = instance.pk if kind == 'course' else instance.course_id
+    weight = _course_weights([course_id]).get(course_id, 0)
+    return kind, instance.pk, instance.title, course_id, weight
+
+
+def _rank(title, weight):
+    """Порядок выдачи: популярнее, затем короче, затем по алфавиту."""
+    return -weight, len(title), title
+
+
+def _sort_key(hit):
+    return _rank(hit['title'], hit['weight'])
+
+
+def _prefixes(item_keys) -> set:
+    return {key[:n] for key in item_keys for n in range(1, len(key) + 1)}
+
+
+def node_prefixes(item_keys, heavy) -> set:
+    """Тяжёлые префиксы ключей элемента: проход по каждому ключу до первого лёгкого."""
+    found = set()
+    for key in item_keys:
+        for size in range(1, len(key) + 1):
+            prefix = key[:size]
+            if prefix not in heavy:
+                break
+            found.add(prefix)
+    return found
+
+
+def heavy_prefixes(sorted_keys) -> set:
+    """
+    Префиксы, которым соответствует больше SCAN_LIMIT ключей отсортированного
+    списка. Префикс тяжёлого префикса тоже тяжёлый, поэтому обход идёт вглубь
+    только по диапазонам тяжёлых.
+    """
+    heavy = set()
+    ranges = [('', 0, len(sorted_keys))]
+    while ranges:
+        prefix, start, end = ranges.pop()
+        size = len(prefix) + 1
+        position = start
+        while position < end:
+            key = sorted_keys[position]
+            if len(key) < size:
+                position += 1
+                continue
+            child = key[:size]
+            child_end = bisect.bisect_left(sorted_keys, child + PREFIX_END, position, end)
+            if child_end - position > SCAN_LIMIT:
+                heavy.add(child)
+                ranges.append((child, position, child_end))
+            position = child_end
+    return heavy
+
+
+def top_nodes(ranked, heavy) -> dict:
+    """
+    Узлы тяжёлых префиксов: ``ranked`` — пары (запись, ключи элемента) по
+    возрастанию записи, в узел попадают первые TOP_K записей с таким префиксом.
+    """
+    nodes = {prefix: [] for prefix in heavy}
+    for entry, item_keys in ranked:
+        for prefix in node_prefixes(item_keys, heavy):
+            node = nodes[prefix]
+            if len(node) < TOP_K:
+                node.append(entry)
+    return nodes
+
+
+class BackgroundBuildMixin:
+    """Перестройка индекса в фоновом потоке: запрос не ждёт обращения к БД."""
+
+    _build_thread = None
+    _build_thread_lock = threading.Lock()
+
+    def needs_build(self) -> bool:
+        raise NotImplementedError
+
+    def ensure_built(self, wait: bool = False):
+        """
+        Перестраивает индекс, если нужно. ``wait=True`` — в текущем потоке
+        (прогрев до fork), иначе запускает фоновый поток и сразу возвращается.
+        """
+        if not self.needs_build():
+            return
+        if wait:
+            self.build()
+            return
+        with self._build_thread_lock:
+            if self._build_thread is not None and self._build_thread.is_alive():
+                return
+            self._build_thread = threading.Thread(
+                target=self._build_in_background, name='autocomplete-build', daemon=True,
+            )
+            self._build_thread.start()
+
+    def _build_in_background(self):
+        from django.db import connections
+
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс автодополнения')
+        finally:
+            # Соединения потока иначе остались бы открытыми до завершения процесса
+            connections.close_all()
+
+
+class MemoryPrefixIndex(BackgroundBuildMixin):
+    """Индекс в памяти процесса: список (ключ, kind, id), отсортированный по ключу."""
+
+    def __init__(self):
+        self._keys = []
+        self._items = {}
+        self._nodes = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+
+    def build(self):
+        keys = []
+        items = {}
+        for kind, pk, title, course_id, weight in iter_items():
+            item_keys = title_keys(title)
+            items[kind, pk] = (title, course_id, weight, item_keys)
+            keys.extend((key, kind, pk) for key in item_keys)
+        keys.sort()
+        heavy = heavy_prefixes([key for key, _, _ in keys])
+        ranked = sorted(
+            ((_rank(title, weight), kind, pk), item_keys)
+            for (kind, pk), (title, _, weight, item_keys) in items.items()
+        )
+        nodes = top_nodes(ranked, heavy)
+        with self._lock:
+            # Замена ссылок атомарна: читатели видят либо старый, либо новый индекс
+            self._keys, self._items, self._nodes = keys, items, nodes
+            self._built_at = time.monotonic()
+
+    def needs_build(self) -> bool:
+        rebuild_after = settings.AUTOCOMPLETE_REBUILD_SECONDS
+        return self._built_at is None or bool(
+            rebuild_after and time.monotonic() - self._built_at > rebuild_after
+        )
+
+    def _remove(self, kind, pk):
+        old = self._items.pop((kind, pk), None)
+        if old is None:
+            return
+        title, _, weight, item_keys = old
+        for key in item_keys:
+            position = bisect.bisect_left(self._keys, (key, kind, pk))
+            if position < len(self._keys) and self._keys[position] == (key, kind, pk):
+                del self._keys[position]
+        entry = (_rank(title, weight), kind, pk)
+        for prefix in node_prefixes(item_keys, self._nodes):
+            node = self._nodes[prefix]
+            if entry in node:
+                node.remove(entry)
+
+    def upsert(self, kind, pk, title, course_id, weight):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._remove(kind, pk)
+            item_keys = title_keys(title)
+            self._items[kind, pk] = (title, course_id, weight, item_keys)
+            for key in item_keys:
+                bisect.insort(self._keys, (key, kind, pk))
+            entry = (_rank(title, weight), kind, pk)
+            for prefix in node_prefixes(item_keys, self._nodes):
+                node = self._nodes[prefix]
+                bisect.insort(node, entry)
+                del node[TOP_K:]
+
+    def remove(self, kind, pk):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._remove(kind, pk)
+
+    @staticmethod
+    def _scan(keys, items, prefix, limit):
+        start = bisect.bisect_left(keys, (prefix,))
+        found = {}
+        for key, kind, pk in keys[start:start + SCAN_LIMIT]:
+            if not key.startswith(prefix):
+                break
+            item = items.get((kind, pk))
+            if item is not None:
+                found[kind, pk] = (_rank(item[0], item[2]), kind, pk)
+        return heapq.nsmallest(limit, found.values())
+
+    def lookup(self, prefix: str, limit: int = 10) -> list:
+        """Лучшие ``limit`` (не больше TOP_K) элементов, ключ которых начинается с ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_built()
+        keys, items, node = self._keys, self._items, self._nodes.get(prefix)
+        entries = node[:limit] if node is not None else self._scan(keys, items, prefix, limit)
+        hits = []
+        for _, kind, pk in entries:
+            item = items.get((kind, pk))
+            if item is not None:
+                hits.append({'kind': kind, 'id': pk, 'title': item[0], 'course_id': item[1], 'weight': item[2]})
+        return hits
+
+
+class RedisPrefixIndex(BackgroundBuildMixin):
+    """
+    Общий индекс в Redis. Ключи — элементы sorted set ``<ключ>\\0<kind>:<id>``
+    с весом 0 (лексикографический порядок), данные — hash ``<kind>:<id>``.
+    Узлы тяжёлых префиксов — sorted set ``<префикс>\\0<ранг>\\0<kind>:<id>``:
+    ранг записан так, что лексикографический порядок совпадает с порядком
+    выдачи, и узел читается ZRANGEBYLEX с LIMIT. Сами тяжёлые префиксы — set.
+    """
+
+    def __init__(self, url, prefix='autocomplete'):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+        self._keys_name = f'{prefix}:keys'
+        self._items_name = f'{prefix}:items'
+        self._nodes_name = f'{prefix}:nodes'
+        self._heavy_name = f'{prefix}:heavy'
+        self._prefix = prefix
+        self._checked = False
+
+    @staticmethod
+    def _member(key, ref):
+        return f'{key}\0{ref}'.encode()
+
+    @staticmethod
+    def _node_member(prefix, title, weight, ref):
+        rank = f'{WEIGHT_LIMIT - min(max(weight, 0), WEIGHT_LIMIT):010d}{min(len(title), 9999):04d}{title}'
+        return f'{prefix}\0{rank}\0{ref}'.encode()
+
+    def build(self):
+        # Одновременно строит только один процесс: временные ключи общие
+        lock = self._redis.lock(f'{self._prefix}:build-lock', timeout=600)
+        if not lock.acquire(blocking=False):
+            return
+        try:
+            self._build()
+        finally:
+            lock.release()
+        self._checked = True
+
+    def _build(self):
+        names = (self._keys_name, self._items_name, self._nodes_name, self._heavy_name)
+        tmp_keys, tmp_items, tmp_nodes, tmp_heavy = (f'{name}:tmp' for name in names)
+        keys = []
+        ranked = []
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.delete(tmp_keys, tmp_items, tmp_nodes, tmp_heavy)
+        for kind, pk, title, course_id, weight in iter_items():
+            ref = f'{kind}:{pk}'
+            item_keys = title_keys(title)
+            pipe.hset(tmp_items, ref, json.dumps([title, course_id, weight, item_keys]))
+            pipe.zadd(tmp_keys, {self._member(key, ref): 0 for key in item_keys})
+            keys.extend(item_keys)
+            ranked.append(((_rank(title, weight), ref), item_keys))
+            if len(pipe) >= 1000:
+                pipe.execute()
+        keys.sort()
+        ranked.sort()
+        heavy = heavy_prefixes(keys)
+        for prefix, node in top_nodes(ranked, heavy).items():
+            pipe.sadd(tmp_heavy, prefix)
+            pipe.zadd(tmp_nodes, {
+                self._node_member(prefix, rank[2], -rank[0], ref): 0 for rank, ref in node
+            })
+            if len(pipe) >= 1000:
+                pipe.execute()
+        pipe.execute()
+        # Подмена готового индекса одной транзакцией (RENAME заменяет старые ключи)
+        pipe = self._redis.pipeline()
+        for tmp, name in zip((tmp_keys, tmp_items, tmp_nodes, tmp_heavy), names):
+            if self._redis.exists(tmp):
+                pipe.rename(tmp, name)
+            else:
+                pipe.delete(name)
+        pipe.set(f'{self._prefix}:built', 1)
+        pipe.execute()
+
+    def needs_build(self) -> bool:
+        # Проверяется один раз на процесс; индекс в Redis живёт дольше процессов
+        if self._checked:
+            return False
+        self._checked = bool(self._redis.exists(f'{self._prefix}:built'))
+        return not self._checked
+
+    def _heavy(self, item_keys) -> list:
+        candidates = sorted(_prefixes(item_keys))
+        if not candidates:
+            return []
+        flags = self._redis.smismember(self._heavy_name, candidates)
+        return [prefix for prefix, flag in zip(candidates, flags) if flag]
+
+    def _remove(self, pipe, ref):
+        old = self._redis.hget(self._items_name, ref)
+        if old is not None:
+            title, _, weight, old_keys = json.loads(old)
+            if old_keys:
+                pipe.zrem(self._keys_name, *(self._member(key, ref) for key in old_keys))
+            members = [self._node_member(prefix, title, weight, ref) for prefix in self._heavy(old_keys)]
+            if members:
+                pipe.zrem(self._nodes_name, *members)
+        pipe.hdel(self._items_name, ref)
+
+    def _trim(self, prefixes):
+        """Обрезает узлы до TOP_K после вставки."""
+        pipe = self._redis.pipeline(transaction=False)
+        for prefix in prefixes:
+            start = prefix.encode()
+            pipe.zrangebylex(self._nodes_name, b'[' + start + b'\0', b'(' + start + b'\x01', start=TOP_K, num=-1)
+        extra = [member for members in pipe.execute() for member in members]
+        if extra:
+            self._redis.zrem(self._nodes_name, *extra)
+
+    def upsert(self, kind, pk, title, course_id, weight):
+        ref = f'{kind}:{pk}'
+        item_keys = title_keys(title)
+        heavy = self._heavy(item_keys)
+        pipe = self._redis.pipeline()
+        self._remove(pipe, ref)
+        pipe.hset(self._items_name, ref, json.dumps([title, course_id, weight, item_keys]))
+        pipe.zadd(self._keys_name, {self._member(key, ref): 0 for key in item_keys})
+        if heavy:
+            pipe.zadd(self._nodes_name, {self._node_member(prefix, title, weight, ref): 0 for prefix in heavy})
+        pipe.execute()
+        self._trim(heavy)
+
+    def remove(self, kind, pk):
+        pipe = self._redis.pipeline()
+        self._remove(pipe, f'{kind}:{pk}')
+        pipe.execute()
+
+    def _hits(self, refs):
+        hits = []
+        if not refs:
+            return hits
+        for ref, raw in zip(refs, self._redis.hmget(self._items_name, refs)):
+            if raw is None:
+                continue
+            kind, pk = ref.decode().split(':')
+            title, course_id, weight, _ = json.loads(raw)
+            hits.append({'kind': kind, 'id': int(pk), 'title': title, 'course_id': course_id, 'weight': weight})
+        return hits
+
+    def lookup(self, prefix: str, limit: int = 10) -> list:
+        """Лучшие ``limit`` (не больше TOP_K) элементов, ключ которых начинается с ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_built()
+        start = prefix.encode()
+        members = self._redis.zrangebylex(
+            self._nodes_name, b'[' + start + b'\0', b'(' + start + b'\x01', start=0, num=limit,
+        )
+        if members:
+            return self._hits([member.rsplit(b'\0', 1)[1] for member in members])
+        members = self._redis.zrangebylex(
+            self._keys_name, b'[' + start, b'[' + start + b'\xff', start=0, num=SCAN_LIMIT,
+        )
+        refs = list(dict.fromkeys(member.rsplit(b'\0', 1)[1] for member in members))
+        return heapq.nsmallest(limit, self._hits(refs), key=_sort_key)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Индекс автодополнения, выбранный в AUTOCOMPLETE_BACKEND (один на процесс)."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if settings.AUTOCOMPLETE_BACKEND == 'redis':
+                    _index = RedisPrefixIndex(settings.REDIS_URL)
+                else:
+                    _index = MemoryPrefixIndex()
+    return _index
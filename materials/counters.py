@@ -0,0 +1,114 @@
+"""
+Денормализованные счётчики курса и рейтинг популярности.
+
+``Course.subscriber_count``, ``lesson_count`` и ``paid_count`` меняются
+F()-выражениями в той же транзакции, что и подписка, урок или платёж
+(сигналы materials/signals.py и users/signals.py), поэтому сортировка
+каталога по популярности не считает COUNT по связанным таблицам.
+Расхождения (массовые операции без сигналов, перенос урока в другой курс)
+исправляет периодическая задача repair_course_counters.
+
+Рейтинг за окно времени (сутки/неделя/месяц) предрассчитывается задачей
+refresh_course_leaderboards в таблицу CoursePopularity; общий рейтинг
+читается прямо из счётчиков по индексу materials_course_popular_idx.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+WINDOWS = {
+    'day': timedelta(days=1),
+    'week': timedelta(days=7),
+    'month': timedelta(days=30),
+}
+# Оплата курса весит больше новой подписки
+PAYMENT_WEIGHT = 3
+
+
+def adjust(course_id, field: str, delta: int):
+    """Атомарно меняет счётчик курса (без чтения-записи и гонок между запросами)."""
+    from .models import Course
+
+    if course_id is None:
+        return
+    queryset = Course.objects.filter(pk=course_id)
+    if delta < 0:
+        # Счётчик беззнаковый: не уходим ниже нуля при уже рассинхронизированном значении
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def _count(model, fk: str, **filters):
+    rows = (
+        model.objects.filter(**{fk: OuterRef('pk')}, **filters)
+        .order_by().values(fk).annotate(n=Count('pk')).values('n')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def actual_counts():
+    """Выражения с фактическими значениями счётчиков (для аннотации Course)."""
+    from users.models import Payment
+    from .models import Lesson, Subscription
+
+    return {
+        'subscriber_count': _count(Subscription, 'course'),
+        'lesson_count': _count(Lesson, 'course'),
+        'paid_count': _count(Payment, 'paid_course'),
+    }
+
+
+def repair_counters() -> int:
+    """Пересчитывает счётчики, обновляя только разошедшиеся курсы. Возвращает их число."""
+    from .models import Course
+
+    expressions = actual_counts()
+    actual = {f'actual_{name}': expression for name, expression in expressions.items()}
+    drift = Q()
+    for name in expressions:
+        drift |= ~Q(**{name: F(f'actual_{name}')})
+    repaired = 0
+    stale = Course.objects.annotate(**actual).filter(drift).values_list('pk', flat=True)
+    for pk in stale.iterator():
+        # Пересчёт в момент записи: между выборкой и обновлением счётчик мог измениться
+        Course.objects.filter(pk=pk).update(**expressions)
+        repaired += 1
+    return repaired
+
+
+def refresh_leaderboards(size: int) -> int:
+    """Перестраивает CoursePopularity по всем окнам. Возвращает число записанных строк."""
+    from users.models import Payment
+    from .models import Course, CoursePopularity, Subscription
+
+    now = timezone.now()
+    rows = []
+    for window, length in WINDOWS.items():
+        since = now - length
+        # Два коррелированных подзапроса вместо COUNT(DISTINCT) по соединению
+        # подписок и платежей: их произведение растёт квадратично
+        top = (
+            Course.objects
+            .filter(deleted_at__isnull=True)
+            .annotate(
+                new_subscribers=_count(Subscription, 'course', created_at__gte=since),
+                new_payments=_count(Payment, 'paid_course', payment_date__gte=since),
+            )
+            .annotate(score=F('new_subscribers') + F('new_payments') * PAYMENT_WEIGHT)
+            .filter(score__gt=0)
+            .order_by('-score', 'id')
+            .values_list('pk', 'new_subscribers', 'new_payments', 'score')[:size]
+        )
+        rows.extend(
+            CoursePopularity(window=window, rank=rank, course_id=pk, subscribers=subscribers,
+                             payments=payments, score=score, computed_at=now)
+            for rank, (pk, subscribers, payments, score) in enumerate(top, start=1)
+        )
+    # Читатели видят либо старый рейтинг, либо новый целиком
+    with transaction.atomic():
+        CoursePopularity.objects.all().delete()
+        CoursePopularity.objects.bulk_create(rows)
+    return len(rows)
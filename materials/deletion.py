@@ -0,0 +1,144 @@
+"""
+Фоновое удаление больших курсов пачками.
+
+Каскадное удаление курса в запросе (уроки, подписки, SET_NULL в платежах)
+держит блокировки на всех строках сразу и не укладывается в таймаут.
+Вместо этого ``hide`` в транзакции запроса только помечает курс
+(``deleted_at``: курс пропадает из списков, поиска и синхронизации), создаёт
+задание CourseDeletion и ставит задачу через outbox. Задача
+delete_course_chunked (``run``) обрабатывает зависимые объекты пачками по
+первичному ключу, каждая пачка — отдельная транзакция вместе с прогрессом
+задания. Порядок: уроки из автодополнения (до первой пачки), отвязка
+платежей от курса и его уроков, подписки, уроки, сам курс.
+
+Возобновление: пачки идемпотентны (каждая выбирает то, что ещё осталось),
+а строка задания блокируется на время пачки, поэтому повторный или
+параллельный запуск безопасен. Задания, прогресс которых не менялся
+COURSE_DELETE_STALE_MINUTES минут (воркер упал), снова ставит в очередь
+resume_course_deletions.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from config import outbox
+
+
+def is_large(course) -> bool:
+    """Курс удаляется в фоне, если зависимых объектов не меньше порога."""
+    dependents = course.lesson_count + course.subscriber_count + course.paid_count
+    return dependents >= settings.COURSE_DELETE_CHUNKED_THRESHOLD
+
+
+def hide(course, user=None):
+    """
+    Скрывает курс и ставит его удаление в очередь (внутри транзакции запроса).
+    Строка курса блокируется: повторный или параллельный запрос (API или
+    действие админки) дожидается первого и получает уже созданное задание.
+    """
+    from .autocomplete import get_index
+    from .models import Course, CourseDeletion, Tombstone
+    from .tasks import delete_course_chunked
+
+    course = Course.objects.select_for_update().get(pk=course.pk)
+    existing = CourseDeletion.objects.filter(course_id=course.pk).first()
+    if existing is not None:
+        return existing
+    Course.objects.filter(pk=course.pk).update(deleted_at=timezone.now())
+    # Клиенты синхронизации убирают курс сразу, не дожидаясь удаления строки
+    Tombstone.objects.create(kind='course', object_id=course.pk, owner_id=course.owner_id)
+    # Уроки убирает из подсказок первый шаг задания, не запрос
+    pk = course.pk
+    transaction.on_commit(lambda: get_index().remove('course', pk))
+    deletion = CourseDeletion.objects.create(
+        course_id=course.pk,
+        requested_by=user,
+        lessons_total=course.lesson_count,
+        subscriptions_total=course.subscriber_count,
+        payments_total=course.paid_count,
+    )
+    outbox.enqueue(delete_course_chunked, deletion.pk)
+    return deletion
+
+
+def _first_pks(queryset, size):
+    return list(queryset.order_by('pk').values_list('pk', flat=True)[:size])
+
+
+def _next_batch(course_id, size):
+    """Одна пачка: (поле прогресса, обработано строк) или None, если зависимых не осталось."""
+    from users.models import Payment
+    from .models import Lesson, Subscription
+
+    detach = (
+        (Payment.objects.filter(paid_course_id=course_id), {'paid_course': None}),
+        (Payment.objects.filter(paid_lesson__course_id=course_id), {'paid_lesson': None}),
+    )
+    for queryset, values in detach:
+        pks = _first_pks(queryset, size)
+        if pks:
+            return 'payments_detached', Payment.objects.filter(pk__in=pks).update(**values)
+    # Удаление через ORM: сигналы пишут записи для синхронизации и обновляют кэши
+    for model, field in ((Subscription, 'subscriptions_deleted'), (Lesson, 'lessons_deleted')):
+        pks = _first_pks(model.objects.filter(course_id=course_id), size)
+        if pks:
+            model.objects.filter(pk__in=pks).delete()
+            return field, len(pks)
+    return None
+
+
+def _unindex_lessons(course_id):
+    """Убирает уроки скрытого курса из автодополнения (уроки удаляются последними)."""
+    from .autocomplete import get_index
+    from .models import Lesson
+
+    index = get_index()
+    for pk in Lesson.objects.filter(course_id=course_id).values_list('pk', flat=True).iterator():
+        index.remove('lesson', pk)
+
+
+def run(deletion_id, batch_size, max_batches=None):
+    """Выполняет (или продолжает) удаление. Возвращает задание или None."""
+    from .models import Course, CourseDeletion
+
+    pending = CourseDeletion.objects.filter(pk=deletion_id, status=CourseDeletion.STATUS_PENDING).first()
+    if pending is not None:
+        _unindex_lessons(pending.course_id)
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            deletion = CourseDeletion.objects.select_for_update().filter(pk=deletion_id).first()
+            if deletion is None or deletion.status == CourseDeletion.STATUS_DONE:
+                return deletion
+            step = _next_batch(deletion.course_id, batch_size)
+            if step is None:
+                Course.objects.filter(pk=deletion.course_id).delete()
+                deletion.status = CourseDeletion.STATUS_DONE
+                deletion.finished_at = timezone.now()
+            else:
+                field, processed = step
+                setattr(deletion, field, getattr(deletion, field) + processed)
+                deletion.status = CourseDeletion.STATUS_RUNNING
+            deletion.save()
+        if deletion.status == CourseDeletion.STATUS_DONE:
+            return deletion
+        batches += 1
+    return deletion
+
+
+def resume_stale() -> int:
+    """Снова ставит в очередь задания, прогресс которых давно не менялся."""
+    from .models import CourseDeletion
+    from .tasks import delete_course_chunked
+
+    threshold = timezone.now() - timedelta(minutes=settings.COURSE_DELETE_STALE_MINUTES)
+    stale = CourseDeletion.objects.exclude(status=CourseDeletion.STATUS_DONE).filter(updated_at__lt=threshold)
+    with transaction.atomic():
+        pks = list(stale.values_list('pk', flat=True))
+        # Отметка времени: следующий обход не поставит задание повторно
+        CourseDeletion.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+        for pk in pks:
+            outbox.enqueue(delete_course_chunked, pk)
+    return len(pks)
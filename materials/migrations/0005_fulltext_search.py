@@ -0,0 +1,112 @@
+# Полнотекстовый поиск по курсам и урокам (см. materials/search.py).
+#
+# PostgreSQL: генерируемые столбцы search_vector (tsvector) с GIN-индексом —
+# СУБД сама пересчитывает их при каждой записи.
+# SQLite: виртуальная таблица FTS5 materials_search, поддерживаемая триггерами;
+# rowid = id * 2 для курсов и id * 2 + 1 для уроков.
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE materials_course ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX materials_course_search_idx ON materials_course USING gin (search_vector)",
+    """
+    ALTER TABLE materials_lesson ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX materials_lesson_search_idx ON materials_lesson USING gin (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "ALTER TABLE materials_course DROP COLUMN search_vector",
+    "ALTER TABLE materials_lesson DROP COLUMN search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE materials_search USING fts5(
+        course_id UNINDEXED, title, description, tokenize = 'unicode61'
+    )
+    """,
+    """
+    INSERT INTO materials_search (rowid, course_id, title, description)
+    SELECT id * 2, id, title, coalesce(description, '') FROM materials_course
+    """,
+    """
+    INSERT INTO materials_search (rowid, course_id, title, description)
+    SELECT id * 2 + 1, course_id, title, coalesce(description, '') FROM materials_lesson
+    """,
+    """
+    CREATE TRIGGER materials_course_search_ai AFTER INSERT ON materials_course BEGIN
+        INSERT INTO materials_search (rowid, course_id, title, description)
+        VALUES (new.id * 2, new.id, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER materials_course_search_au AFTER UPDATE OF title, description ON materials_course BEGIN
+        UPDATE materials_search SET title = new.title, description = coalesce(new.description, '')
+        WHERE rowid = new.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER materials_course_search_ad AFTER DELETE ON materials_course BEGIN
+        DELETE FROM materials_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER materials_lesson_search_ai AFTER INSERT ON materials_lesson BEGIN
+        INSERT INTO materials_search (rowid, course_id, title, description)
+        VALUES (new.id * 2 + 1, new.course_id, new.title, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER materials_lesson_search_au AFTER UPDATE OF title, description, course_id ON materials_lesson BEGIN
+        UPDATE materials_search
+        SET course_id = new.course_id, title = new.title, description = coalesce(new.description, '')
+        WHERE rowid = new.id * 2 + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER materials_lesson_search_ad AFTER DELETE ON materials_lesson BEGIN
+        DELETE FROM materials_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS materials_course_search_ai",
+    "DROP TRIGGER IF EXISTS materials_course_search_au",
+    "DROP TRIGGER IF EXISTS materials_course_search_ad",
+    "DROP TRIGGER IF EXISTS materials_lesson_search_ai",
+    "DROP TRIGGER IF EXISTS materials_lesson_search_au",
+    "DROP TRIGGER IF EXISTS materials_lesson_search_ad",
+    "DROP TABLE IF EXISTS materials_search",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_course_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
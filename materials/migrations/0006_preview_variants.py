@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0005_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='preview_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='preview variants'),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='preview_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='preview variants'),
+        ),
+    ]
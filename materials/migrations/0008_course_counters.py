@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:23
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def backfill_counters(apps, schema_editor):
+    Course = apps.get_model('materials', 'Course')
+    related = (
+        ('subscriber_count', apps.get_model('materials', 'Subscription'), 'course'),
+        ('lesson_count', apps.get_model('materials', 'Lesson'), 'course'),
+        ('paid_count', apps.get_model('users', 'Payment'), 'paid_course'),
+    )
+    counts = {}
+    for field, model, fk in related:
+        rows = model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+        counts[field] = Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+    Course.objects.using(schema_editor.connection.alias).update(**counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0007_mediablob'),
+        ('users', '0006_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoursePopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=10, verbose_name='window')),
+                ('rank', models.PositiveIntegerField(verbose_name='rank')),
+                ('subscribers', models.PositiveIntegerField(verbose_name='new subscribers')),
+                ('payments', models.PositiveIntegerField(verbose_name='payments')),
+                ('score', models.PositiveIntegerField(verbose_name='score')),
+                ('computed_at', models.DateTimeField(verbose_name='computed at')),
+            ],
+            options={
+                'verbose_name': 'course popularity',
+                'verbose_name_plural': 'course popularity',
+            },
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='lesson count'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='paid_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='paid count'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='subscriber_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='subscriber count'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-subscriber_count', 'id'], name='materials_course_popular_idx'),
+        ),
+        migrations.AddField(
+            model_name='coursepopularity',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='materials.course', verbose_name='course'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursepopularity',
+            constraint=models.UniqueConstraint(fields=('window', 'rank'), name='unique_popularity_window_rank'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:30
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Записи без отметки времени попадают в первую синхронизацию по ключу (updated_at, id)
+    now = timezone.now()
+    for name in ('Course', 'Lesson'):
+        model = apps.get_model('materials', name)
+        model.objects.using(schema_editor.connection.alias).filter(updated_at__isnull=True).update(updated_at=now)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0008_course_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('lesson', 'Lesson')], max_length=10, verbose_name='kind')),
+                ('object_id', models.BigIntegerField(verbose_name='object id')),
+                ('owner_id', models.BigIntegerField(blank=True, null=True, verbose_name='owner id')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True, verbose_name='deleted at')),
+            ],
+            options={
+                'verbose_name': 'tombstone',
+                'verbose_name_plural': 'tombstones',
+            },
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True, verbose_name='updated at'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['updated_at', 'id'], name='materials_course_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['updated_at', 'id'], name='materials_lesson_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['deleted_at', 'id'], name='materials_tombstone_sync_idx'),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('materials', '0010_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='deleted at'),
+        ),
+        migrations.CreateModel(
+            name='CourseDeletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('course_id', models.BigIntegerField(unique=True, verbose_name='course id')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=10, verbose_name='status')),
+                ('lessons_total', models.PositiveIntegerField(default=0, verbose_name='lessons total')),
+                ('lessons_deleted', models.PositiveIntegerField(default=0, verbose_name='lessons deleted')),
+                ('subscriptions_total', models.PositiveIntegerField(default=0, verbose_name='subscriptions total')),
+                ('subscriptions_deleted', models.PositiveIntegerField(default=0, verbose_name='subscriptions deleted')),
+                ('payments_total', models.PositiveIntegerField(default=0, verbose_name='payments total')),
+                ('payments_detached', models.PositiveIntegerField(default=0, verbose_name='payments detached')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='requested by')),
+            ],
+            options={
+                'verbose_name': 'course deletion',
+                'verbose_name_plural': 'course deletions',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='materials_deletion_stale_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Триграммные индексы по названиям курсов и уроков на PostgreSQL: поиск в
+# админке и виджеты автодополнения внешних ключей (icontains по title).
+# Индексы строятся CONCURRENTLY в неатомарной миграции, см.
+# users/migrations/0009_admin_trigram_indexes.py.
+
+from django.db import migrations
+
+TABLES = ['materials_course', 'materials_lesson']
+
+POSTGRES_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {table}_title_trgm_idx ON {table} '
+    f'USING gin (UPPER(title::text) gin_trgm_ops)'
+    for table in TABLES
+]
+
+POSTGRES_BACKWARD = [f'DROP INDEX CONCURRENTLY IF EXISTS {table}_title_trgm_idx' for table in TABLES]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('materials', '0011_course_deletion'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
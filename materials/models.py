@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -6,6 +7,8 @@ class Course(models.Model):
     """Модель курса"""
     title = models.CharField(_('title'), max_length=200)
     preview = models.ImageField(_('preview'), upload_to='courses/', blank=True, null=True)
+    # Уменьшенные копии и заглушка превью (config/images.py)
+    preview_variants = models.JSONField(_('preview variants'), default=dict, blank=True, editable=False)
     description = models.TextField(_('description'), blank=True, null=True)
     owner = models.ForeignKey(
         'users.User',
@@ -16,10 +19,23 @@ class Course(models.Model):
         verbose_name=_('owner'),
     )
     updated_at = models.DateTimeField(_('updated at'), auto_now=True, null=True, blank=True)
+    # Денормализованные счётчики: обновляются F()-выражениями из сигналов
+    # (materials/signals.py, users/signals.py), расхождения чинит repair_course_counters
+    subscriber_count = models.PositiveIntegerField(_('subscriber count'), default=0, editable=False)
+    lesson_count = models.PositiveIntegerField(_('lesson count'), default=0, editable=False)
+    paid_count = models.PositiveIntegerField(_('paid count'), default=0, editable=False)
+    # Курс скрыт и удаляется по частям в фоне (materials/deletion.py)
+    deleted_at = models.DateTimeField(_('deleted at'), null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = _('course')
         verbose_name_plural = _('courses')
+        indexes = [
+            # Сортировка каталога и общий рейтинг по популярности
+            models.Index(fields=['-subscriber_count', 'id'], name='materials_course_popular_idx'),
+            # Дельта-синхронизация (materials/sync.py)
+            models.Index(fields=['updated_at', 'id'], name='materials_course_sync_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -30,6 +46,7 @@ class Lesson(models.Model):
     title = models.CharField(_('title'), max_length=200)
     description = models.TextField(_('description'), blank=True, null=True)
     preview = models.ImageField(_('preview'), upload_to='lessons/', blank=True, null=True)
+    preview_variants = models.JSONField(_('preview variants'), default=dict, blank=True, editable=False)
     video_url = models.URLField(_('video URL'), blank=True, null=True)
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lessons', verbose_name=_('course'))
     owner = models.ForeignKey(
@@ -40,10 +57,15 @@ class Lesson(models.Model):
         related_name='lessons',
         verbose_name=_('owner'),
     )
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True, null=True, blank=True)
 
     class Meta:
         verbose_name = _('lesson')
         verbose_name_plural = _('lessons')
+        indexes = [
+            # Дельта-синхронизация (materials/sync.py)
+            models.Index(fields=['updated_at', 'id'], name='materials_lesson_sync_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -75,3 +97,155 @@ class Subscription(models.Model):
 
     def __str__(self):
         return f'{self.user} -> {self.course}'
+
+
+class CoursePopularity(models.Model):
+    """
+    Предрассчитанный рейтинг курсов за окно времени (refresh_course_leaderboards):
+    новые подписки и оплаты за последние сутки/неделю/месяц.
+    """
+    WINDOW_CHOICES = [
+        ('day', _('Day')),
+        ('week', _('Week')),
+        ('month', _('Month')),
+    ]
+
+    window = models.CharField(_('window'), max_length=10, choices=WINDOW_CHOICES)
+    rank = models.PositiveIntegerField(_('rank'))
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+', verbose_name=_('course'))
+    subscribers = models.PositiveIntegerField(_('new subscribers'))
+    payments = models.PositiveIntegerField(_('payments'))
+    score = models.PositiveIntegerField(_('score'))
+    computed_at = models.DateTimeField(_('computed at'))
+
+    class Meta:
+        verbose_name = _('course popularity')
+        verbose_name_plural = _('course popularity')
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'rank'], name='unique_popularity_window_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.window} #{self.rank}: {self.course_id}'
+
+
+class Tombstone(models.Model):
+    """
+    Запись об удалённом курсе или уроке для дельта-синхронизации
+    (materials/sync.py). Хранится SYNC_TOMBSTONE_DAYS дней.
+    """
+    KIND_CHOICES = [
+        ('course', _('Course')),
+        ('lesson', _('Lesson')),
+    ]
+
+    kind = models.CharField(_('kind'), max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField(_('object id'))
+    # Владелец удалённого урока: не-модераторы синхронизируют только свои уроки
+    owner_id = models.BigIntegerField(_('owner id'), null=True, blank=True)
+    deleted_at = models.DateTimeField(_('deleted at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('tombstone')
+        verbose_name_plural = _('tombstones')
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='materials_tombstone_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} ({self.deleted_at})'
+
+
+class OutboxMessage(models.Model):
+    """
+    Задача Celery, записанная в той же транзакции, что и изменение данных
+    (config/outbox.py). Отправляется в брокер задачей dispatch_outbox.
+    """
+    task = models.CharField(_('task'), max_length=200)
+    args = models.JSONField(_('args'), default=list)
+    kwargs = models.JSONField(_('kwargs'), default=dict)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    # Следующая попытка отправки (после ошибки брокера — с задержкой)
+    available_at = models.DateTimeField(_('available at'), default=timezone.now)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    class Meta:
+        verbose_name = _('outbox message')
+        verbose_name_plural = _('outbox messages')
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='materials_outbox_ready_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} {self.args}'
+
+
+class CourseDeletion(models.Model):
+    """
+    Фоновое удаление курса пачками (materials/deletion.py): прогресс по
+    зависимым объектам. Счётчики ``*_total`` — снимок на момент запроса.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+    ]
+
+    # Не внешний ключ: запись переживает удалённый курс
+    course_id = models.BigIntegerField(_('course id'), unique=True)
+    requested_by = models.ForeignKey(
+        'users.User',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name=_('requested by'),
+    )
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    lessons_total = models.PositiveIntegerField(_('lessons total'), default=0)
+    lessons_deleted = models.PositiveIntegerField(_('lessons deleted'), default=0)
+    subscriptions_total = models.PositiveIntegerField(_('subscriptions total'), default=0)
+    subscriptions_deleted = models.PositiveIntegerField(_('subscriptions deleted'), default=0)
+    payments_total = models.PositiveIntegerField(_('payments total'), default=0)
+    payments_detached = models.PositiveIntegerField(_('payments detached'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    # Обновляется после каждой пачки: по нему находятся задания упавших воркеров
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('course deletion')
+        verbose_name_plural = _('course deletions')
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='materials_deletion_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f'course {self.course_id}: {self.status}'
+
+
+class MediaBlob(models.Model):
+    """
+    Уникальное содержимое медиафайла в хранилище с дедупликацией
+    (config/storage.py): имя файла по хэшу и число ссылающихся полей.
+    """
+    name = models.CharField(_('name'), max_length=255, unique=True)
+    size = models.PositiveBigIntegerField(_('size'))
+    refcount = models.PositiveIntegerField(_('reference count'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('media blob')
+        verbose_name_plural = _('media blobs')
+        indexes = [
+            # Кандидаты для media_gc: блобы без ссылок
+            models.Index(fields=['refcount', 'updated_at'], name='materials_blob_gc_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
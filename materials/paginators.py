@@ -1,7 +1,7 @@
-from rest_framework.pagination import PageNumberPagination
+from config.pagination import EstimatedCountPagination
 
 
-class MaterialsPagination(PageNumberPagination):
+class MaterialsPagination(EstimatedCountPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
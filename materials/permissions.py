@@ -1,42 +1,97 @@
+"""
+Права доступа к курсам и урокам.
+
+Объектные правила владельца дублируются фильтром queryset по ``owner_id``
+(``filter_queryset``): AuthorizedObjectMixin.get_object выбирает объект
+одним запросом уже с условием доступа, а has_object_permission сравнивает
+``owner_id`` без загрузки владельца. Членство в группе moderators
+проверяется один раз на запрос (кэш на объекте пользователя).
+"""
+from django.core.exceptions import ValidationError
+from django.http import Http404
 from rest_framework import permissions
 
 
+def is_moderator(user) -> bool:
+    """Членство в группе moderators; кэшируется на объекте пользователя (на время запроса)."""
+    if not user or not user.is_authenticated:
+        return False
+    if not hasattr(user, '_is_moderator'):
+        user._is_moderator = user.groups.filter(name='moderators').exists()
+    return user._is_moderator
+
+
+def _is_owner(request, obj) -> bool:
+    return obj.owner_id is not None and obj.owner_id == request.user.pk
+
+
 class IsModerator(permissions.BasePermission):
     """Права доступа для модераторов"""
 
     def has_permission(self, request, view):
-        return (
-            request.user.is_authenticated
-            and request.user.groups.filter(name='moderators').exists()
-        )
+        return is_moderator(request.user)
 
 
 class IsOwner(permissions.BasePermission):
     """Права доступа для владельца объекта"""
 
     def has_object_permission(self, request, view, obj):
-        return obj.owner == request.user
+        return _is_owner(request, obj)
+
+    def filter_queryset(self, request, queryset):
+        return queryset.filter(owner_id=request.user.pk)
 
 
 class IsOwnerOrModerator(permissions.BasePermission):
     """Права доступа для владельца или модератора"""
 
     def has_object_permission(self, request, view, obj):
-        is_moderator = (
-            request.user.is_authenticated
-            and request.user.groups.filter(name='moderators').exists()
-        )
-        is_owner = obj.owner == request.user
-        return is_owner or is_moderator
+        return _is_owner(request, obj) or is_moderator(request.user)
+
+    def filter_queryset(self, request, queryset):
+        if is_moderator(request.user):
+            return queryset
+        return queryset.filter(owner_id=request.user.pk)
 
 
 class IsOwnerAndNotModerator(permissions.BasePermission):
     """Права доступа: только владелец и не модератор"""
 
     def has_object_permission(self, request, view, obj):
-        is_moderator = (
-            request.user.is_authenticated
-            and request.user.groups.filter(name='moderators').exists()
-        )
-        is_owner = obj.owner == request.user
-        return is_owner and not is_moderator
+        return _is_owner(request, obj) and not is_moderator(request.user)
+
+    def filter_queryset(self, request, queryset):
+        if is_moderator(request.user):
+            return queryset.none()
+        return queryset.filter(owner_id=request.user.pk)
+
+
+class AuthorizedObjectMixin:
+    """
+    get_object() для generic-представлений: условия прав доступа (filter_queryset
+    у permission-классов) добавляются в запрос выборки объекта. Если объект
+    есть, но недоступен, — 403, как при объектной проверке; если нет — 404.
+    """
+
+    def get_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+
+        authorized = queryset
+        for permission in self.get_permissions():
+            if hasattr(permission, 'filter_queryset'):
+                authorized = permission.filter_queryset(self.request, authorized)
+        try:
+            obj = authorized.filter(**lookup).first()
+            # Отдельный запрос только на пути отказа: различаем 403 и 404
+            denied = obj is None and authorized is not queryset and queryset.filter(**lookup).exists()
+        except (TypeError, ValueError, ValidationError):
+            # Значение не приводится к типу поля (например, /courses/abc/) — как в get_object_or_404 DRF
+            raise Http404
+        if denied:
+            self.permission_denied(self.request)
+        if obj is None:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
@@ -0,0 +1,185 @@
+"""
+Полнотекстовый поиск по курсам и урокам.
+
+Индексы создаёт миграция 0005_fulltext_search и поддерживает сама СУБД:
+в PostgreSQL — генерируемые столбцы search_vector с GIN-индексом,
+в SQLite (локальный запуск) — таблица FTS5 materials_search с триггерами.
+Заголовок весит больше описания; результат — хиты, отсортированные по
+релевантности, с общим количеством для пагинации.
+"""
+import re
+
+from django.db import connection
+
+from config.profiling import phase
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+POSTGRES_SQL = """
+WITH q AS (SELECT websearch_to_tsquery('simple', %s) AS query),
+hits AS (
+    SELECT 'course' AS kind, c.id AS course_id, c.title AS course_title,
+           NULL::integer AS lesson_id, NULL::varchar AS lesson_title,
+           ts_rank(c.search_vector, q.query) AS rank
+    FROM materials_course c, q
+    WHERE c.search_vector @@ q.query AND c.deleted_at IS NULL
+    UNION ALL
+    SELECT 'lesson', l.course_id, c.title, l.id, l.title,
+           ts_rank(l.search_vector, q.query)
+    FROM materials_lesson l JOIN materials_course c ON c.id = l.course_id, q
+    WHERE l.search_vector @@ q.query AND c.deleted_at IS NULL
+)
+SELECT kind, course_id, course_title, lesson_id, lesson_title, rank, count(*) OVER ()
+FROM hits
+ORDER BY rank DESC, course_id, lesson_id NULLS FIRST
+LIMIT %s OFFSET %s
+"""
+
+# bm25() нельзя использовать вместе с оконной функцией в одном SELECT,
+# поэтому совпадения сначала материализуются в CTE.
+# Веса bm25 по столбцам: course_id (не индексируется), title, description.
+SQLITE_SQL = """
+WITH m AS MATERIALIZED (
+    SELECT rowid AS id, course_id, title, -bm25(materials_search, 0, 10, 1) AS rank
+    FROM materials_search
+    WHERE materials_search MATCH %s
+)
+SELECT m.id, m.course_id, c.title, m.title, m.rank, count(*) OVER ()
+FROM m LEFT JOIN materials_course c ON c.id = m.course_id
+WHERE c.deleted_at IS NULL
+ORDER BY m.rank DESC, m.id
+LIMIT %s OFFSET %s
+"""
+
+
+# Триггеры FTS5 для SQLite. Пересоздание таблицы при миграции (SQLite не умеет
+# многие ALTER TABLE) удаляет её триггеры — после migrate они восстанавливаются
+# (ensure_sqlite_triggers), а индекс перестраивается.
+SQLITE_TRIGGERS = {
+    'materials_course_search_ai': """
+        CREATE TRIGGER materials_course_search_ai AFTER INSERT ON materials_course BEGIN
+            INSERT INTO materials_search (rowid, course_id, title, description)
+            VALUES (new.id * 2, new.id, new.title, coalesce(new.description, ''));
+        END
+    """,
+    'materials_course_search_au': """
+        CREATE TRIGGER materials_course_search_au AFTER UPDATE OF title, description ON materials_course BEGIN
+            UPDATE materials_search SET title = new.title, description = coalesce(new.description, '')
+            WHERE rowid = new.id * 2;
+        END
+    """,
+    'materials_course_search_ad': """
+        CREATE TRIGGER materials_course_search_ad AFTER DELETE ON materials_course BEGIN
+            DELETE FROM materials_search WHERE rowid = old.id * 2;
+        END
+    """,
+    'materials_lesson_search_ai': """
+        CREATE TRIGGER materials_lesson_search_ai AFTER INSERT ON materials_lesson BEGIN
+            INSERT INTO materials_search (rowid, course_id, title, description)
+            VALUES (new.id * 2 + 1, new.course_id, new.title, coalesce(new.description, ''));
+        END
+    """,
+    'materials_lesson_search_au': """
+        CREATE TRIGGER materials_lesson_search_au AFTER UPDATE OF title, description, course_id
+        ON materials_lesson BEGIN
+            UPDATE materials_search
+            SET course_id = new.course_id, title = new.title, description = coalesce(new.description, '')
+            WHERE rowid = new.id * 2 + 1;
+        END
+    """,
+    'materials_lesson_search_ad': """
+        CREATE TRIGGER materials_lesson_search_ad AFTER DELETE ON materials_lesson BEGIN
+            DELETE FROM materials_search WHERE rowid = old.id * 2 + 1;
+        END
+    """,
+}
+
+SQLITE_REINDEX = [
+    "DELETE FROM materials_search",
+    """
+    INSERT INTO materials_search (rowid, course_id, title, description)
+    SELECT id * 2, id, title, coalesce(description, '') FROM materials_course
+    """,
+    """
+    INSERT INTO materials_search (rowid, course_id, title, description)
+    SELECT id * 2 + 1, course_id, title, coalesce(description, '') FROM materials_lesson
+    """,
+]
+
+
+def ensure_sqlite_triggers(using='default', **kwargs):
+    """
+    Обработчик post_migrate: восстанавливает удалённые триггеры FTS5 и
+    перестраивает индекс. Для PostgreSQL не нужен — search_vector генерируемый.
+    """
+    from django.db import connections
+
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'materials_%'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        if 'materials_search' not in existing or not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        for statement in SQLITE_REINDEX:
+            cursor.execute(statement)
+
+
+def fts5_query(text: str) -> str:
+    """
+    Запрос FTS5 из пользовательского ввода: все слова обязательны,
+    последнее — как префикс (поиск по мере набора). Спецсинтаксис FTS5
+    экранируется кавычками.
+    """
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return ''
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _hit(kind, course_id, course_title, lesson_id, lesson_title, rank):
+    return {
+        'kind': kind,
+        'course_id': course_id,
+        'course_title': course_title,
+        'lesson_id': lesson_id,
+        'lesson_title': lesson_title,
+        'rank': float(rank),
+    }
+
+
+def search(text: str, limit: int, offset: int = 0):
+    """
+    Ищет ``text`` в заголовках и описаниях курсов и уроков.
+    Возвращает (список хитов, общее число совпадений).
+    """
+    vendor = connection.vendor
+    with phase('search'), connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            if not text.strip():
+                return [], 0
+            cursor.execute(POSTGRES_SQL, [text, limit, offset])
+            rows = cursor.fetchall()
+            hits = [_hit(*row[:6]) for row in rows]
+        elif vendor == 'sqlite':
+            match = fts5_query(text)
+            if not match:
+                return [], 0
+            cursor.execute(SQLITE_SQL, [match, limit, offset])
+            rows = cursor.fetchall()
+            hits = []
+            for rowid, course_id, course_title, title, rank, _ in rows:
+                if rowid % 2 == 0:
+                    hits.append(_hit('course', course_id, title, None, None, rank))
+                else:
+                    hits.append(_hit('lesson', course_id, course_title, rowid // 2, title, rank))
+        else:
+            raise NotImplementedError(f'Полнотекстовый поиск не поддерживается для {vendor}')
+    total = rows[0][-1] if rows else 0
+    return hits, total
@@ -1,11 +1,17 @@
 from rest_framework import serializers
-from .models import Course, Lesson, Subscription
+
+from config.images import ImageVariantsField
+from .models import Course, CourseDeletion, Lesson
+from .subscriptions import subscribed_course_ids
 from .validators import validate_youtube_only
 
 
 class LessonSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Lesson"""
     video_url = serializers.URLField(required=False, allow_null=True, validators=[validate_youtube_only])
+    preview_variants = ImageVariantsField('preview')
+    # Уроки нельзя добавлять в курс, который удаляется
+    course = serializers.PrimaryKeyRelatedField(queryset=Course.objects.filter(deleted_at__isnull=True))
 
     class Meta:
         model = Lesson
@@ -14,20 +20,70 @@ class LessonSerializer(serializers.ModelSerializer):
 
 class CourseSerializer(serializers.ModelSerializer):
     """Сериализатор для модели Course"""
-    lesson_count = serializers.SerializerMethodField()
     lessons = LessonSerializer(many=True, read_only=True)
     is_subscribed = serializers.SerializerMethodField()
+    preview_variants = ImageVariantsField('preview')
 
     class Meta:
         model = Course
-        fields = '__all__'
-
-    def get_lesson_count(self, instance):
-        """Возвращает количество уроков в курсе"""
-        return instance.lessons.count()
+        exclude = ('deleted_at',)
 
     def get_is_subscribed(self, instance) -> bool:
-        request = self.context.get("request")
-        if not request or not request.user or not request.user.is_authenticated:
-            return False
-        return Subscription.objects.filter(user=request.user, course=instance).exists()
+        # Множество id курсов с подпиской загружается один раз на сериализацию
+        # (контекст общий для всех элементов списка) или передаётся заранее
+        subscribed_ids = self.context.get("subscribed_course_ids")
+        if subscribed_ids is None:
+            request = self.context.get("request")
+            subscribed_ids = subscribed_course_ids(getattr(request, "user", None))
+            self.context["subscribed_course_ids"] = subscribed_ids
+        return instance.pk in subscribed_ids
+
+
+class SyncCourseSerializer(CourseSerializer):
+    """Курс в ответе синхронизации: без вложенных уроков (они идут своим потоком)"""
+    lessons = None
+
+
+class SearchHitSerializer(serializers.Serializer):
+    """Результат полнотекстового поиска: курс или урок (с курсом, к которому он относится)"""
+    kind = serializers.ChoiceField(choices=['course', 'lesson'])
+    course_id = serializers.IntegerField()
+    course_title = serializers.CharField()
+    lesson_id = serializers.IntegerField(allow_null=True)
+    lesson_title = serializers.CharField(allow_null=True)
+    rank = serializers.FloatField()
+
+
+class AutocompleteHitSerializer(serializers.Serializer):
+    """Подсказка автодополнения: курс или урок"""
+    kind = serializers.ChoiceField(choices=['course', 'lesson'])
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    course_id = serializers.IntegerField()
+
+
+class LeaderboardEntrySerializer(serializers.Serializer):
+    """Место курса в рейтинге популярности"""
+    rank = serializers.IntegerField()
+    course_id = serializers.IntegerField()
+    title = serializers.CharField()
+    subscribers = serializers.IntegerField()
+    payments = serializers.IntegerField()
+    score = serializers.IntegerField()
+
+
+class CourseDeletionSerializer(serializers.ModelSerializer):
+    """Прогресс фонового удаления курса"""
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CourseDeletion
+        exclude = ('requested_by',)
+
+    def get_progress(self, instance) -> int:
+        """Процент обработанных зависимых объектов (по снимку на момент запроса)."""
+        if instance.status == CourseDeletion.STATUS_DONE:
+            return 100
+        total = instance.lessons_total + instance.subscriptions_total + instance.payments_total
+        done = instance.lessons_deleted + instance.subscriptions_deleted + instance.payments_detached
+        return min(99, done * 100 // total) if total else 0
@@ -0,0 +1,69 @@
+"""
+Сигналы приложения materials. После фиксации транзакции: инкрементальное
+обновление индекса автодополнения (materials/autocomplete.py) и генерация
+вариантов превью (config/images.py), кэш подписок пользователя
+(materials/subscriptions.py). В той же транзакции: счётчики курса
+(materials/counters.py) и записи об удалениях для синхронизации (materials/sync.py).
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config.images import needs_variants
+from .autocomplete import get_index, item_for
+from . import counters, subscriptions
+from .models import Course, Lesson, Subscription, Tombstone
+from .tasks import generate_preview_variants
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def autocomplete_upsert(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_index().upsert(*item_for(instance)))
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Lesson)
+def autocomplete_remove(sender, instance, **kwargs):
+    kind, pk = instance._meta.model_name, instance.pk
+    transaction.on_commit(lambda: get_index().remove(kind, pk))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_save, sender=Lesson)
+def preview_variants(sender, instance, **kwargs):
+    if needs_variants(instance, 'preview'):
+        model_name, pk = instance._meta.model_name, instance.pk
+        transaction.on_commit(lambda: generate_preview_variants.delay(model_name, pk))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_added(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(instance.course_id, 'subscriber_count', 1)
+        user_id = instance.user_id
+        transaction.on_commit(lambda: subscriptions.invalidate(user_id))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_removed(sender, instance, **kwargs):
+    counters.adjust(instance.course_id, 'subscriber_count', -1)
+    user_id = instance.user_id
+    transaction.on_commit(lambda: subscriptions.invalidate(user_id))
+
+
+@receiver(post_save, sender=Lesson)
+def lesson_added(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(instance.course_id, 'lesson_count', 1)
+
+
+@receiver(post_delete, sender=Lesson)
+def lesson_removed(sender, instance, **kwargs):
+    counters.adjust(instance.course_id, 'lesson_count', -1)
+
+
+@receiver(post_delete, sender=Course)
+@receiver(post_delete, sender=Lesson)
+def sync_tombstone(sender, instance, **kwargs):
+    Tombstone.objects.create(kind=instance._meta.model_name, object_id=instance.pk, owner_id=instance.owner_id)
@@ -0,0 +1,115 @@
+"""
+Кэш множества курсов, на которые подписан пользователь.
+
+``is_subscribed`` в CourseSerializer проверяется для каждого курса ответа;
+вместо запроса EXISTS на курс множество id загружается один раз на запрос
+(из кэша или одним запросом к БД) и дальше проверяется в памяти.
+
+В кэше хранится отсортированный упакованный массив 64-битных id
+(``array('q')``, 8 байт на подписку). Подписка и отписка после фиксации
+транзакции удаляют ключ пользователя (сигналы materials/signals.py), и
+множество загружается заново при следующем чтении.
+
+Удаление видят все воркеры, только если кэш общий (Redis, CACHE_REDIS=1):
+тогда множество живёт SUBSCRIPTIONS_CACHE_TTL. Кэш в памяти процесса
+другие воркеры не видят, поэтому в нём срок жизни короткий —
+SUBSCRIPTIONS_LOCAL_CACHE_TTL, и ``is_subscribed`` в другом воркере
+расходится с БД не дольше этого срока. Чтение, начатое до фиксации
+подписки и записавшее старое множество после удаления ключа, тоже
+ограничено сроком жизни.
+"""
+import bisect
+from array import array
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from config.metrics import record_cache
+
+TYPECODE = 'q'
+
+
+class SubscribedCourses:
+    """Неизменяемое множество id курсов поверх отсортированного массива (бинарный поиск)."""
+
+    __slots__ = ('_ids',)
+
+    def __init__(self, ids):
+        self._ids = ids
+
+    @classmethod
+    def from_ids(cls, ids):
+        return cls(array(TYPECODE, sorted(set(ids))))
+
+    @classmethod
+    def from_bytes(cls, raw):
+        ids = array(TYPECODE)
+        ids.frombytes(raw)
+        return cls(ids)
+
+    def to_bytes(self):
+        return self._ids.tobytes()
+
+    def __contains__(self, course_id):
+        index = bisect.bisect_left(self._ids, course_id)
+        return index < len(self._ids) and self._ids[index] == course_id
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+
+def _cache():
+    return caches[settings.SUBSCRIPTIONS_CACHE]
+
+
+def _ttl(cache):
+    if isinstance(cache, LocMemCache):
+        return settings.SUBSCRIPTIONS_LOCAL_CACHE_TTL
+    return settings.SUBSCRIPTIONS_CACHE_TTL
+
+
+def _key(user_id):
+    return f'materials:subscribed:{user_id}'
+
+
+def _queryset(user_id):
+    from .models import Subscription
+
+    return Subscription.objects.filter(user_id=user_id).order_by('course_id').values_list('course_id', flat=True)
+
+
+def subscribed_course_ids(user) -> SubscribedCourses:
+    """Id курсов с подпиской пользователя (пустое множество для анонимного)."""
+    if user is None or not user.is_authenticated:
+        return SubscribedCourses(array(TYPECODE))
+    cache = _cache()
+    raw = cache.get(_key(user.pk))
+    record_cache('subscriptions', raw is not None)
+    if raw is not None:
+        return SubscribedCourses.from_bytes(raw)
+    subscribed = SubscribedCourses.from_ids(_queryset(user.pk))
+    cache.set(_key(user.pk), subscribed.to_bytes(), _ttl(cache))
+    return subscribed
+
+
+async def asubscribed_course_ids(user) -> SubscribedCourses:
+    """Асинхронный вариант subscribed_course_ids для ASGI-эндпоинтов."""
+    if user is None or not user.is_authenticated:
+        return SubscribedCourses(array(TYPECODE))
+    cache = _cache()
+    raw = await cache.aget(_key(user.pk))
+    record_cache('subscriptions', raw is not None)
+    if raw is not None:
+        return SubscribedCourses.from_bytes(raw)
+    subscribed = SubscribedCourses.from_ids([course_id async for course_id in _queryset(user.pk)])
+    await cache.aset(_key(user.pk), subscribed.to_bytes(), _ttl(cache))
+    return subscribed
+
+
+def invalidate(user_id):
+    """Сбрасывает множество пользователя после подписки или отписки."""
+    _cache().delete(_key(user_id))
@@ -0,0 +1,126 @@
+"""
+Дельта-синхронизация курсов и уроков для клиентов (мобильное приложение).
+
+Клиент передаёт токен изменений, выданный сервером в прошлом ответе, и
+получает только курсы и уроки, созданные или изменённые после него, и id
+удалённых (таблица Tombstone, пишется сигналом post_delete). Без токена
+возвращается весь каталог — постранично тем же механизмом.
+
+Токен — подписанная (django.core.signing) позиция в каждом из трёх потоков:
+курсы и уроки по ключу (updated_at, id), удаления по (deleted_at, id).
+Выборка идёт по индексам *_sync_idx, поэтому стоимость пропорциональна
+числу изменений, а не размеру каталога. Если поток упёрся в лимит, позиция
+ставится на последний отданный элемент и в ответе ``has_more``. Иначе
+позиция сдвигается на время ответа минус SYNC_OVERLAP_SECONDS: запись,
+зафиксированная позже, но с более ранней отметкой времени, придёт в
+следующем ответе повторно (клиент применяет изменения идемпотентно).
+
+Чтения синхронизации всегда идут в primary (SyncAPIView, use_primary): на
+реплике запись может появиться позже, чем через SYNC_OVERLAP_SECONDS, и
+окно перекрытия её бы уже пропустило. Перекрытие покрывает только
+транзакции, зафиксированные позже своей отметки updated_at.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+SALT = 'materials.sync'
+STREAMS = ('courses', 'lessons', 'deleted')
+
+
+class TokenExpired(Exception):
+    """Удаления после позиции токена уже вычищены — нужна полная синхронизация."""
+
+
+def _after(field, position):
+    if position is None:
+        return Q()
+    moment, pk = position
+    return Q(**{f'{field}__gt': moment}) | Q(**{field: moment, 'id__gt': pk})
+
+
+def decode_token(token):
+    """Позиции потоков из токена; BadSignature для поддельного или повреждённого."""
+    data = signing.loads(token, salt=SALT)
+    positions = {}
+    for stream in STREAMS:
+        moment, pk = data[stream]
+        positions[stream] = (parse_datetime(moment), pk)
+    return positions
+
+
+def encode_token(positions):
+    return signing.dumps(
+        {stream: [moment.isoformat(), pk] for stream, (moment, pk) in positions.items()},
+        salt=SALT, compress=True,
+    )
+
+
+def changes(user, token=None, limit=200, moderator=False):
+    """
+    Изменения после токена: {'courses': [Course], 'lessons': [Lesson],
+    'deleted': {'courses': [id], 'lessons': [id]}, 'token', 'has_more'}.
+    Не-модератор получает только свои уроки (как LessonListAPIView).
+    """
+    from .models import Course, Lesson, Tombstone
+
+    now = timezone.now()
+    if token is None:
+        # Первая синхронизация: весь каталог, удаления до этого момента не нужны
+        positions = {'courses': None, 'lessons': None, 'deleted': (now, 0)}
+    else:
+        positions = decode_token(token)
+        if positions['deleted'][0] < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+            raise TokenExpired
+
+    # Скрытые курсы (удаляются в фоне) уже отданы как удалённые
+    lessons = Lesson.objects.filter(course__deleted_at__isnull=True)
+    tombstones = Tombstone.objects.all()
+    if not moderator:
+        lessons = lessons.filter(owner=user)
+        tombstones = tombstones.filter(Q(kind='course') | Q(owner_id=user.pk))
+    querysets = {
+        'courses': (Course.objects.filter(_after('updated_at', positions['courses']), deleted_at__isnull=True),
+                    'updated_at'),
+        'lessons': (lessons.filter(_after('updated_at', positions['lessons'])), 'updated_at'),
+        'deleted': (tombstones.filter(_after('deleted_at', positions['deleted'])), 'deleted_at'),
+    }
+
+    result = {}
+    has_more = False
+    horizon = now - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+    for stream, (queryset, field) in querysets.items():
+        rows = list(queryset.order_by(field, 'id')[:limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            has_more = True
+            positions[stream] = (getattr(rows[-1], field), rows[-1].pk)
+        else:
+            current = positions[stream]
+            # Позиция не уходит назад дальше уже выданной
+            positions[stream] = max(current, (horizon, 0)) if current else (horizon, 0)
+        result[stream] = rows
+
+    deleted = {'courses': [], 'lessons': []}
+    for tombstone in result['deleted']:
+        deleted[f'{tombstone.kind}s'].append(tombstone.object_id)
+    return {
+        'courses': result['courses'],
+        'lessons': result['lessons'],
+        'deleted': deleted,
+        'token': encode_token(positions),
+        'has_more': has_more,
+    }
+
+
+def purge_tombstones() -> int:
+    """Удаляет записи об удалениях старше SYNC_TOMBSTONE_DAYS."""
+    from .models import Tombstone
+
+    threshold = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=threshold).delete()
+    return deleted
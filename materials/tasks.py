@@ -2,9 +2,13 @@
 Отложенные и периодические задачи приложения materials.
 """
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage
 from django.conf import settings
 
+from config.db_router import use_replica
+from config.mailer import PooledMailer
+from config.task_metrics import record_task_items
+
 
 @shared_task
 def send_course_update_emails(course_id: int):
@@ -15,12 +19,14 @@ def send_course_update_emails(course_id: int):
     from .models import Course, Subscription
 
     try:
-        course = Course.objects.get(pk=course_id)
+        course = Course.objects.get(pk=course_id, deleted_at__isnull=True)
     except Course.DoesNotExist:
         return
 
-    subscribers = Subscription.objects.filter(course=course).select_related('user')
-    emails = [s.user.email for s in subscribers if s.user.email]
+    # Курс читаем из primary (его только что обновили), список подписчиков — с реплики
+    with use_replica():
+        subscribers = Subscription.objects.filter(course=course).select_related('user')
+        emails = [s.user.email for s in subscribers if s.user.email]
     if not emails:
         return
 
@@ -31,10 +37,120 @@ def send_course_update_emails(course_id: int):
         f'Зайдите на платформу, чтобы посмотреть новые материалы.\n\n'
         f'С уважением,\nКоманда платформы'
     )
-    send_mail(
-        subject=subject,
-        message=message,
-        from_email=getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com'),
-        recipient_list=emails,
-        fail_silently=True,
-    )
+    from_email = getattr(settings, 'DEFAULT_FROM_EMAIL', 'noreply@example.com')
+    # Отдельное письмо каждому подписчику: адреса не раскрываются друг другу
+    messages = [EmailMessage(subject, message, from_email, [email]) for email in emails]
+    sent, failed = PooledMailer().send(messages)
+    record_task_items('emails_sent', sent)
+    record_task_items('emails_failed', failed)
+    return sent
+
+
+@shared_task
+def generate_preview_variants(model_name: str, pk: int, force: bool = False):
+    """
+    Генерирует уменьшенные копии превью курса или урока (config/images.py).
+    Идемпотентна: для уже обработанного файла ничего не делает.
+    """
+    from django.apps import apps
+
+    from config.images import process_image_field
+
+    model = apps.get_model('materials', model_name)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return False
+    changed = process_image_field(instance, 'preview', force=force)
+    record_task_items('images_processed', int(changed))
+    return changed
+
+
+@shared_task
+def repair_course_counters():
+    """Исправляет расхождения денормализованных счётчиков курсов (materials/counters.py)."""
+    from .counters import repair_counters
+
+    repaired = repair_counters()
+    record_task_items('counters_repaired', repaired)
+    return repaired
+
+
+@shared_task
+def refresh_course_leaderboards():
+    """Пересчитывает рейтинг популярности курсов за сутки, неделю и месяц."""
+    from .counters import refresh_leaderboards
+
+    return refresh_leaderboards(settings.LEADERBOARD_SIZE)
+
+
+@shared_task
+def rebuild_autocomplete_index():
+    """
+    Перестраивает общий индекс автодополнения в Redis (обновляет веса).
+    Индекс в памяти каждый процесс перестраивает сам в фоновом потоке.
+    """
+    from .autocomplete import get_index
+
+    if settings.AUTOCOMPLETE_BACKEND != 'redis' or not settings.AUTOCOMPLETE_REBUILD_SECONDS:
+        return False
+    get_index().build()
+    return True
+
+
+@shared_task
+def purge_sync_tombstones():
+    """Удаляет устаревшие записи об удалениях для дельта-синхронизации."""
+    from .sync import purge_tombstones
+
+    return purge_tombstones()
+
+
+@shared_task
+def dispatch_outbox():
+    """Публикует задачи из транзакционного outbox в брокер (config/outbox.py)."""
+    from config.outbox import dispatch
+
+    published, failed = dispatch(settings.OUTBOX_BATCH_SIZE)
+    record_task_items('outbox_published', published)
+    record_task_items('outbox_failed', failed)
+    return published
+
+
+# acks_late: задача, прерванная падением воркера, вернётся в очередь брокера
+@shared_task(acks_late=True)
+def delete_course_chunked(deletion_id: int):
+    """Удаляет скрытый курс и его зависимые объекты пачками (materials/deletion.py)."""
+    from .deletion import run
+
+    deletion = run(deletion_id, settings.COURSE_DELETE_BATCH_SIZE)
+    return deletion.status if deletion else None
+
+
+@shared_task
+def resume_course_deletions():
+    """Возобновляет фоновые удаления курсов, прерванные падением воркера."""
+    from .deletion import resume_stale
+
+    resumed = resume_stale()
+    record_task_items('course_deletions_resumed', resumed)
+    return resumed
+
+
+@shared_task
+def delete_courses(course_ids: list):
+    """Массовое удаление курсов из админки: каждый скрывается и удаляется пачками в фоне."""
+    from django.db import transaction
+
+    from .deletion import hide
+    from .models import Course
+
+    hidden = 0
+    for course in Course.objects.filter(pk__in=course_ids, deleted_at__isnull=True):
+        try:
+            with transaction.atomic():
+                hide(course)
+        except Course.DoesNotExist:
+            continue
+        hidden += 1
+    record_task_items('courses_hidden', hidden)
+    return hidden
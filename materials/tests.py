@@ -1,11 +1,60 @@
+import json
+import os
+import smtplib
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
 from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
+from PIL import Image
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
 from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from users.models import User
-from .models import Course, Lesson, Subscription
+from config import throttling
+from config.db_router import ReplicaRouter, ReplicaRoutingMiddleware, use_primary, use_replica
+from config.mailer import PooledMailer, is_transient
+from config.schema import schema_path
+from config.storage import ContentAddressedStorage, connect_signals, disconnect_signals
+from users.management.commands.media_gc import Command as MediaGcCommand
+from users.models import Payment, User
+from . import autocomplete
+from .subscriptions import subscribed_course_ids
+from .sync import changes, encode_token
+from .models import Course, CourseDeletion, CoursePopularity, Lesson, MediaBlob, OutboxMessage, Subscription, Tombstone
+from .paginators import MaterialsPagination
+from .tasks import (
+    dispatch_outbox,
+    generate_preview_variants,
+    refresh_course_leaderboards,
+    repair_course_counters,
+    resume_course_deletions,
+    send_course_update_emails,
+)
 
 
 class BaseAPITestCase(APITestCase):
@@ -15,6 +64,9 @@ class BaseAPITestCase(APITestCase):
 
     def setUp(self) -> None:
         super().setUp()
+        # Кэш подписок, прочие кэши и вёдра ограничения частоты не переживают тест
+        cache.clear()
+        throttling.reset()
         # Группа модераторов
         self.moderators_group, _ = Group.objects.get_or_create(name="moderators")
 
@@ -145,6 +197,62 @@ class LessonCRUDTests(BaseAPITestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+class AccessMatrixTests(BaseAPITestCase):
+    """
+    Матрица доступа (роль x действие -> код ответа) для курсов и уроков.
+    Фиксирует поведение, включая различие 403 (объект есть, нет прав)
+    и 404 (объект вне выборки пользователя).
+    """
+    ROLES = ("owner", "other_user", "moderator")
+    # Коды для владельца, другого пользователя и модератора
+    MATRIX = {
+        ("course-detail", "get"): (200, 200, 200),
+        ("course-detail", "patch"): (200, 403, 200),
+        ("course-detail", "delete"): (204, 403, 403),
+        ("lesson-retrieve", "get"): (200, 404, 200),
+        ("lesson-update", "patch"): (200, 404, 200),
+        ("lesson-destroy", "delete"): (204, 403, 403),
+    }
+
+    def request(self, route, method, role, pk=None):
+        self.client.force_authenticate(user=getattr(self, role))
+        pk = pk or (self.course.pk if route.startswith("course") else self.lesson.pk)
+        url = reverse(route, args=[pk])
+        payload = {"title": "Changed"} if method == "patch" else None
+        return getattr(self.client, method)(url, payload, format="json").status_code
+
+    def test_matrix(self):
+        for (route, method), codes in self.MATRIX.items():
+            for role, expected in zip(self.ROLES, codes):
+                with self.subTest(route=route, method=method, role=role), transaction.atomic():
+                    self.assertEqual(self.request(route, method, role), expected)
+                    transaction.set_rollback(True)
+
+    def test_moderator_owning_course_still_cannot_delete(self):
+        self.course.owner = self.moderator
+        self.course.save()
+        self.assertEqual(self.request("course-detail", "delete", "moderator"), status.HTTP_403_FORBIDDEN)
+
+    def test_object_fetch_is_filtered_in_one_query(self):
+        self.client.force_authenticate(user=self.owner)
+        # Проверка группы moderators и выборка урока с условием owner_id — без загрузки владельца
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("lesson-retrieve", args=[self.lesson.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_missing_objects_are_404_for_everyone(self):
+        for route, method in self.MATRIX:
+            for role in self.ROLES:
+                with self.subTest(route=route, method=method, role=role):
+                    self.assertEqual(self.request(route, method, role, pk=10 ** 6), status.HTTP_404_NOT_FOUND)
+
+    def test_non_numeric_course_lookup_is_404(self):
+        for method in ("get", "put", "patch", "delete"):
+            for role in self.ROLES:
+                with self.subTest(method=method, role=role):
+                    self.assertEqual(self.request("course-detail", method, role, pk="abc"), status.HTTP_404_NOT_FOUND)
+
+
 class SubscriptionTests(BaseAPITestCase):
     """
     Тесты функционала подписки на обновления курса.
@@ -167,6 +275,17 @@ class SubscriptionTests(BaseAPITestCase):
         self.assertEqual(response_unsubscribe.data["message"], "подписка удалена")
         self.assertFalse(Subscription.objects.filter(user=self.owner, course=self.course).exists())
 
+    @override_settings(THROTTLES={"subscription": {"rate": "1/min", "burst": 2, "keys": ["user"]}})
+    def test_toggle_is_rate_limited_per_user(self):
+        url = reverse("subscription-toggle")
+        payload = {"course_id": self.course.id}
+        self.client.force_authenticate(user=self.owner)
+        codes = [self.client.post(url, payload, format="json").status_code for _ in range(3)]
+        self.assertEqual(codes, [status.HTTP_200_OK, status.HTTP_200_OK, status.HTTP_429_TOO_MANY_REQUESTS])
+
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.client.post(url, payload, format="json").status_code, status.HTTP_200_OK)
+
     def test_course_serializer_shows_is_subscribed_flag(self):
         """
         Проверяем, что флаг is_subscribed корректно отображается для текущего пользователя.
@@ -186,3 +305,1266 @@ class SubscriptionTests(BaseAPITestCase):
         response_other = self.client.get(url_detail)
         self.assertEqual(response_other.status_code, status.HTTP_200_OK)
         self.assertFalse(response_other.data.get("is_subscribed"))
+
+
+class ServerTimingTests(BaseAPITestCase):
+    """
+    Тесты профилирующего middleware (заголовок Server-Timing).
+    """
+
+    def test_header_absent_when_disabled(self):
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(reverse("course-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_header_contains_phase_breakdown(self):
+        self.client.force_authenticate(user=self.owner)
+        with self.assertLogs("config.profiling", level="INFO") as logs:
+            response = self.client.get(reverse("course-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        phases = {part.split(";")[0] for part in response["Server-Timing"].split(", ")}
+        self.assertTrue({"auth", "perm", "db", "serialize", "render", "total"} <= phases)
+        self.assertIn('"server_timing"', logs.output[0])
+
+
+class MetricsTests(BaseAPITestCase):
+    """
+    Тесты эндпоинта /metrics.
+    """
+
+    def test_request_metrics_labelled_by_route(self):
+        self.client.force_authenticate(user=self.owner)
+        self.client.get(reverse("course-list"))
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",route="course-list",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{le="0.005",method="GET",route="course-list"}', body)
+        self.assertIn('http_request_db_queries_count{route="course-list"}', body)
+        self.assertIn("http_requests_in_progress", body)
+
+    def cache_requests(self):
+        body = self.client.get(reverse("metrics")).content.decode()
+        return {
+            (sample.labels["cache"], sample.labels["result"]): sample.value
+            for family in text_string_to_metric_families(body) if family.name == "cache_requests"
+            for sample in family.samples if sample.name == "cache_requests_total"
+        }
+
+    def test_cache_hit_ratio_counted(self):
+        from config.pagination import planner_estimate
+
+        cache.clear()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        before = self.cache_requests()
+
+        self.client.force_authenticate(user=self.other_user)
+        self.client.get(reverse("course-list"))
+        self.client.get(reverse("course-list"))
+        planner_estimate(Course.objects.all())
+        planner_estimate(Course.objects.all())
+
+        after = self.cache_requests()
+        for key in (("subscriptions", "miss"), ("subscriptions", "hit"),
+                    ("pagination_estimate", "miss"), ("pagination_estimate", "hit")):
+            with self.subTest(key=key):
+                self.assertEqual(after.get(key, 0) - before.get(key, 0), 1)
+
+    def test_metrics_forbidden_for_external_addresses(self):
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.5")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_worker_init_keeps_metrics_read_by_web(self):
+        from config.task_metrics import _ensure_multiprocess_dir
+
+        path = Path(tempfile.mkdtemp())
+        (path / "counter_1.db").write_bytes(b"")
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": str(path)}):
+            _ensure_multiprocess_dir()
+
+        self.assertTrue((path / "counter_1.db").exists())
+
+    def test_extra_dirs_include_per_container_subdirs(self):
+        from prometheus_client.mmap_dict import MmapedDict
+
+        from config.metrics import get_registry
+
+        root = Path(tempfile.mkdtemp())
+        for host, value in (("worker-a", 2.0), ("worker-b", 3.0)):
+            (root / host).mkdir()
+            values = MmapedDict(str(root / host / "counter_1.db"))
+            values.write_value(json.dumps(["demo_total", "demo_total", {}, "demo"]), value, 0.0)
+            values.close()
+        own = tempfile.mkdtemp()
+
+        with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": own}), \
+                self.settings(METRICS_EXTRA_DIRS=[str(root)]):
+            registry = get_registry()
+
+        self.assertEqual(registry.get_sample_value("demo_total"), 5.0)
+
+    def run_with_multiproc_dir(self, path, code):
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(path), "DJANGO_SETTINGS_MODULE": "config.settings"}
+        return subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).resolve().parent.parent,
+                              env=env, capture_output=True, text=True, timeout=60)
+
+    def test_import_does_not_require_multiproc_dir(self):
+        # manage.py migrate/check и импорт приложения Celery до создания каталога метрик
+        missing = Path(tempfile.mkdtemp()) / "missing"
+        result = self.run_with_multiproc_dir(missing, (
+            "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; "
+            "import config.celery"
+        ))
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertFalse(missing.exists())
+
+    def test_gunicorn_config_prepares_multiproc_dir(self):
+        # Порядок мастера gunicorn с preload_app: конфигурация, затем импорт приложения
+        missing = Path(tempfile.mkdtemp()) / "missing"
+        result = self.run_with_multiproc_dir(missing, (
+            "import os, runpy; os.environ.pop('GUNICORN_METRICS_DIR_READY', None); "
+            "runpy.run_path('gunicorn.conf.py'); "
+            "import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns; "
+            "from config.metrics import requests_in_progress; requests_in_progress().inc()"
+        ))
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertTrue(missing.is_dir())
+        self.assertTrue(any(missing.iterdir()))
+
+
+class CeleryMetricsTests(BaseAPITestCase):
+    """
+    Тесты метрик задач Celery и команды celery_stats.
+    """
+
+    def test_task_runtime_and_items_recorded(self):
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        task_name = send_course_update_emails.name
+        labels = {"task": task_name, "item": "emails_sent"}
+        sent_before = REGISTRY.get_sample_value("celery_task_items_total", labels) or 0
+        runs_labels = {"task": task_name, "state": "SUCCESS"}
+        runs_before = REGISTRY.get_sample_value("celery_task_runtime_seconds_count", runs_labels) or 0
+
+        result = send_course_update_emails.apply(args=[self.course.id])
+
+        self.assertEqual(result.get(), 1)
+        self.assertEqual(REGISTRY.get_sample_value("celery_task_items_total", labels), sent_before + 1)
+        self.assertEqual(
+            REGISTRY.get_sample_value("celery_task_runtime_seconds_count", runs_labels), runs_before + 1,
+        )
+
+        out = StringIO()
+        call_command("celery_stats", stdout=out)
+        self.assertIn(task_name, out.getvalue())
+        self.assertIn("emails_sent", out.getvalue())
+
+
+class AsyncReadEndpointsTests(BaseAPITestCase):
+    """
+    Async-эндпоинты чтения отдают те же данные, что и синхронные DRF-представления.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        Subscription.objects.create(user=self.owner, course=self.course)
+        Lesson.objects.create(title="Other lesson", course=self.course, owner=self.other_user)
+        token = RefreshToken.for_user(self.owner).access_token
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def assertSameAsSync(self, sync_url, async_url):
+        self.client.force_authenticate(user=self.owner)
+        expected = self.client.get(sync_url).json()
+        self.client.force_authenticate(user=None)
+        response = self.client.get(async_url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Ссылки пагинации ведут на тот же async-эндпоинт
+        self.assertEqual(json.loads(response.content.decode().replace("/api/async/", "/api/")), expected)
+
+    def test_course_list_and_detail(self):
+        self.assertSameAsSync(reverse("course-list"), reverse("async-course-list"))
+        self.assertSameAsSync(
+            reverse("course-detail", args=[self.course.id]),
+            reverse("async-course-detail", args=[self.course.id]),
+        )
+
+    def test_lesson_list_and_detail(self):
+        self.assertSameAsSync(reverse("lesson-list"), reverse("async-lesson-list"))
+        self.assertSameAsSync(
+            reverse("lesson-retrieve", args=[self.lesson.id]),
+            reverse("async-lesson-retrieve", args=[self.lesson.id]),
+        )
+
+    def test_pagination_links(self):
+        Course.objects.create(title="Second course", owner=self.owner)
+        query = "?page_size=1&page=2"
+        self.assertSameAsSync(reverse("course-list") + query, reverse("async-course-list") + query)
+
+    def test_foreign_lesson_not_found(self):
+        other_lesson = Lesson.objects.get(owner=self.other_user)
+        response = self.client.get(reverse("async-lesson-retrieve", args=[other_lesson.id]), **self.auth)
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_requires_token(self):
+        response = self.client.get(reverse("async-course-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+
+@override_settings(SCHEMA_ROOT=tempfile.mkdtemp())
+class SchemaTests(APITestCase):
+    """
+    Тесты предсобранной OpenAPI-схемы.
+    """
+
+    def test_schema_served_with_etag(self):
+        response = self.client.get(reverse("schema-json", kwargs={"format": ".json"}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("/courses/", response.json()["paths"])
+        self.assertIn("max-age", response["Cache-Control"])
+
+        cached = self.client.get(
+            reverse("schema-json", kwargs={"format": ".json"}), HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_generate_schema_command(self):
+        out = StringIO()
+        call_command("generate_schema", stdout=out)
+
+        self.assertTrue(schema_path("json").exists())
+        self.assertTrue(schema_path("yaml").exists())
+        response = self.client.get(reverse("schema-json", kwargs={"format": ".yaml"}))
+        self.assertEqual(response["Content-Type"], "application/yaml")
+
+
+class SearchTests(BaseAPITestCase):
+    """
+    Тесты полнотекстового поиска (в тестах — SQLite FTS5).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.force_authenticate(user=self.other_user)
+        self.python_course = Course.objects.create(
+            title="Python для начинающих", description="Основы языка", owner=self.owner,
+        )
+        self.django_lesson = Lesson.objects.create(
+            title="Модели Django", description="ORM и миграции, немного python", course=self.python_course,
+            owner=self.owner,
+        )
+
+    def search(self, q, **params):
+        return self.client.get(reverse("search"), {"q": q, **params})
+
+    def test_title_match_ranks_above_description_match(self):
+        response = self.search("python")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 2)
+        first, second = response.data["results"]
+        self.assertEqual((first["kind"], first["course_id"]), ("course", self.python_course.id))
+        self.assertEqual(second["kind"], "lesson")
+        self.assertEqual(second["lesson_id"], self.django_lesson.id)
+        self.assertEqual(second["course_title"], "Python для начинающих")
+        self.assertGreater(first["rank"], second["rank"])
+
+    def test_index_follows_writes(self):
+        self.django_lesson.title = "Сериализаторы DRF"
+        self.django_lesson.save()
+        self.assertEqual(self.search("сериализаторы").data["count"], 1)
+        self.assertEqual(self.search("модели").data["count"], 0)
+
+        self.django_lesson.delete()
+        self.assertEqual(self.search("сериализаторы").data["count"], 0)
+
+    def test_prefix_and_special_characters(self):
+        self.assertEqual(self.search("нач").data["count"], 1)
+        response = self.search('django" OR *')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1)
+
+    def test_pagination(self):
+        for i in range(3):
+            Lesson.objects.create(title=f"Python урок {i}", course=self.python_course, owner=self.owner)
+
+        response = self.search("python", page_size=2)
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+        last = self.client.get(response.data["next"].replace("page=2", "page=3"))
+        self.assertEqual(len(last.data["results"]), 1)
+        self.assertIsNone(last.data["next"])
+        self.assertEqual(self.search("python", page=9).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_query_required(self):
+        self.assertEqual(self.search("  ").status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AutocompleteTests(BaseAPITestCase):
+    """
+    Тесты автодополнения по индексу в памяти.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        autocomplete._index = None
+        self.addCleanup(setattr, autocomplete, "_index", None)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {RefreshToken.for_user(self.other_user).access_token}"}
+        self.popular = Course.objects.create(title="Python для начинающих", owner=self.owner)
+        Subscription.objects.create(user=self.other_user, course=self.popular)
+        self.rare = Course.objects.create(title="Python: продвинутый уровень", owner=self.owner)
+
+    def suggest(self, q, **params):
+        response = self.client.get(reverse("autocomplete"), {"q": q, **params}, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(hit["kind"], hit["id"]) for hit in response.data["results"]]
+
+    def test_prefix_ranked_by_popularity_without_db(self):
+        autocomplete.get_index().build()
+
+        with self.assertNumQueries(0):
+            hits = self.suggest("PYTH")
+
+        self.assertEqual(hits, [("course", self.popular.id), ("course", self.rare.id)])
+        self.assertEqual(self.suggest("продвин"), [("course", self.rare.id)])
+        self.assertEqual(self.suggest("pyth", limit=1), [("course", self.popular.id)])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_index_updated_from_signals(self):
+        autocomplete.get_index().build()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(title="Асинхронный Python", course=self.popular, owner=self.owner)
+        self.assertIn(("lesson", lesson.id), self.suggest("асинх"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.title = "Генераторы"
+            lesson.save()
+        self.assertEqual(self.suggest("асинх"), [])
+        self.assertEqual(self.suggest("генер"), [("lesson", lesson.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.delete()
+        self.assertEqual(self.suggest("генер"), [])
+
+    def test_popular_item_ranked_among_all_matches(self):
+        # Первые по алфавиту совпадения — непопулярные курсы
+        Course.objects.bulk_create(
+            [Course(title=f"Python {n:04d}", owner=self.owner) for n in range(600)]
+        )
+        autocomplete.get_index().build()
+
+        # Тяжёлые префиксы читаются из узла, лёгкие — ограниченным проходом
+        with mock.patch.object(autocomplete.MemoryPrefixIndex, "_scan") as scan:
+            self.assertEqual(self.suggest("pyt", limit=1), [("course", self.popular.id)])
+            self.assertEqual(self.suggest("python", limit=1), [("course", self.popular.id)])
+        scan.assert_not_called()
+        self.assertEqual(len(self.suggest("python 05", limit=20)), 20)
+
+    def test_light_prefix_scan_is_bounded(self):
+        Course.objects.bulk_create(
+            [Course(title=f"Python {n:04d}", owner=self.owner) for n in range(30)]
+        )
+        with mock.patch.object(autocomplete, "SCAN_LIMIT", 1000):
+            autocomplete.get_index().build()
+        self.assertEqual(autocomplete.get_index()._nodes, {})
+
+        # Префикс стал тяжёлым после построения: просматривается не больше SCAN_LIMIT ключей
+        with mock.patch.object(autocomplete, "SCAN_LIMIT", 5):
+            self.assertEqual(len(self.suggest("python 00", limit=20)), 5)
+
+    @mock.patch.object(autocomplete, "TOP_K", 2)
+    @mock.patch.object(autocomplete, "SCAN_LIMIT", 1)
+    def test_heavy_prefix_node_updated_on_change(self):
+        index = autocomplete.get_index()
+        index.build()
+        self.assertEqual(self.suggest("py"), [("course", self.popular.id), ("course", self.rare.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson = Lesson.objects.create(title="Pyramid", course=self.popular, owner=self.owner)
+        # Урок популярного курса с коротким названием — первый, узел обрезан до TOP_K
+        self.assertEqual(self.suggest("py"), [("lesson", lesson.id), ("course", self.popular.id)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lesson.delete()
+        # Вытесненный элемент возвращается в узел при перестройке
+        self.assertEqual(self.suggest("py"), [("course", self.popular.id)])
+        index.build()
+        self.assertEqual(self.suggest("py"), [("course", self.popular.id), ("course", self.rare.id)])
+
+    def test_heavy_prefix_nodes_match_full_ranking(self):
+        titles = ["Основы", "Основы Python", "Основание", "Осень", "Ось", "Python основы"]
+        items = [(f"i{n}", title_, n % 3) for n, title_ in enumerate(titles * 5)]
+        keys = sorted(key for _, title_, _ in items for key in autocomplete.title_keys(title_))
+        ranked = sorted(
+            ((autocomplete._rank(title_, weight), ref), autocomplete.title_keys(title_))
+            for ref, title_, weight in items
+        )
+
+        with mock.patch.object(autocomplete, "SCAN_LIMIT", 4), mock.patch.object(autocomplete, "TOP_K", 3):
+            heavy = autocomplete.heavy_prefixes(keys)
+            nodes = autocomplete.top_nodes(ranked, heavy)
+
+        for prefix in ("о", "ос", "осн", "основ", "python"):
+            expected = [entry for entry, item_keys in ranked if any(k.startswith(prefix) for k in item_keys)]
+            with self.subTest(prefix=prefix):
+                self.assertEqual(prefix in heavy, sum(key.startswith(prefix) for key in keys) > 4)
+                if prefix in heavy:
+                    self.assertEqual(nodes[prefix], expected[:3])
+
+    @override_settings(AUTOCOMPLETE_REBUILD_SECONDS=60)
+    def test_stale_index_rebuilt_in_background(self):
+        index = autocomplete.get_index()
+        index.build()
+        index._built_at -= 120
+
+        with mock.patch.object(index, "build") as build, self.assertNumQueries(0):
+            hits = self.suggest("pyth")
+            index._build_thread.join(5)
+
+        self.assertEqual(hits, [("course", self.popular.id), ("course", self.rare.id)])
+        build.assert_called_once_with()
+
+    def test_lookup_does_not_build_in_request(self):
+        with mock.patch.object(autocomplete.MemoryPrefixIndex, "build") as build:
+            self.assertEqual(self.suggest("pyth"), [])
+            autocomplete.get_index()._build_thread.join(5)
+
+        build.assert_called_once_with()
+
+
+# В тестах нет Redis: общий кэш меток заменён кэшем default в памяти
+@override_settings(DATABASE_REPLICAS=["replica1"], REPLICA_STICKY_SECONDS=10, REPLICA_STICKY_CACHE="default")
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Тесты роутера реплик: в какую БД уходит чтение в разных контекстах.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def call(self, method, user=None, status_code=200):
+        """Запрос через middleware; view, как DRF, записывает пользователя в request.user."""
+        seen = {}
+
+        def view(request):
+            if user is not None:
+                request.user = user
+            seen["db"] = self.router.db_for_read(Course)
+            return HttpResponse(status=status_code)
+
+        request = getattr(self.factory, method)("/api/courses/")
+        ReplicaRoutingMiddleware(view)(request)
+        return seen["db"]
+
+    def test_reads_outside_request_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Course), "default")
+        with use_replica():
+            self.assertEqual(self.router.db_for_read(Course), "replica1")
+            self.assertEqual(self.router.db_for_write(Course), "default")
+            with use_primary():
+                self.assertEqual(self.router.db_for_read(Course), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "materials"))
+
+    def test_safe_methods_read_from_replica(self):
+        self.assertEqual(self.call("get"), "replica1")
+        self.assertEqual(self.call("post"), "default")
+
+    def test_user_sticks_to_primary_after_write(self):
+        writer, reader = User(pk=1), User(pk=2)
+
+        self.call("post", user=writer, status_code=400)
+        self.assertEqual(self.call("get", user=writer), "replica1")
+
+        self.call("post", user=writer, status_code=201)
+        self.assertEqual(self.call("get", user=writer), "default")
+        self.assertEqual(self.call("get", user=reader), "replica1")
+
+    def test_sticky_marks_kept_in_shared_cache(self):
+        from config import settings as project_settings
+
+        backend = project_settings.CACHES[project_settings.REPLICA_STICKY_CACHE]["BACKEND"]
+        self.assertEqual(backend, "django.core.cache.backends.redis.RedisCache")
+
+    def test_unavailable_sticky_cache_reads_from_primary(self):
+        broken = mock.Mock()
+        broken.get.side_effect = ConnectionError
+        broken.set.side_effect = ConnectionError
+
+        with mock.patch("config.db_router._sticky_cache", return_value=broken):
+            self.assertEqual(self.call("post", user=User(pk=1), status_code=201), "default")
+            self.assertEqual(self.call("get", user=User(pk=1)), "default")
+
+    def test_lazy_user_is_not_evaluated(self):
+        def load_user():
+            raise AssertionError("request.user не должен вычисляться роутером")
+
+        request = self.factory.get("/api/courses/")
+        request.user = SimpleLazyObject(load_user)
+        seen = {}
+
+        def view(request):
+            seen["db"] = self.router.db_for_read(Course)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        self.assertEqual(seen["db"], "replica1")
+
+
+def make_image(name="preview.jpg", size=(1200, 800), fmt="JPEG", color=(200, 40, 40)):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESS_POOL_SIZE=0)
+class ImageVariantsTests(BaseAPITestCase):
+    """
+    Тесты генерации вариантов превью.
+    """
+
+    def upload(self, course, name="preview.jpg", color=(200, 40, 40)):
+        with self.captureOnCommitCallbacks(execute=True):
+            course.preview = make_image(name, color=color)
+            course.save()
+        course.refresh_from_db()
+        return course.preview_variants
+
+    def test_variants_generated_on_upload(self):
+        variants = self.upload(self.course)
+
+        self.assertEqual(variants["source"], self.course.preview.name)
+        self.assertEqual((variants["width"], variants["height"]), (1200, 800))
+        self.assertTrue(variants["placeholder"].startswith("data:image/webp;base64,"))
+        storage = self.course.preview.storage
+        thumb = variants["sizes"]["thumb"]
+        with storage.open(thumb["webp"]) as f:
+            self.assertEqual(Image.open(f).size, (320, 180))
+        self.assertTrue(storage.exists(thumb["jpeg"]))
+
+        self.client.force_authenticate(user=self.owner)
+        data = self.client.get(reverse("course-detail", args=[self.course.id])).data["preview_variants"]
+        self.assertTrue(data["card"]["webp"].startswith("http://testserver/media/courses/variants/"))
+        self.assertEqual(data["placeholder"], variants["placeholder"])
+
+    def test_variants_bump_updated_at_for_sync(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.preview = make_image()
+            self.course.save()
+        earlier = timezone.now() - timedelta(hours=1)
+        Course.objects.filter(pk=self.course.pk).update(updated_at=earlier)
+
+        generate_preview_variants.apply(args=["course", self.course.id], kwargs={"force": True})
+
+        self.course.refresh_from_db()
+        self.assertGreater(self.course.updated_at, earlier)
+
+    def test_pipeline_is_idempotent_and_cleans_up(self):
+        old = self.upload(self.course)
+        self.assertFalse(generate_preview_variants.apply(args=["course", self.course.id]).result)
+
+        new = self.upload(self.course, "other.jpg", color=(40, 200, 40))
+        storage = self.course.preview.storage
+        self.assertNotEqual(new["sizes"]["thumb"]["jpeg"], old["sizes"]["thumb"]["jpeg"])
+        self.assertFalse(storage.exists(old["sizes"]["thumb"]["jpeg"]))
+        self.assertTrue(storage.exists(new["sizes"]["thumb"]["jpeg"]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.preview = None
+            self.course.save()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.preview_variants, {})
+        self.assertFalse(storage.exists(new["sizes"]["thumb"]["jpeg"]))
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESS_POOL_SIZE=0,
+    STORAGES={
+        "default": {"BACKEND": "config.storage.ContentAddressedStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+)
+class DedupStorageTests(BaseAPITestCase):
+    """
+    Тесты хранилища с дедупликацией по содержимому и сборки мусора.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        connect_signals()
+        self.addCleanup(disconnect_signals)
+
+    def lesson_with_preview(self, color=(10, 10, 10)):
+        return Lesson.objects.create(
+            title="Урок", course=self.course, owner=self.owner, preview=make_image(color=color),
+        )
+
+    def test_same_content_stored_once(self):
+        first, second = self.lesson_with_preview(), self.lesson_with_preview()
+
+        self.assertEqual(first.preview.name, second.preview.name)
+        self.assertTrue(first.preview.name.startswith("blobs/"))
+        self.assertEqual(MediaBlob.objects.get(name=first.preview.name).refcount, 2)
+
+        second.preview = make_image(color=(250, 250, 250))
+        second.save()
+        self.assertEqual(MediaBlob.objects.get(name=first.preview.name).refcount, 1)
+        self.assertEqual(MediaBlob.objects.count(), 2)
+
+    def test_gc_removes_unreferenced_blobs_only(self):
+        kept, dropped = self.lesson_with_preview(), self.lesson_with_preview(color=(0, 90, 0))
+        dropped_name = dropped.preview.name
+        dropped.delete()
+        storage = kept.preview.storage
+        self.assertTrue(storage.exists(dropped_name))
+
+        out = StringIO()
+        call_command("media_gc", "--grace-hours", "0", stdout=out)
+
+        self.assertFalse(storage.exists(dropped_name))
+        self.assertFalse(MediaBlob.objects.filter(name=dropped_name).exists())
+        self.assertTrue(storage.exists(kept.preview.name))
+        self.assertIn("удалено: 1", out.getvalue())
+
+    def test_gc_skips_blob_referenced_after_selection(self):
+        dropped = self.lesson_with_preview(color=(0, 90, 0))
+        name = dropped.preview.name
+        dropped.delete()
+        candidates = MediaGcCommand._candidates
+
+        def select_then_upload(threshold):
+            selected = candidates(threshold)
+            # Параллельная загрузка того же содержимого между выборкой и удалением
+            self.lesson_with_preview(color=(0, 90, 0))
+            return selected
+
+        with mock.patch.object(MediaGcCommand, "_candidates", side_effect=select_then_upload):
+            call_command("media_gc", "--grace-hours", "0", stdout=StringIO())
+
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(dropped.preview.storage.exists(name))
+
+    def test_gc_keeps_grace_period_for_blob_reused_after_selection(self):
+        dropped = self.lesson_with_preview(color=(90, 0, 0))
+        name = dropped.preview.name
+        dropped.delete()
+        MediaBlob.objects.filter(name=name).update(updated_at=timezone.now() - timedelta(hours=2))
+        candidates = MediaGcCommand._candidates
+
+        def select_then_reuse(threshold):
+            selected = candidates(threshold)
+            # Между выборкой и удалением блоб получил ссылку и снова её потерял
+            self.lesson_with_preview(color=(90, 0, 0)).delete()
+            return selected
+
+        with mock.patch.object(MediaGcCommand, "_candidates", side_effect=select_then_reuse):
+            call_command("media_gc", "--grace-hours", "1", stdout=StringIO())
+
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 0)
+        self.assertTrue(dropped.preview.storage.exists(name))
+
+    def test_upload_restores_file_purged_before_its_reference(self):
+        dropped = self.lesson_with_preview(color=(0, 0, 90))
+        name, storage = dropped.preview.name, dropped.preview.storage
+        dropped.delete()
+        incref = ContentAddressedStorage._incref
+
+        def gc_then_incref(storage_self, *args):
+            # media_gc успевает удалить блоб, пока загрузка хэширует тот же файл
+            pk = MediaBlob.objects.get(name=name).pk
+            self.assertTrue(MediaGcCommand._purge(storage_self, pk, timezone.now()))
+            return incref(storage_self, *args)
+
+        with mock.patch.object(ContentAddressedStorage, "_incref", autospec=True, side_effect=gc_then_incref):
+            lesson = self.lesson_with_preview(color=(0, 0, 90))
+
+        self.assertEqual(lesson.preview.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refcount, 1)
+        self.assertTrue(storage.exists(name))
+
+    def test_recount_repairs_drift(self):
+        lesson = self.lesson_with_preview()
+        MediaBlob.objects.filter(name=lesson.preview.name).update(refcount=0)
+
+        call_command("media_gc", "--recount", "--grace-hours", "0", stdout=StringIO())
+
+        self.assertEqual(MediaBlob.objects.get(name=lesson.preview.name).refcount, 1)
+        self.assertTrue(lesson.preview.storage.exists(lesson.preview.name))
+
+
+class CourseCountersTests(BaseAPITestCase):
+    """
+    Денормализованные счётчики курса и рейтинг популярности.
+    """
+
+    def counts(self, course=None):
+        course = Course.objects.get(pk=(course or self.course).pk)
+        return course.subscriber_count, course.lesson_count, course.paid_count
+
+    def test_counters_follow_subscriptions_lessons_and_payments(self):
+        self.assertEqual(self.counts(), (0, 1, 0))
+
+        self.client.force_authenticate(user=self.other_user)
+        url = reverse("subscription-toggle")
+        self.client.post(url, {"course_id": self.course.id}, format="json")
+        Payment.objects.create(user=self.other_user, amount=1000, payment_method="transfer", paid_course=self.course)
+        Lesson.objects.create(title="Second lesson", course=self.course, owner=self.owner)
+        self.assertEqual(self.counts(), (1, 2, 1))
+
+        self.client.post(url, {"course_id": self.course.id}, format="json")
+        self.lesson.delete()
+        self.assertEqual(self.counts(), (0, 1, 1))
+
+        response = self.client.get(reverse("course-detail", args=[self.course.id]))
+        self.assertEqual(response.data["lesson_count"], 1)
+        self.assertEqual(response.data["paid_count"], 1)
+
+    def test_counters_are_read_only_in_api(self):
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.patch(
+            reverse("course-detail", args=[self.course.id]), {"subscriber_count": 999}, format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counts()[0], 0)
+
+    def test_repair_task_fixes_drift(self):
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        untouched = Course.objects.create(title="Untouched", owner=self.owner)
+        Course.objects.filter(pk=self.course.pk).update(subscriber_count=7, lesson_count=0)
+
+        self.assertEqual(repair_course_counters.delay().get(), 1)
+        self.assertEqual(self.counts(), (1, 1, 0))
+        self.assertEqual(self.counts(untouched), (0, 0, 0))
+
+    def test_leaderboard_overall_and_by_window(self):
+        popular = Course.objects.create(title="Popular", owner=self.owner)
+        for user in (self.owner, self.other_user):
+            Subscription.objects.create(user=user, course=popular)
+        Subscription.objects.create(user=self.owner, course=self.course)
+        Payment.objects.create(user=self.owner, amount=1000, payment_method="transfer", paid_course=self.course)
+        # Старая подписка не попадает в рейтинг за сутки
+        Subscription.objects.filter(course=popular, user=self.owner).update(
+            created_at=timezone.now() - timedelta(days=3),
+        )
+        refresh_course_leaderboards.delay()
+        self.client.force_authenticate(user=self.other_user)
+        url = reverse("course-leaderboard")
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["course_id"] for row in response.data["results"]], [popular.id, self.course.id])
+
+        response = self.client.get(url, {"window": "day"})
+        self.assertEqual([row["course_id"] for row in response.data["results"]], [self.course.id, popular.id])
+        self.assertEqual(response.data["results"][0]["payments"], 1)
+        self.assertEqual(CoursePopularity.objects.get(window="week", course=popular).subscribers, 2)
+
+        response = self.client.get(url, {"window": "week", "limit": 1})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(self.client.get(url, {"window": "year"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_leaderboard_counts_without_join(self):
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        for _ in range(3):
+            Payment.objects.create(user=self.owner, amount=1000, payment_method="transfer", paid_course=self.course)
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_course_leaderboards.delay()
+
+        ranking = [query["sql"] for query in queries if "materials_course" in query["sql"] and "LIMIT" in query["sql"]]
+        self.assertEqual(len(ranking), 3)
+        self.assertNotIn("DISTINCT", ranking[0])
+        self.assertNotIn("JOIN", ranking[0])
+        row = CoursePopularity.objects.get(window="day", course=self.course)
+        self.assertEqual((row.subscribers, row.payments, row.score), (1, 3, 10))
+
+
+class SubscribedCoursesCacheTests(BaseAPITestCase):
+    """
+    Кэш id курсов с подпиской для is_subscribed.
+    """
+
+    def test_list_checks_subscriptions_in_memory(self):
+        courses = [Course.objects.create(title=f"Course {i}", owner=self.owner) for i in range(5)]
+        for course in courses[::2]:
+            Subscription.objects.create(user=self.other_user, course=course)
+        self.client.force_authenticate(user=self.other_user)
+        url = reverse("course-list")
+
+        first = self.client.get(url)
+        flags = {row["id"]: row["is_subscribed"] for row in first.data["results"]}
+        self.assertEqual({pk for pk, flag in flags.items() if flag}, {course.pk for course in courses[::2]})
+
+        # Повторный запрос: множество берётся из кэша, без запросов к подпискам
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(url)
+        self.assertEqual(first.data["results"], second.data["results"])
+        self.assertFalse([q for q in queries.captured_queries if "materials_subscription" in q["sql"]])
+
+    def test_toggle_resets_cached_set(self):
+        self.client.force_authenticate(user=self.other_user)
+        self.assertNotIn(self.course.pk, subscribed_course_ids(self.other_user))
+        url = reverse("subscription-toggle")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"course_id": self.course.id}, format="json")
+        self.assertIn(self.course.pk, subscribed_course_ids(self.other_user))
+        with self.assertNumQueries(0):
+            self.assertIn(self.course.pk, subscribed_course_ids(self.other_user))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {"course_id": self.course.id}, format="json")
+        self.assertNotIn(self.course.pk, subscribed_course_ids(self.other_user))
+        response = self.client.get(reverse("course-detail", args=[self.course.id]))
+        self.assertFalse(response.data["is_subscribed"])
+
+    def test_change_seen_by_other_worker_of_shared_cache(self):
+        # Два клиента одного общего хранилища — как два воркера с Redis
+        worker_a, worker_b = LocMemCache("subscriptions-shared", {}), LocMemCache("subscriptions-shared", {})
+
+        with mock.patch("materials.subscriptions._cache", return_value=worker_a):
+            self.assertNotIn(self.course.pk, subscribed_course_ids(self.other_user))
+        with mock.patch("materials.subscriptions._cache", return_value=worker_b), \
+                self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(user=self.other_user, course=self.course)
+        with mock.patch("materials.subscriptions._cache", return_value=worker_a):
+            self.assertIn(self.course.pk, subscribed_course_ids(self.other_user))
+
+    @override_settings(SUBSCRIPTIONS_LOCAL_CACHE_TTL=5)
+    def test_process_local_cache_expires_quickly(self):
+        # Кэши двух процессов: сброс ключа в одном не виден другому
+        worker_a, worker_b = LocMemCache("subscriptions-a", {}), LocMemCache("subscriptions-b", {})
+
+        with mock.patch("materials.subscriptions._cache", return_value=worker_a):
+            self.assertNotIn(self.course.pk, subscribed_course_ids(self.other_user))
+        with mock.patch("materials.subscriptions._cache", return_value=worker_b), \
+                self.captureOnCommitCallbacks(execute=True):
+            Subscription.objects.create(user=self.other_user, course=self.course)
+
+        key = worker_a.make_key(f"materials:subscribed:{self.other_user.pk}")
+        self.assertLessEqual(worker_a._expire_info[key] - time.time(), 5)
+        with mock.patch("materials.subscriptions._cache", return_value=worker_a), \
+                mock.patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + 6):
+            self.assertIn(self.course.pk, subscribed_course_ids(self.other_user))
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class DeltaSyncTests(BaseAPITestCase):
+    """
+    Дельта-синхронизация курсов и уроков по токену изменений.
+    """
+
+    def sync(self, token=None, **params):
+        if token:
+            params["token"] = token
+        response = self.client.get(reverse("sync"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    @override_settings(DATABASE_REPLICAS=["replica1"], REPLICA_STICKY_CACHE="default")
+    def test_sync_reads_from_primary(self):
+        from config import db_router
+        from . import views
+
+        read_states = []
+
+        def spy(*args):
+            # Разрешение читать с реплики в момент выборки изменений (None — только primary)
+            read_states.append(db_router._state.get())
+            return changes(*args)
+
+        self.client.force_authenticate(user=self.owner)
+        with mock.patch.object(views, "changes", side_effect=spy):
+            data = self.sync()
+
+        self.assertEqual(read_states, [None])
+        self.assertEqual([course["id"] for course in data["courses"]], [self.course.id])
+
+    def test_full_sync_is_paginated_by_token(self):
+        extra = [Course.objects.create(title=f"Course {i}", owner=self.owner) for i in range(3)]
+        Lesson.objects.create(title="Foreign lesson", course=self.course, owner=self.other_user)
+        self.client.force_authenticate(user=self.owner)
+
+        course_ids, lesson_ids, token, pages = [], [], None, 0
+        while True:
+            data = self.sync(token, limit=2)
+            course_ids += [row["id"] for row in data["courses"]]
+            lesson_ids += [row["id"] for row in data["lessons"]]
+            token, pages = data["token"], pages + 1
+            if not data["has_more"]:
+                break
+        self.assertEqual(pages, 2)
+        self.assertEqual(course_ids, [self.course.id] + [course.id for course in extra])
+        self.assertNotIn("lessons", self.sync(limit=1)["courses"][0])
+        # Не-модератор получает только свои уроки
+        self.assertEqual(lesson_ids, [self.lesson.id])
+
+    def test_incremental_sync_returns_only_changes(self):
+        untouched = Course.objects.create(title="Untouched", owner=self.owner)
+        doomed = Course.objects.create(title="Doomed", owner=self.owner)
+        doomed_lesson = Lesson.objects.create(title="Doomed lesson", course=doomed, owner=self.owner)
+        self.client.force_authenticate(user=self.owner)
+        token = self.sync()["token"]
+
+        self.assertEqual(self.sync(token)["courses"], [])
+        self.lesson.title = "Renamed"
+        self.lesson.save()
+        doomed_id = doomed.id
+        doomed.delete()
+
+        data = self.sync(token)
+        self.assertEqual([row["id"] for row in data["lessons"]], [self.lesson.id])
+        self.assertEqual(data["lessons"][0]["title"], "Renamed")
+        self.assertNotIn(untouched.id, [row["id"] for row in data["courses"]])
+        self.assertEqual(data["deleted"], {"courses": [doomed_id], "lessons": [doomed_lesson.id]})
+        self.assertFalse(data["has_more"])
+
+        data = self.sync(data["token"])
+        self.assertEqual((data["courses"], data["lessons"], data["deleted"]),
+                         ([], [], {"courses": [], "lessons": []}))
+
+    def test_invalid_and_expired_tokens(self):
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(reverse("sync"), {"token": "forged"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        old = timezone.now() - timedelta(days=365)
+        token = encode_token({"courses": (old, 0), "lessons": (old, 0), "deleted": (old, 0)})
+        response = self.client.get(reverse("sync"), {"token": token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+
+class OutboxTests(BaseAPITestCase):
+    """
+    Транзакционный outbox: рассылка об обновлении ставится в таблицу
+    вместе с изменением и отправляется диспетчером.
+    """
+
+    def test_course_update_writes_outbox_instead_of_broker(self):
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        self.client.force_authenticate(user=self.owner)
+
+        response = self.client.patch(
+            reverse("course-detail", args=[self.course.id]), {"title": "New title"}, format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.task, message.args), (send_course_update_emails.name, [self.course.id]))
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(dispatch_outbox.delay().get(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(mail.outbox[0].to, [self.other_user.email])
+
+    def test_lesson_update_notifies_only_for_stale_course(self):
+        self.client.force_authenticate(user=self.owner)
+        url = reverse("lesson-update", args=[self.lesson.id])
+        Course.objects.filter(pk=self.course.pk).update(updated_at=timezone.now() - timedelta(hours=5))
+
+        self.client.patch(url, {"title": "First"}, format="json")
+        self.client.patch(url, {"title": "Second"}, format="json")
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_failed_publish_is_retried_later(self):
+        OutboxMessage.objects.create(task="materials.tasks.missing_task", args=[1])
+
+        self.assertEqual(dispatch_outbox.delay().get(), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn("missing_task", message.last_error)
+        self.assertGreater(message.available_at, timezone.now())
+        # До истечения задержки сообщение не берётся повторно
+        dispatch_outbox.delay()
+        self.assertEqual(OutboxMessage.objects.get().attempts, 1)
+
+    @override_settings(OUTBOX_DISPATCH_ON_COMMIT=True)
+    def test_dispatched_on_commit_without_beat(self):
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        self.client.force_authenticate(user=self.owner)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse("course-detail", args=[self.course.id]), {"title": "New title"}, format="json")
+
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(mail.outbox[0].to, [self.other_user.email])
+
+
+class ScriptedBackend(BaseEmailBackend):
+    """Почтовый бэкенд для тестов: отвечает заданными кодами SMTP по очереди."""
+    replies = []
+    opened = 0
+    delivered = []
+
+    def open(self):
+        ScriptedBackend.opened += 1
+
+    def send_messages(self, email_messages):
+        code = ScriptedBackend.replies.pop(0) if ScriptedBackend.replies else 250
+        if code != 250:
+            raise smtplib.SMTPDataError(code, b"scripted")
+        ScriptedBackend.delivered.extend(email_messages)
+        return len(email_messages)
+
+
+class PooledMailerTests(BaseAPITestCase):
+    """
+    Рассылка через пул соединений: письмо на получателя, повтор 4xx, лимит на соединение.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        ScriptedBackend.replies, ScriptedBackend.opened, ScriptedBackend.delivered = [], 0, []
+
+    def mailer(self, **kwargs):
+        kwargs.setdefault("workers", 1)
+        return PooledMailer(backend="materials.tests.ScriptedBackend", backoff=0, **kwargs)
+
+    @staticmethod
+    def messages(count):
+        return [EmailMessage("s", "b", "noreply@example.com", [f"u{i}@example.com"]) for i in range(count)]
+
+    def test_update_email_is_sent_per_recipient(self):
+        Subscription.objects.create(user=self.owner, course=self.course)
+        Subscription.objects.create(user=self.other_user, course=self.course)
+
+        self.assertEqual(send_course_update_emails.apply(args=[self.course.id]).get(), 2)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         sorted([self.owner.email, self.other_user.email]))
+        self.assertTrue(all(len(message.to) == 1 for message in mail.outbox))
+
+    def test_transient_errors_are_retried_permanent_are_not(self):
+        ScriptedBackend.replies = [451, 250, 550]
+
+        self.assertEqual(self.mailer().send(self.messages(2)), (1, 1))
+        self.assertEqual(len(ScriptedBackend.delivered), 1)
+
+    def test_smtp_errors_classified_before_network_errors(self):
+        self.assertTrue(is_transient(smtplib.SMTPDataError(451, b"try later")))
+        self.assertFalse(is_transient(smtplib.SMTPDataError(554, b"rejected")))
+        self.assertFalse(is_transient(smtplib.SMTPAuthenticationError(535, b"bad credentials")))
+        self.assertFalse(is_transient(smtplib.SMTPConnectError(554, b"no service")))
+        self.assertTrue(is_transient(smtplib.SMTPConnectError(-1, b"")))
+        self.assertFalse(is_transient(smtplib.SMTPNotSupportedError("AUTH not supported")))
+        self.assertFalse(is_transient(smtplib.SMTPException("No suitable authentication method found.")))
+        self.assertTrue(is_transient(smtplib.SMTPServerDisconnected("closed")))
+        self.assertTrue(is_transient(ConnectionRefusedError()))
+        self.assertTrue(is_transient(TimeoutError()))
+
+    def test_connection_reused_up_to_limit(self):
+        self.assertEqual(self.mailer(per_connection=2).send(self.messages(5)), (5, 0))
+        self.assertEqual(ScriptedBackend.opened, 3)
+        self.assertEqual(self.mailer(workers=3).send(self.messages(6))[0], 6)
+
+
+class EstimatedCountPaginationTests(BaseAPITestCase):
+    """
+    Пагинация с оценкой числа строк (config/pagination.py).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.client.force_authenticate(user=self.owner)
+
+    def add_courses(self, count):
+        Course.objects.bulk_create(Course(title=f"Course {i}", owner=self.owner) for i in range(count))
+
+    def test_small_result_is_counted_exactly(self):
+        response = self.client.get(reverse("course-list"))
+
+        self.assertEqual(response.data["count"], 1)
+        self.assertFalse(response.data["count_is_estimate"])
+
+    def paginate(self, queryset, page):
+        paginator = MaterialsPagination()
+        request = Request(RequestFactory().get("/api/courses/", {"page": page}))
+        results = paginator.paginate_queryset(queryset, request)
+        return paginator.get_paginated_response(results).data
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=5)
+    def test_large_table_uses_planner_estimate(self):
+        self.add_courses(11)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        # Статистика отстала от таблицы: 12 строк по оценке, 15 на деле
+        self.add_courses(3)
+        queryset = Course.objects.order_by("pk")
+
+        first = self.paginate(queryset, 1)
+        self.assertEqual((first["count"], first["count_is_estimate"]), (12, True))
+        self.assertIsNotNone(first["next"])
+
+        # Номер страницы не ограничен оценкой, последняя страница уточняет count
+        last = self.paginate(queryset, 2)
+        self.assertEqual(len(last["results"]), 5)
+        self.assertIsNone(last["next"])
+        self.assertEqual((last["count"], last["count_is_estimate"]), (15, False))
+        with self.assertRaises(NotFound):
+            self.paginate(queryset, 3)
+
+    @override_settings(PAGINATION_EXACT_COUNT_THRESHOLD=5)
+    def test_filtered_queryset_without_plan_estimate_is_counted(self):
+        self.add_courses(11)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        # SQLite не даёт оценки строк для запроса с условием — точный COUNT
+        for url in (reverse("course-list"), reverse("async-course-list")):
+            token = RefreshToken.for_user(self.owner).access_token
+            data = self.client.get(url, HTTP_AUTHORIZATION=f"Bearer {token}").json()
+            self.assertEqual((data["count"], data["count_is_estimate"]), (12, False))
+
+
+# Задание удаления проверяется пошагово: диспетчер outbox запускают тесты
+@override_settings(COURSE_DELETE_BATCH_SIZE=2, OUTBOX_DISPATCH_ON_COMMIT=False)
+class CourseDeletionTests(BaseAPITestCase):
+    """
+    Фоновое удаление большого курса пачками (materials/deletion.py).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        for i in range(3):
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, owner=self.owner)
+        Subscription.objects.create(user=self.owner, course=self.course)
+        Subscription.objects.create(user=self.other_user, course=self.course)
+        self.payment = Payment.objects.create(
+            user=self.other_user, paid_course=self.course, amount=100, payment_method="cash",
+        )
+        self.lesson_payment = Payment.objects.create(
+            user=self.other_user, paid_lesson=self.lesson, amount=10, payment_method="cash",
+        )
+        self.client.force_authenticate(user=self.owner)
+
+    def delete_in_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse("course-detail", args=[self.course.id]) + "?mode=background")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return response
+
+    def test_course_is_hidden_until_deleted_in_batches(self):
+        response = self.delete_in_background()
+        self.assertEqual(response.data["status"], CourseDeletion.STATUS_PENDING)
+        self.assertEqual(response.data["lessons_total"], 4)
+
+        # Курс сразу пропадает из API, строки ещё на месте
+        self.assertEqual(self.client.get(reverse("course-detail", args=[self.course.id])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse("course-list")).data["count"], 0)
+        self.assertEqual(self.client.get(reverse("lesson-list")).data["count"], 0)
+        self.assertTrue(Tombstone.objects.filter(kind="course", object_id=self.course.id).exists())
+        self.assertEqual(Lesson.objects.filter(course=self.course).count(), 4)
+
+        dispatch_outbox.delay()
+
+        self.assertFalse(Course.objects.filter(pk=self.course.id).exists())
+        self.assertFalse(Subscription.objects.exists())
+        self.payment.refresh_from_db()
+        self.lesson_payment.refresh_from_db()
+        self.assertIsNone(self.payment.paid_course_id)
+        self.assertIsNone(self.lesson_payment.paid_lesson_id)
+
+        progress = self.client.get(response["Location"])
+        self.assertEqual(progress.status_code, status.HTTP_200_OK)
+        self.assertEqual(progress.data["status"], CourseDeletion.STATUS_DONE)
+        self.assertEqual(progress.data["progress"], 100)
+        self.assertEqual(
+            (progress.data["lessons_deleted"], progress.data["subscriptions_deleted"],
+             progress.data["payments_detached"]),
+            (4, 2, 2),
+        )
+
+        self.client.force_authenticate(user=self.other_user)
+        self.assertEqual(self.client.get(response["Location"]).status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(COURSE_DELETE_STALE_MINUTES=0)
+    def test_interrupted_deletion_is_resumed(self):
+        from .deletion import run
+
+        self.delete_in_background()
+        job = CourseDeletion.objects.get()
+        OutboxMessage.objects.all().delete()
+
+        # Воркер успел обработать три пачки (платежи, подписки) и упал
+        run(job.pk, batch_size=2, max_batches=3)
+        job.refresh_from_db()
+        self.assertEqual(job.status, CourseDeletion.STATUS_RUNNING)
+        self.assertEqual(job.payments_detached, 2)
+        self.assertEqual(job.subscriptions_deleted, 2)
+        # 4 из 7 по снимку: уроки 4, подписки 2, оплаты курса 1
+        self.assertEqual(self.client.get(reverse("course-deletion", args=[job.pk])).data["progress"], 57)
+
+        self.assertEqual(resume_course_deletions.delay().get(), 1)
+        dispatch_outbox.delay()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.lessons_deleted), (CourseDeletion.STATUS_DONE, 4))
+        self.assertFalse(Course.objects.filter(pk=self.course.id).exists())
+        self.assertEqual(resume_course_deletions.delay().get(), 0)
+
+    @override_settings(COURSE_DELETE_CHUNKED_THRESHOLD=100)
+    def test_small_course_is_deleted_in_request(self):
+        response = self.client.delete(reverse("course-detail", args=[self.course.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(CourseDeletion.objects.exists())
+
+    @override_settings(COURSE_DELETE_CHUNKED_THRESHOLD=5)
+    def test_large_course_is_deleted_in_background_by_default(self):
+        response = self.client.delete(reverse("course-detail", args=[self.course.id]))
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        response = self.client.post(
+            reverse("lesson-create"), {"title": "Late", "course": self.course.id}, format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_concurrent_hide_returns_existing_job(self):
+        from .deletion import hide
+
+        # Второй запрос (API или админка) загрузил курс до того, как первый его скрыл
+        stale = Course.objects.get(pk=self.course.id)
+        with transaction.atomic():
+            first = hide(self.course, self.owner)
+        with transaction.atomic():
+            second = hide(stale)
+
+        self.assertEqual(second.pk, first.pk)
+        self.assertEqual(CourseDeletion.objects.count(), 1)
+        self.assertEqual(Tombstone.objects.filter(kind="course", object_id=self.course.id).count(), 1)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+
+    def test_hidden_course_lessons_leave_autocomplete(self):
+        from .deletion import run
+
+        autocomplete._index = None
+        self.addCleanup(setattr, autocomplete, "_index", None)
+        index = autocomplete.get_index()
+        index.build()
+        self.assertIn(("lesson", self.lesson.id), [(hit["kind"], hit["id"]) for hit in index.lookup("test")])
+
+        # Запрос убирает из подсказок только сам курс
+        with mock.patch.object(index, "remove", wraps=index.remove) as remove:
+            self.delete_in_background()
+        remove.assert_called_once_with("course", self.course.id)
+        self.assertEqual(index.lookup("test course"), [])
+
+        # Уроки — первый шаг задания, до удаления их строк
+        run(CourseDeletion.objects.get().pk, batch_size=2, max_batches=1)
+        self.assertEqual(Lesson.objects.filter(course=self.course).count(), 4)
+        self.assertEqual(index.lookup("test"), [])
+        self.assertEqual(index.lookup("lesson"), [])
@@ -1,13 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import (
+    AsyncCourseListView,
+    AsyncCourseRetrieveView,
+    AsyncLessonListView,
+    AsyncLessonRetrieveView,
+)
 from .views import (
+    AutocompleteAPIView,
+    CourseDeletionAPIView,
     CourseViewSet,
     LessonListAPIView,
     LessonRetrieveAPIView,
     LessonCreateAPIView,
     LessonUpdateAPIView,
     LessonDestroyAPIView,
+    SearchAPIView,
     SubscriptionAPIView,
+    SyncAPIView,
 )
 
 router = DefaultRouter()
@@ -15,10 +25,19 @@ router.register(r'courses', CourseViewSet, basename='course')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('course-deletions/<int:pk>/', CourseDeletionAPIView.as_view(), name='course-deletion'),
     path('lessons/', LessonListAPIView.as_view(), name='lesson-list'),
     path('lessons/create/', LessonCreateAPIView.as_view(), name='lesson-create'),
     path('lessons/<int:pk>/', LessonRetrieveAPIView.as_view(), name='lesson-retrieve'),
     path('lessons/<int:pk>/update/', LessonUpdateAPIView.as_view(), name='lesson-update'),
     path('lessons/<int:pk>/delete/', LessonDestroyAPIView.as_view(), name='lesson-destroy'),
     path('subscriptions/', SubscriptionAPIView.as_view(), name='subscription-toggle'),
+    path('search/', SearchAPIView.as_view(), name='search'),
+    path('autocomplete/', AutocompleteAPIView.as_view(), name='autocomplete'),
+    path('sync/', SyncAPIView.as_view(), name='sync'),
+    # Async-версии эндпоинтов чтения (эффективны под ASGI-сервером, см. config/asgi.py)
+    path('async/courses/', AsyncCourseListView.as_view(), name='async-course-list'),
+    path('async/courses/<int:pk>/', AsyncCourseRetrieveView.as_view(), name='async-course-detail'),
+    path('async/lessons/', AsyncLessonListView.as_view(), name='async-lesson-list'),
+    path('async/lessons/<int:pk>/', AsyncLessonRetrieveView.as_view(), name='async-lesson-retrieve'),
 ]
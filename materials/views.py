@@ -1,25 +1,50 @@
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
-from .models import Course, Lesson, Subscription
-from .serializers import CourseSerializer, LessonSerializer
-from .permissions import IsModerator, IsOwnerOrModerator, IsOwnerAndNotModerator
+from config import outbox
+from config.db_router import use_primary
+from . import deletion
+from config.profiling import ServerTimingMixin
+from config.throttling import BucketThrottle
+from .models import Course, CourseDeletion, CoursePopularity, Lesson, Subscription
+from .autocomplete import get_index
+from .search import search
+from .sync import TokenExpired, changes
+from .serializers import (
+    AutocompleteHitSerializer,
+    CourseDeletionSerializer,
+    CourseSerializer,
+    LeaderboardEntrySerializer,
+    LessonSerializer,
+    SearchHitSerializer,
+    SyncCourseSerializer,
+)
+from .permissions import AuthorizedObjectMixin, IsModerator, IsOwnerOrModerator, IsOwnerAndNotModerator, is_moderator
 from .paginators import MaterialsPagination
 from .tasks import send_course_update_emails
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ServerTimingMixin, AuthorizedObjectMixin, viewsets.ModelViewSet):
     """ViewSet для работы с курсами (CRUD)"""
-    queryset = Course.objects.all()
+    queryset = Course.objects.filter(deleted_at__isnull=True)
     serializer_class = CourseSerializer
     pagination_class = MaterialsPagination
+    leaderboard_default_limit = 10
 
     def get_permissions(self):
         """Разграничение прав доступа по action"""
@@ -45,16 +70,91 @@ class CourseViewSet(viewsets.ModelViewSet):
         serializer.save(owner=self.request.user)
 
     def perform_update(self, serializer):
-        """После обновления курса — асинхронная рассылка подписчикам"""
-        serializer.save()
-        send_course_update_emails.delay(serializer.instance.pk)
+        """После обновления курса — асинхронная рассылка подписчикам (через outbox)"""
+        with transaction.atomic():
+            serializer.save()
+            outbox.enqueue(send_course_update_emails, serializer.instance.pk)
 
     def get_queryset(self):
-        """Список/детали курсов доступны всем аутентифицированным пользователям."""
-        return Course.objects.all()
+        """Список/детали курсов доступны всем аутентифицированным пользователям (кроме удаляемых)."""
+        return Course.objects.filter(deleted_at__isnull=True)
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('mode', openapi.IN_QUERY, type=openapi.TYPE_STRING, enum=['background'],
+                              description='Удалить в фоне независимо от размера курса'),
+        ],
+        responses={
+            202: CourseDeletionSerializer,
+            204: openapi.Response(description='Курс удалён'),
+        },
+    )
+    def destroy(self, request, *args, **kwargs):
+        """
+        Удаление курса. Большой курс (или ``mode=background``) сразу скрывается,
+        а удаляется пачками в фоне: ответ 202 со ссылкой на прогресс в Location.
+        """
+        course = self.get_object()
+        if request.query_params.get('mode') != 'background' and not deletion.is_large(course):
+            self.perform_destroy(course)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        try:
+            with transaction.atomic():
+                job = deletion.hide(course, request.user)
+        except Course.DoesNotExist:
+            # Параллельный запрос успел удалить небольшой курс целиком
+            raise NotFound()
+        return Response(
+            CourseDeletionSerializer(job).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': reverse('course-deletion', args=[job.pk])},
+        )
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('window', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              enum=['all', 'day', 'week', 'month'], description='Окно рейтинга (по умолчанию all)'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: LeaderboardEntrySerializer(many=True)},
+    )
+    @action(detail=False, methods=['get'], pagination_class=None)
+    def leaderboard(self, request, *args, **kwargs):
+        """
+        Самые популярные курсы. ``window=all`` — по числу подписчиков (счётчики курса),
+        ``day``/``week``/``month`` — по новым подпискам и оплатам за окно
+        (предрассчитанная таблица CoursePopularity).
+        """
+        window = request.query_params.get('window', 'all')
+        if window != 'all' and window not in dict(CoursePopularity.WINDOW_CHOICES):
+            raise ValidationError({'window': 'Допустимые значения: all, day, week, month.'})
+        raw_limit = request.query_params.get('limit', '')
+        limit = self.leaderboard_default_limit
+        if raw_limit.isdigit() and int(raw_limit) > 0:
+            limit = min(int(raw_limit), settings.LEADERBOARD_SIZE)
 
-class LessonListAPIView(generics.ListAPIView):
+        if window == 'all':
+            courses = Course.objects.filter(deleted_at__isnull=True).order_by('-subscriber_count', 'id').values_list(
+                'pk', 'title', 'subscriber_count', 'paid_count')[:limit]
+            entries = [
+                {'rank': rank, 'course_id': pk, 'title': title, 'subscribers': subscribers,
+                 'payments': payments, 'score': subscribers}
+                for rank, (pk, title, subscribers, payments) in enumerate(courses, start=1)
+            ]
+        else:
+            rows = CoursePopularity.objects.filter(
+                window=window, course__deleted_at__isnull=True,
+            ).order_by('rank').values_list(
+                'rank', 'course_id', 'course__title', 'subscribers', 'payments', 'score')[:limit]
+            entries = [
+                {'rank': rank, 'course_id': pk, 'title': title, 'subscribers': subscribers,
+                 'payments': payments, 'score': score}
+                for rank, pk, title, subscribers, payments, score in rows
+            ]
+        return Response({'window': window, 'results': LeaderboardEntrySerializer(entries, many=True).data})
+
+
+class LessonListAPIView(ServerTimingMixin, generics.ListAPIView):
     """Получение списка уроков"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated]
@@ -62,30 +162,26 @@ class LessonListAPIView(generics.ListAPIView):
 
     def get_queryset(self):
         """Фильтрация: модераторы видят все, остальные - только свои"""
-        queryset = Lesson.objects.all()
-        if self.request.user.is_authenticated:
-            is_moderator = self.request.user.groups.filter(name='moderators').exists()
-            if not is_moderator:
-                queryset = queryset.filter(owner=self.request.user)
+        queryset = Lesson.objects.filter(course__deleted_at__isnull=True)
+        if not is_moderator(self.request.user):
+            queryset = queryset.filter(owner_id=self.request.user.pk)
         return queryset
 
 
-class LessonRetrieveAPIView(generics.RetrieveAPIView):
+class LessonRetrieveAPIView(ServerTimingMixin, AuthorizedObjectMixin, generics.RetrieveAPIView):
     """Получение одного урока"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrModerator]
 
     def get_queryset(self):
         """Фильтрация: модераторы видят все, остальные - только свои"""
-        queryset = Lesson.objects.all()
-        if self.request.user.is_authenticated:
-            is_moderator = self.request.user.groups.filter(name='moderators').exists()
-            if not is_moderator:
-                queryset = queryset.filter(owner=self.request.user)
+        queryset = Lesson.objects.filter(course__deleted_at__isnull=True)
+        if not is_moderator(self.request.user):
+            queryset = queryset.filter(owner_id=self.request.user.pk)
         return queryset
 
 
-class LessonCreateAPIView(generics.CreateAPIView):
+class LessonCreateAPIView(ServerTimingMixin, generics.CreateAPIView):
     """Создание урока"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated, ~IsModerator]
@@ -95,7 +191,7 @@ class LessonCreateAPIView(generics.CreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class LessonUpdateAPIView(generics.UpdateAPIView):
+class LessonUpdateAPIView(ServerTimingMixin, AuthorizedObjectMixin, generics.UpdateAPIView):
     """
     Обновление урока. При обновлении урока уведомление подписчикам курса
     отправляется только если курс не обновлялся более 4 часов.
@@ -105,43 +201,53 @@ class LessonUpdateAPIView(generics.UpdateAPIView):
 
     def get_queryset(self):
         """Фильтрация: модераторы видят все, остальные - только свои"""
-        queryset = Lesson.objects.all()
-        if self.request.user.is_authenticated:
-            is_moderator = self.request.user.groups.filter(name='moderators').exists()
-            if not is_moderator:
-                queryset = queryset.filter(owner=self.request.user)
+        queryset = Lesson.objects.filter(course__deleted_at__isnull=True)
+        if not is_moderator(self.request.user):
+            queryset = queryset.filter(owner_id=self.request.user.pk)
         return queryset
 
     def perform_update(self, serializer):
         lesson = serializer.instance
         course = lesson.course
         old_course_updated_at = course.updated_at
-        serializer.save()
-        # Обновляем время последнего изменения курса (обновление урока = обновление курса)
-        course.refresh_from_db()
-        course.updated_at = timezone.now()
-        course.save(update_fields=['updated_at'])
-        # Уведомление только если курс не обновлялся более 4 часов (доп. задание)
-        if old_course_updated_at is None or (timezone.now() - old_course_updated_at) >= timedelta(hours=4):
-            send_course_update_emails.delay(course.pk)
+        with transaction.atomic():
+            serializer.save()
+            # Обновляем время последнего изменения курса (обновление урока = обновление курса)
+            course.refresh_from_db()
+            course.updated_at = timezone.now()
+            course.save(update_fields=['updated_at'])
+            # Уведомление только если курс не обновлялся более 4 часов (доп. задание)
+            if old_course_updated_at is None or (timezone.now() - old_course_updated_at) >= timedelta(hours=4):
+                outbox.enqueue(send_course_update_emails, course.pk)
 
 
-class LessonDestroyAPIView(generics.DestroyAPIView):
+class LessonDestroyAPIView(ServerTimingMixin, AuthorizedObjectMixin, generics.DestroyAPIView):
     """Удаление урока"""
     serializer_class = LessonSerializer
     permission_classes = [IsAuthenticated, IsOwnerAndNotModerator]
 
     def get_queryset(self):
-        """Объект ищется среди всех уроков; доступ контролируется permissions."""
-        return Lesson.objects.all()
+        """Объект ищется среди всех уроков; условие доступа добавляет AuthorizedObjectMixin."""
+        return Lesson.objects.filter(course__deleted_at__isnull=True)
+
+
+class CourseDeletionAPIView(ServerTimingMixin, generics.RetrieveAPIView):
+    """Прогресс фонового удаления курса (доступен тому, кто его запросил)"""
+    serializer_class = CourseDeletionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return CourseDeletion.objects.filter(requested_by=self.request.user)
 
 
-class SubscriptionAPIView(APIView):
+class SubscriptionAPIView(ServerTimingMixin, APIView):
     """
     Установка/удаление подписки пользователя на курс (toggle).
     Ожидает: {"course_id": <int>}
     """
     permission_classes = [IsAuthenticated]
+    throttle_classes = [BucketThrottle]
+    throttle_scope = 'subscription'
 
     @swagger_auto_schema(
         request_body=openapi.Schema(
@@ -156,7 +262,7 @@ class SubscriptionAPIView(APIView):
     def post(self, request, *args, **kwargs):
         user = request.user
         course_id = request.data.get("course_id")
-        course_item = get_object_or_404(Course, pk=course_id)
+        course_item = get_object_or_404(Course, pk=course_id, deleted_at__isnull=True)
 
         subs_qs = Subscription.objects.filter(user=user, course=course_item)
 
@@ -168,3 +274,131 @@ class SubscriptionAPIView(APIView):
             message = "подписка добавлена"
 
         return Response({"message": message}, status=status.HTTP_200_OK)
+
+
+class SearchAPIView(ServerTimingMixin, APIView):
+    """
+    Полнотекстовый поиск по курсам и урокам (см. materials/search.py).
+    Хиты отсортированы по релевантности; для урока возвращается и курс.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = MaterialsPagination
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                              description='Поисковый запрос'),
+            openapi.Parameter('page', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter('page_size', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: SearchHitSerializer(many=True)},
+    )
+    def get(self, request, *args, **kwargs):
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise ValidationError({'q': 'Обязательный параметр.'})
+
+        paginator = self.pagination_class()
+        page_size = paginator.get_page_size(request)
+        raw_page = request.query_params.get(paginator.page_query_param, '1')
+        page_number = int(raw_page) if raw_page.isdigit() else 0
+        if page_number < 1:
+            raise NotFound('Invalid page.')
+
+        hits, count = search(text, limit=page_size, offset=(page_number - 1) * page_size)
+        if not hits and page_number > 1:
+            raise NotFound('Invalid page.')
+
+        url = request.build_absolute_uri()
+        next_url = None
+        if page_number * page_size < count:
+            next_url = replace_query_param(url, paginator.page_query_param, page_number + 1)
+        if page_number <= 1:
+            previous_url = None
+        elif page_number == 2:
+            previous_url = remove_query_param(url, paginator.page_query_param)
+        else:
+            previous_url = replace_query_param(url, paginator.page_query_param, page_number - 1)
+        return Response({
+            'count': count,
+            'next': next_url,
+            'previous': previous_url,
+            'results': SearchHitSerializer(hits, many=True).data,
+        })
+
+
+class AutocompleteAPIView(ServerTimingMixin, APIView):
+    """
+    Автодополнение названий курсов и уроков по префиксу (materials/autocomplete.py).
+    Ответ строится из индекса без обращения к БД: пользователь берётся из
+    токена без загрузки из базы.
+    """
+    authentication_classes = [JWTStatelessUserAuthentication]
+    permission_classes = [IsAuthenticated]
+    default_limit = 10
+    max_limit = 20
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('q', openapi.IN_QUERY, type=openapi.TYPE_STRING, required=True,
+                              description='Начало названия'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: AutocompleteHitSerializer(many=True)},
+    )
+    def get(self, request, *args, **kwargs):
+        raw_limit = request.query_params.get('limit', '')
+        limit = self.default_limit
+        if raw_limit.isdigit() and int(raw_limit) > 0:
+            limit = min(int(raw_limit), self.max_limit)
+        hits = get_index().lookup(request.query_params.get('q', ''), limit)
+        return Response({'results': AutocompleteHitSerializer(hits, many=True).data})
+
+
+class SyncAPIView(ServerTimingMixin, APIView):
+    """
+    Дельта-синхронизация каталога (materials/sync.py): курсы и уроки,
+    изменённые после токена из прошлого ответа, и id удалённых.
+    Без токена — весь каталог; пока ``has_more``, запрашивать следующий токен.
+    Читает только из primary, не с реплик (см. materials/sync.py).
+    """
+    permission_classes = [IsAuthenticated]
+    default_limit = 200
+    max_limit = 1000
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                              description='Токен изменений из прошлого ответа'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type=openapi.TYPE_INTEGER,
+                              description='Не больше элементов каждого типа'),
+        ],
+        responses={
+            200: openapi.Response(description='Изменения и новый токен'),
+            410: openapi.Response(description='Токен устарел, нужна полная синхронизация'),
+        },
+    )
+    def get(self, request, *args, **kwargs):
+        raw_limit = request.query_params.get('limit', '')
+        limit = self.default_limit
+        if raw_limit.isdigit() and int(raw_limit) > 0:
+            limit = min(int(raw_limit), self.max_limit)
+        # Отставание реплики больше окна перекрытия токена: изменения были бы потеряны
+        with use_primary():
+            try:
+                delta = changes(request.user, request.query_params.get('token') or None, limit,
+                                is_moderator(request.user))
+            except signing.BadSignature:
+                raise ValidationError({'token': 'Недействительный токен.'})
+            except TokenExpired:
+                return Response({'error': 'Токен устарел, выполните полную синхронизацию без токена.'},
+                                status=status.HTTP_410_GONE)
+
+            context = {'request': request}
+            return Response({
+                'courses': SyncCourseSerializer(delta['courses'], many=True, context=context).data,
+                'lessons': LessonSerializer(delta['lessons'], many=True, context=context).data,
+                'deleted': delta['deleted'],
+                'token': delta['token'],
+                'has_more': delta['has_more'],
+            })
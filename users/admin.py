@@ -1,13 +1,21 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+
+from config.admin_tools import LargeTableAdminMixin, background_action
 from .models import User, Payment
+from .tasks import delete_payments, set_users_active
 
 
 @admin.register(User)
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'phone', 'city', 'is_staff', 'is_active')
     list_filter = ('is_staff', 'is_active', 'city')
+    # icontains по этим столбцам использует триграммные индексы на PostgreSQL (миграция 0009)
     search_fields = ('email', 'first_name', 'last_name', 'phone')
+    actions = [
+        background_action(set_users_active, 'Заблокировать пользователей', False, name='deactivate_users'),
+        background_action(set_users_active, 'Разблокировать пользователей', True, name='activate_users'),
+    ]
 
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
@@ -52,7 +60,7 @@ class CustomUserAdmin(UserAdmin):
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'user',
         'payment_date',
@@ -62,6 +70,9 @@ class PaymentAdmin(admin.ModelAdmin):
         'payment_method',
         'stripe_session_id',
     )
-    list_filter = ('payment_method', 'payment_date', 'paid_course')
-    search_fields = ('user__email', 'paid_course__title', 'paid_lesson__title')
-    date_hierarchy = 'payment_date'
+    list_select_related = ('user', 'paid_course', 'paid_lesson')
+    # Без date_hierarchy и фильтра по курсу: оба выбирают значения по всей таблице
+    list_filter = ('payment_method', 'payment_date')
+    search_fields = ('user__email', '=stripe_session_id')
+    autocomplete_fields = ('user', 'paid_course', 'paid_lesson')
+    actions = [background_action(delete_payments, 'Удалить платежи')]
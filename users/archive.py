@@ -0,0 +1,227 @@
+"""
+Архив старых платежей: выгрузка в сжатые NDJSON-файлы и восстановление.
+
+Таблица платежей только растёт. Платежи старше N месяцев переносятся
+(manage.py archive_payments) в файлы ``payments-YYYY-MM-<id>-<id>.ndjson.gz``
+в PAYMENT_ARCHIVE_DIR — по одному на месяц и запуск, строка JSON на платёж.
+Файл сначала пишется целиком во временный, затем в ``manifest.json`` каталога
+добавляется запись (месяц, диапазон id, число строк, sha256), и только после
+этого строки удаляются из БД пачками. Прерванный запуск безопасно повторить:
+строки, уже попавшие в архив по манифесту, удаляются без повторной выгрузки.
+Каталог можно синхронизировать в холодное хранилище как есть.
+
+manage.py restore_payments проверяет sha256 и возвращает строки с теми же
+id (уже существующие пропускаются). Ссылки на удалённые курс или урок
+обнуляются, платежи удалённых пользователей не восстанавливаются.
+
+Денормализованный ``Course.paid_count`` считает только платежи в БД:
+удаление из таблицы уменьшает его сигналами, после восстановления счётчики
+пересчитываются. Окна рейтинга популярности (до месяца) архив не затрагивает.
+"""
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+MANIFEST = 'manifest.json'
+FIELDS = [
+    'id', 'user_id', 'payment_date', 'paid_course_id', 'paid_lesson_id', 'amount',
+    'payment_method', 'stripe_session_id', 'stripe_payment_url',
+]
+
+
+def month_start(year: int, month: int):
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def next_month(start):
+    return month_start(start.year + start.month // 12, start.month % 12 + 1)
+
+
+def cutoff(months: int, now=None):
+    """Начало месяца, ``months`` месяцев назад от текущего: старше — в архив."""
+    now = timezone.localtime(now or timezone.now())
+    index = now.year * 12 + now.month - 1 - months
+    return month_start(index // 12, index % 12 + 1)
+
+
+def read_manifest(directory: Path) -> list:
+    path = directory / MANIFEST
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())['archives']
+
+
+def write_manifest(directory: Path, archives: list):
+    tmp = directory / f'{MANIFEST}.tmp'
+    tmp.write_text(json.dumps({'archives': archives}, ensure_ascii=False, indent=2))
+    os.replace(tmp, directory / MANIFEST)
+
+
+def _row(payment) -> dict:
+    row = {field: getattr(payment, field) for field in FIELDS}
+    row['payment_date'] = payment.payment_date.isoformat()
+    row['amount'] = str(payment.amount)
+    return row
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _delete(queryset, batch_size) -> int:
+    """Удаляет строки пачками по первичному ключу, транзакция на пачку."""
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+
+
+def archive_month(directory: Path, start, batch_size: int) -> dict:
+    """
+    Переносит платежи месяца, начинающегося в ``start``, в архив.
+    Возвращает запись манифеста или None, если выгружать нечего.
+    """
+    from .models import Payment
+
+    month = start.strftime('%Y-%m')
+    in_month = Payment.objects.filter(payment_date__gte=start, payment_date__lt=next_month(start))
+    archives = read_manifest(directory)
+    # Строки из архивов прерванного запуска: файл уже записан, осталось удалить
+    for entry in archives:
+        if entry['month'] == month:
+            _delete(in_month.filter(pk__gte=entry['first_id'], pk__lte=entry['last_id']), batch_size)
+
+    first_id = last_id = None
+    count = 0
+    tmp = directory / f'payments-{month}.ndjson.gz.tmp'
+    with gzip.open(tmp, 'wt', encoding='utf-8') as fh:
+        for payment in in_month.order_by('pk').iterator(chunk_size=batch_size):
+            fh.write(json.dumps(_row(payment), ensure_ascii=False) + '\n')
+            first_id = payment.pk if first_id is None else first_id
+            last_id = payment.pk
+            count += 1
+    if not count:
+        tmp.unlink()
+        return None
+
+    name = f'payments-{month}-{first_id}-{last_id}.ndjson.gz'
+    os.replace(tmp, directory / name)
+    entry = {
+        'file': name,
+        'month': month,
+        'first_id': first_id,
+        'last_id': last_id,
+        'count': count,
+        'sha256': _sha256(directory / name),
+        'archived_at': timezone.now().isoformat(),
+    }
+    write_manifest(directory, archives + [entry])
+    _delete(in_month.filter(pk__gte=first_id, pk__lte=last_id), batch_size)
+    return entry
+
+
+def archive(directory: Path, months: int, batch_size: int = 1000) -> list:
+    """Архивирует все месяцы старше ``months``. Возвращает новые записи манифеста."""
+    from .models import Payment
+
+    directory.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for day in Payment.objects.filter(payment_date__lt=cutoff(months)).dates('payment_date', 'month'):
+        entry = archive_month(directory, month_start(day.year, day.month), batch_size)
+        if entry is not None:
+            entries.append(entry)
+    return entries
+
+
+def restore_entry(directory: Path, entry: dict, batch_size: int = 1000) -> tuple:
+    """Возвращает платежи одного архива в БД. Возвращает (восстановлено, пропущено)."""
+    from materials.models import Course, Lesson
+    from .models import Payment, User
+
+    path = directory / entry['file']
+    if _sha256(path) != entry['sha256']:
+        raise ValueError(f'Контрольная сумма {entry["file"]} не совпадает с манифестом')
+
+    restored = skipped = 0
+
+    def flush(rows):
+        nonlocal restored, skipped
+        users = set(User.objects.filter(pk__in={r['user_id'] for r in rows}).values_list('pk', flat=True))
+        courses = set(Course.objects.filter(pk__in={r['paid_course_id'] for r in rows}).values_list('pk', flat=True))
+        lessons = set(Lesson.objects.filter(pk__in={r['paid_lesson_id'] for r in rows}).values_list('pk', flat=True))
+        existing = set(Payment.objects.filter(pk__in=[r['id'] for r in rows]).values_list('pk', flat=True))
+        payments = []
+        for row in rows:
+            if row['user_id'] not in users or row['id'] in existing:
+                skipped += 1
+                continue
+            payments.append(Payment(
+                id=row['id'],
+                user_id=row['user_id'],
+                payment_date=parse_datetime(row['payment_date']),
+                paid_course_id=row['paid_course_id'] if row['paid_course_id'] in courses else None,
+                paid_lesson_id=row['paid_lesson_id'] if row['paid_lesson_id'] in lessons else None,
+                amount=Decimal(row['amount']),
+                payment_method=row['payment_method'],
+                stripe_session_id=row['stripe_session_id'],
+                stripe_payment_url=row['stripe_payment_url'],
+            ))
+        dates = [payment.payment_date for payment in payments]
+        with transaction.atomic():
+            Payment.objects.bulk_create(payments)
+            # auto_now_add подменяет дату при вставке — возвращаем исходную
+            for payment, payment_date in zip(payments, dates):
+                payment.payment_date = payment_date
+            Payment.objects.bulk_update(payments, ['payment_date'])
+        restored += len(payments)
+
+    batch = []
+    with gzip.open(path, 'rt', encoding='utf-8') as fh:
+        for line in fh:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    if batch:
+        flush(batch)
+    return restored, skipped
+
+
+def restore(directory: Path, months=None, keep_files: bool = False, batch_size: int = 1000) -> tuple:
+    """
+    Восстанавливает архивы (все или за месяцы ``months``: ['YYYY-MM']),
+    убирает их из манифеста. Возвращает (восстановлено, пропущено, архивов).
+    """
+    from materials.counters import repair_counters
+
+    archives = read_manifest(directory)
+    selected = [entry for entry in archives if months is None or entry['month'] in months]
+    restored = skipped = 0
+    for entry in selected:
+        done, missed = restore_entry(directory, entry, batch_size)
+        restored += done
+        skipped += missed
+        archives.remove(entry)
+        write_manifest(directory, archives)
+        if not keep_files:
+            (directory / entry['file']).unlink()
+    if restored:
+        # bulk_create не вызывает сигналы: счётчики оплат курсов пересчитываются
+        repair_counters()
+    return restored, skipped, len(selected)
@@ -0,0 +1,34 @@
+"""
+Асинхронный (ASGI) эндпоинт проверки статуса платежа Stripe.
+Ответ совпадает с PaymentStatusAPIView.
+"""
+from asgiref.sync import sync_to_async
+
+from config.async_api import AsyncAPIView, json_response
+from .models import Payment
+from .services import retrieve_stripe_checkout_session
+
+
+class AsyncPaymentStatusView(AsyncAPIView):
+    """
+    Проверка статуса платежа Stripe по id сессии (async).
+    GET /api/users/payments/status/async/?session_id=cs_xxx
+    """
+
+    async def get(self, request):
+        session_id = request.GET.get('session_id')
+        if not session_id:
+            return json_response({'error': 'Укажите session_id в query-параметрах.'}, status=400)
+        payment = await Payment.objects.filter(user=request.user, stripe_session_id=session_id).afirst()
+        if not payment:
+            return json_response({'error': 'Платёж не найден или доступ запрещён.'}, status=404)
+        # Сетевой вызов Stripe — в отдельном потоке, не занимая общий поток ORM
+        session_data = await sync_to_async(retrieve_stripe_checkout_session, thread_sensitive=False)(session_id)
+        if not session_data:
+            return json_response({'error': 'Не удалось получить данные сессии Stripe.'}, status=502)
+        return json_response({
+            'payment_id': payment.id,
+            'stripe_session_id': session_data.get('id'),
+            'payment_status': session_data.get('payment_status'),
+            'status': session_data.get('status'),
+        })
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.archive import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит платежи старше --months месяцев в сжатые NDJSON-архивы '
+        '(по файлу на месяц, manifest.json в каталоге) и удаляет их из БД.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.PAYMENT_ARCHIVE_MONTHS,
+                            help='Хранить в БД платежи за столько последних месяцев')
+        parser.add_argument('--dir', default=str(settings.PAYMENT_ARCHIVE_DIR), help='Каталог архивов')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['months'] < 1:
+            raise CommandError('--months должно быть не меньше 1.')
+        entries = archive(Path(options['dir']), options['months'], options['batch_size'])
+        for entry in entries:
+            self.stdout.write(f'{entry["month"]}: {entry["count"]} платежей -> {entry["file"]}')
+        total = sum(entry['count'] for entry in entries)
+        self.stdout.write(self.style.SUCCESS(f'Архивировано платежей: {total} (файлов: {len(entries)})'))
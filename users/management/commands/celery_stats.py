@@ -0,0 +1,56 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from config.metrics import get_registry
+
+
+class Command(BaseCommand):
+    help = 'Выводит сводку метрик задач Celery: ожидание в очереди, время выполнения, повторы, ошибки'
+
+    def handle(self, *args, **options):
+        stats = defaultdict(lambda: defaultdict(float))
+        items = defaultdict(dict)
+
+        for metric in get_registry().collect():
+            if not metric.name.startswith('celery_'):
+                continue
+            for sample in metric.samples:
+                task = sample.labels.get('task')
+                if not task:
+                    continue
+                name = sample.name
+                if name == 'celery_task_queue_wait_seconds_sum':
+                    stats[task]['wait_sum'] += sample.value
+                elif name == 'celery_task_queue_wait_seconds_count':
+                    stats[task]['wait_count'] += sample.value
+                elif name == 'celery_task_runtime_seconds_sum':
+                    stats[task]['run_sum'] += sample.value
+                elif name == 'celery_task_runtime_seconds_count':
+                    stats[task]['runs'] += sample.value
+                    if sample.labels.get('state') != 'SUCCESS':
+                        stats[task]['not_success'] += sample.value
+                elif name == 'celery_task_retries_total':
+                    stats[task]['retries'] += sample.value
+                elif name == 'celery_task_failures_total':
+                    stats[task]['failures'] += sample.value
+                elif name == 'celery_task_items_total':
+                    items[task][sample.labels['item']] = int(sample.value)
+
+        if not stats and not items:
+            self.stdout.write(self.style.WARNING('Метрик задач Celery пока нет.'))
+            return
+
+        for task in sorted(set(stats) | set(items)):
+            data = stats[task]
+            runs = int(data['runs'])
+            avg_run = data['run_sum'] / runs * 1000 if runs else 0.0
+            avg_wait = data['wait_sum'] / data['wait_count'] * 1000 if data['wait_count'] else 0.0
+            self.stdout.write(self.style.SUCCESS(task))
+            self.stdout.write(
+                f'  запусков: {runs}, неуспешных: {int(data["not_success"])}, '
+                f'повторов: {int(data["retries"])}, ошибок: {int(data["failures"])}'
+            )
+            self.stdout.write(f'  среднее выполнение: {avg_run:.1f} мс, среднее ожидание в очереди: {avg_wait:.1f} мс')
+            for item, value in sorted(items[task].items()):
+                self.stdout.write(f'  {item}: {value}')
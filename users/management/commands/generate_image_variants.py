@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+
+from config.images import needs_variants
+from materials.models import Course, Lesson
+from materials.tasks import generate_preview_variants
+from users.models import User
+from users.tasks import generate_avatar_variants
+
+TARGETS = {
+    'course': (Course, 'preview'),
+    'lesson': (Lesson, 'preview'),
+    'user': (User, 'avatar'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Догоняет варианты изображений (превью курсов и уроков, аватары) для уже '
+        'загруженных файлов. Обрабатываются только записи без актуальных вариантов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(TARGETS), action='append',
+                            help='Только указанные модели (по умолчанию все)')
+        parser.add_argument('--force', action='store_true', help='Перегенерировать и актуальные варианты')
+        parser.add_argument('--sync', action='store_true', help='Выполнить в этом процессе, без очереди Celery')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        for key in options['model'] or sorted(TARGETS):
+            model, field_name = TARGETS[key]
+            queryset = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .only('pk', field_name, f'{field_name}_variants').order_by('pk')
+            )
+            scheduled = 0
+            for instance in queryset.iterator(chunk_size=options['chunk_size']):
+                if not options['force'] and not needs_variants(instance, field_name):
+                    continue
+                self._run(key, instance.pk, options)
+                scheduled += 1
+            action = 'обработано' if options['sync'] else 'поставлено в очередь'
+            self.stdout.write(self.style.SUCCESS(f'{model._meta.verbose_name_plural}: {action} {scheduled}'))
+
+    @staticmethod
+    def _run(key, pk, options):
+        if key == 'user':
+            task, args = generate_avatar_variants, (pk, options['force'])
+        else:
+            task, args = generate_preview_variants, (key, pk, options['force'])
+        if options['sync']:
+            task.apply(args=args)
+        else:
+            task.delay(*args)
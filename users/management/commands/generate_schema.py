@@ -0,0 +1,26 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.schema import code_version, generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Генерирует OpenAPI-схему (JSON и YAML) для текущей версии кода'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true', help='Удалить схемы других версий')
+
+    def handle(self, *args, **options):
+        version = code_version()
+        paths = generate_schema(version)
+        for fmt, path in paths.items():
+            self.stdout.write(self.style.SUCCESS(f'Схема {fmt} (версия {version}): {path}'))
+
+        if options['prune']:
+            keep = set(paths.values())
+            for path in Path(settings.SCHEMA_ROOT).glob('openapi-*'):
+                if path not in keep:
+                    path.unlink()
+                    self.stdout.write(self.style.WARNING(f'Удалена устаревшая схема: {path}'))
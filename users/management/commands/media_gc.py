@@ -0,0 +1,113 @@
+import os
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.files.storage import storages
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from config.storage import BLOB_PREFIX, ContentAddressedStorage, iter_references
+from materials.models import MediaBlob
+
+
+def _mb(size):
+    return f'{(size or 0) / 1024 / 1024:.1f} МБ'
+
+
+class Command(BaseCommand):
+    help = (
+        'Сборка мусора хранилища с дедупликацией (MEDIA_DEDUP=1): удаляет файлы блобов '
+        'без ссылок старше --grace-hours и показывает экономию места.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Не удалять блобы, потерявшие ссылки позже этого срока')
+        parser.add_argument('--recount', action='store_true',
+                            help='Пересчитать счётчики ссылок по полям моделей перед удалением')
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+
+    def handle(self, *args, **options):
+        storage = storages['default']
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('Хранилище по умолчанию не ContentAddressedStorage (MEDIA_DEDUP=0).')
+
+        if options['recount']:
+            self._recount(storage, options['dry_run'])
+
+        threshold = timezone.now() - timedelta(hours=options['grace_hours'])
+        freed = removed = 0
+        for pk, size in self._candidates(threshold):
+            if options['dry_run'] or self._purge(storage, pk, threshold):
+                removed += 1
+                freed += size
+        self._remove_stale_tmp(storage, options['grace_hours'], options['dry_run'])
+
+        action = 'будет удалено' if options['dry_run'] else 'удалено'
+        self.stdout.write(self.style.SUCCESS(f'Блобов без ссылок {action}: {removed} ({_mb(freed)})'))
+        self._report()
+
+    @staticmethod
+    def _candidates(threshold):
+        """(id, размер) блобов без ссылок, потерявших их раньше threshold."""
+        return list(MediaBlob.objects.filter(refcount=0, updated_at__lt=threshold).values_list('pk', 'size'))
+
+    @staticmethod
+    def _purge(storage, pk, threshold):
+        """
+        Удаляет строку и файл блоба под блокировкой строки, которую берёт и
+        ContentAddressedStorage._incref. Блоб мог после выборки снова получить
+        ссылку (или получить и потерять её, обновив updated_at) — тогда
+        повторная проверка в той же транзакции его пропускает.
+        """
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(
+                pk=pk, refcount=0, updated_at__lt=threshold,
+            ).first()
+            if blob is None:
+                return False
+            storage.purge(blob.name)
+            blob.delete()
+        return True
+
+    def _recount(self, storage, dry_run):
+        references = Counter(iter_references())
+        fixed = 0
+        for blob in MediaBlob.objects.iterator():
+            actual = references.pop(blob.name, 0)
+            if blob.refcount != actual:
+                fixed += 1
+                if not dry_run:
+                    MediaBlob.objects.filter(pk=blob.pk).update(refcount=actual, updated_at=timezone.now())
+        # Файлы, на которые ссылаются модели, но без строки учёта
+        for name, count in references.items():
+            if storage.exists(name):
+                fixed += 1
+                if not dry_run:
+                    MediaBlob.objects.create(name=name, size=storage.size(name), refcount=count)
+        self.stdout.write(f'Пересчёт ссылок: исправлено записей {fixed}')
+
+    def _remove_stale_tmp(self, storage, grace_hours, dry_run):
+        """Временные файлы прерванных загрузок."""
+        tmp_dir = storage.path(f'{BLOB_PREFIX}tmp')
+        if not os.path.isdir(tmp_dir) or dry_run:
+            return
+        threshold = time.time() - grace_hours * 3600
+        for entry in os.scandir(tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < threshold:
+                os.unlink(entry.path)
+
+    def _report(self):
+        stats = MediaBlob.objects.filter(refcount__gt=0).aggregate(
+            physical=Sum('size'), logical=Sum(F('size') * F('refcount')),
+        )
+        physical, logical = stats['physical'] or 0, stats['logical'] or 0
+        saved = logical - physical
+        ratio = saved / logical * 100 if logical else 0
+        self.stdout.write(
+            f'Хранится {_mb(physical)}, без дедупликации было бы {_mb(logical)}: '
+            f'экономия {_mb(saved)} ({ratio:.0f}%)'
+        )
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.archive import read_manifest, restore
+
+
+class Command(BaseCommand):
+    help = 'Возвращает платежи из архивов archive_payments в БД (все или за указанные месяцы).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='*', metavar='YYYY-MM', help='Месяцы; по умолчанию все архивы')
+        parser.add_argument('--dir', default=str(settings.PAYMENT_ARCHIVE_DIR), help='Каталог архивов')
+        parser.add_argument('--keep-files', action='store_true', help='Не удалять файлы после восстановления')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'])
+        months = options['months'] or None
+        if months:
+            known = {entry['month'] for entry in read_manifest(directory)}
+            missing = sorted(set(months) - known)
+            if missing:
+                raise CommandError(f'Нет архивов за: {", ".join(missing)}')
+        try:
+            restored, skipped, files = restore(directory, months, options['keep_files'], options['batch_size'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f'Восстановлено платежей: {restored}, пропущено: {skipped} (архивов: {files})'
+        ))
@@ -0,0 +1,46 @@
+# Триграммные индексы для поиска в админке (icontains) на PostgreSQL.
+#
+# Django строит icontains как UPPER(col::text) LIKE UPPER('%...%'), поэтому
+# индексируется то же выражение с gin_trgm_ops. Расширение pg_trgm создаётся,
+# если его ещё нет (нужны права на CREATE EXTENSION). На других СУБД — ничего.
+#
+# Индексы строятся CONCURRENTLY, чтобы не блокировать запись в таблицу на
+# время построения; такой CREATE INDEX нельзя выполнять в транзакции, поэтому
+# миграция не атомарная. Если построение прервалось, остаётся невалидный
+# индекс, который IF NOT EXISTS пропустит: его нужно удалить
+# (DROP INDEX CONCURRENTLY) и повторить миграцию.
+
+from django.db import migrations
+
+COLUMNS = ['email', 'first_name', 'last_name', 'phone']
+
+POSTGRES_FORWARD = ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_{column}_trgm_idx ON users_user '
+    f'USING gin (UPPER({column}::text) gin_trgm_ops)'
+    for column in COLUMNS
+]
+
+POSTGRES_BACKWARD = [f'DROP INDEX CONCURRENTLY IF EXISTS users_user_{column}_trgm_idx' for column in COLUMNS]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('users', '0008_payment_archive_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'postgresql': POSTGRES_FORWARD}),
+            _run({'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -1,3 +1,7 @@
+import uuid
+from pathlib import Path
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.translation import gettext_lazy as _
@@ -41,6 +45,8 @@ class User(AbstractUser):
     phone = models.CharField(_('phone'), max_length=20, blank=True, null=True)
     city = models.CharField(_('city'), max_length=100, blank=True, null=True)
     avatar = models.ImageField(_('avatar'), upload_to='avatars/', blank=True, null=True)
+    # Уменьшенные копии и заглушка аватара (config/images.py)
+    avatar_variants = models.JSONField(_('avatar variants'), default=dict, blank=True, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -49,6 +55,11 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # Фильтры списка пользователей (email покрыт уникальным индексом)
+            models.Index(fields=['city', 'id'], name='users_user_city_id_idx'),
+            models.Index(fields=['is_active', 'id'], name='users_user_active_id_idx'),
+        ]
 
     def __str__(self):
         return self.email
@@ -77,6 +88,76 @@ class Payment(models.Model):
         verbose_name = _('payment')
         verbose_name_plural = _('payments')
         ordering = ['-payment_date']
+        indexes = [
+            # Список платежей пользователя (новые первыми) и выборка месяцев для архива
+            models.Index(fields=['user', '-payment_date'], name='users_payment_user_date_idx'),
+            models.Index(fields=['payment_date'], name='users_payment_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.amount} ({self.payment_date})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности запроса (заголовок Idempotency-Key, config/idempotency.py):
+    отпечаток тела запроса и сохранённый ответ для повтора.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', verbose_name=_('user'))
+    scope = models.CharField(_('scope'), max_length=50)
+    key = models.CharField(_('key'), max_length=255)
+    fingerprint = models.CharField(_('request fingerprint'), max_length=64)
+    status_code = models.PositiveSmallIntegerField(_('status code'), null=True, blank=True)
+    response_body = models.JSONField(_('response body'), null=True, blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('idempotency key')
+        verbose_name_plural = _('idempotency keys')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='unique_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.scope}:{self.key}'
+
+
+class UploadSession(models.Model):
+    """
+    Загрузка изображения частями: файл собирается во временном каталоге
+    (UPLOAD_TMP_DIR) и после завершения прикрепляется к ImageField объекта.
+    """
+    TARGET_CHOICES = [
+        ('user_avatar', _('User avatar')),
+        ('course_preview', _('Course preview')),
+        ('lesson_preview', _('Lesson preview')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions', verbose_name=_('user'))
+    target = models.CharField(_('target'), max_length=20, choices=TARGET_CHOICES)
+    object_id = models.PositiveBigIntegerField(_('object ID'))
+    filename = models.CharField(_('file name'), max_length=255)
+    content_type = models.CharField(_('content type'), max_length=50)
+    size = models.PositiveBigIntegerField(_('size'))
+    offset = models.PositiveBigIntegerField(_('offset'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
+    @property
+    def tmp_path(self) -> Path:
+        return Path(settings.UPLOAD_TMP_DIR) / f'{self.id}.part'
+
+    def discard(self):
+        """Удаляет сессию вместе с временным файлом и частями прерванных запросов."""
+        self.tmp_path.unlink(missing_ok=True)
+        for chunk_path in self.tmp_path.parent.glob(f'{self.id}.*.chunk'):
+            chunk_path.unlink(missing_ok=True)
+        self.delete()
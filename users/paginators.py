@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class UserCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация списка пользователей: страница выбирается по условию
+    ``id > <последний id>``, а не через OFFSET, поэтому стоимость запроса
+    не растёт с номером страницы и не нужен COUNT(*) по всей таблице.
+    """
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = "id"
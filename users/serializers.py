@@ -1,5 +1,8 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, Payment
+
+from config.images import ImageVariantsField
+from .models import User, Payment, UploadSession
 from .services import (
     get_stripe_api_key,
     create_stripe_product,
@@ -105,6 +108,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели User"""
     payments = PaymentSerializer(many=True, read_only=True)
+    avatar_variants = ImageVariantsField('avatar')
 
     class Meta:
         model = User
@@ -116,6 +120,7 @@ class UserSerializer(serializers.ModelSerializer):
             'phone',
             'city',
             'avatar',
+            'avatar_variants',
             'is_staff',
             'is_active',
             'date_joined',
@@ -126,6 +131,8 @@ class UserSerializer(serializers.ModelSerializer):
 
 class UserPublicSerializer(serializers.ModelSerializer):
     """Сериализатор для публичного просмотра профиля (без пароля, фамилии и платежей)"""
+    avatar_variants = ImageVariantsField('avatar')
+
     class Meta:
         model = User
         fields = [
@@ -135,8 +142,38 @@ class UserPublicSerializer(serializers.ModelSerializer):
             'phone',
             'city',
             'avatar',
+            'avatar_variants',
             'is_staff',
             'is_active',
             'date_joined',
         ]
         read_only_fields = ['id', 'date_joined']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Сессия загрузки частями. Лимиты размера и типа проверяются при создании,
+    до передачи содержимого файла.
+    """
+    chunk_size = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'target', 'object_id', 'filename', 'content_type', 'size', 'offset', 'chunk_size']
+        read_only_fields = ['id', 'offset']
+
+    def get_chunk_size(self, instance) -> int:
+        """Максимальный размер одной части"""
+        return settings.UPLOAD_CHUNK_MAX_SIZE
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Размер файла должен быть от 1 до {settings.UPLOAD_MAX_SIZE} байт.')
+        return value
+
+    def validate_content_type(self, value):
+        if value not in settings.UPLOAD_ALLOWED_TYPES:
+            raise serializers.ValidationError(
+                f'Недопустимый тип файла. Разрешены: {", ".join(settings.UPLOAD_ALLOWED_TYPES)}.'
+            )
+        return value
@@ -2,11 +2,22 @@
 Сервисные функции для взаимодействия с Stripe API.
 При создании платежа: продукт → цена → сессия Checkout.
 Цены в Stripe передаются в копейках (amount * 100).
+SDK stripe импортируется лениво при первом обращении: его импорт занимает
+сотни миллисекунд и не нужен воркерам, которые не работают с платежами.
 """
-import stripe
 from django.conf import settings
 from typing import Optional
 
+from config.profiling import phase
+
+
+def _stripe():
+    """Модуль stripe с установленным API-ключом."""
+    import stripe
+
+    stripe.api_key = get_stripe_api_key()
+    return stripe
+
 
 def get_stripe_api_key() -> Optional[str]:
     """Возвращает API-ключ Stripe из настроек."""
@@ -19,11 +30,12 @@ def create_stripe_product(name: str, description: str = '') -> dict:
     Создаёт продукт в Stripe.
     https://stripe.com/docs/api/products/create
     """
-    stripe.api_key = get_stripe_api_key()
-    product = stripe.Product.create(
-        name=name,
-        description=description or None,
-    )
+    stripe = _stripe()
+    with phase('stripe'):
+        product = stripe.Product.create(
+            name=name,
+            description=description or None,
+        )
     return {'id': product.id, 'object': product}
 
 
@@ -37,12 +49,13 @@ def create_stripe_price(
     amount_cents — сумма в копейках (рубли * 100).
     https://stripe.com/docs/api/prices/create
     """
-    stripe.api_key = get_stripe_api_key()
-    price = stripe.Price.create(
-        currency=currency,
-        unit_amount=amount_cents,
-        product=product_id,
-    )
+    stripe = _stripe()
+    with phase('stripe'):
+        price = stripe.Price.create(
+            currency=currency,
+            unit_amount=amount_cents,
+            product=product_id,
+        )
     return {'id': price.id, 'object': price}
 
 
@@ -58,7 +71,7 @@ def create_stripe_checkout_session(
     Возвращает dict с полями: id (session_id), url (ссылка на оплату).
     https://stripe.com/docs/api/checkout/sessions/create
     """
-    stripe.api_key = get_stripe_api_key()
+    stripe = _stripe()
     params = {
         'mode': 'payment',
         'line_items': [{'price': price_id, 'quantity': 1}],
@@ -69,7 +82,8 @@ def create_stripe_checkout_session(
         params['customer_email'] = customer_email
     if metadata:
         params['metadata'] = metadata
-    session = stripe.checkout.Session.create(**params)
+    with phase('stripe'):
+        session = stripe.checkout.Session.create(**params)
     return {
         'id': session.id,
         'url': session.url,
@@ -83,12 +97,12 @@ def retrieve_stripe_checkout_session(session_id: str) -> Optional[dict]:
     Получает данные сессии Checkout по id (для проверки статуса платежа).
     https://stripe.com/docs/api/checkout/sessions/retrieve
     """
-    api_key = get_stripe_api_key()
-    if not api_key:
+    if not get_stripe_api_key():
         return None
-    stripe.api_key = api_key
+    stripe = _stripe()
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with phase('stripe'):
+            session = stripe.checkout.Session.retrieve(session_id)
         return {
             'id': session.id,
             'payment_status': session.payment_status,
@@ -0,0 +1,30 @@
+"""
+Сигналы приложения users: генерация вариантов аватара (config/images.py)
+после фиксации транзакции и счётчик оплат курса (materials/counters.py).
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from config.images import needs_variants
+from materials import counters
+from .models import Payment, User
+from .tasks import generate_avatar_variants
+
+
+@receiver(post_save, sender=User)
+def avatar_variants(sender, instance, **kwargs):
+    if needs_variants(instance, 'avatar'):
+        pk = instance.pk
+        transaction.on_commit(lambda: generate_avatar_variants.delay(pk))
+
+
+@receiver(post_save, sender=Payment)
+def payment_added(sender, instance, created, **kwargs):
+    if created:
+        counters.adjust(instance.paid_course_id, 'paid_count', 1)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_removed(sender, instance, **kwargs):
+    counters.adjust(instance.paid_course_id, 'paid_count', -1)
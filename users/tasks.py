@@ -5,6 +5,8 @@ from celery import shared_task
 from django.utils import timezone
 from datetime import timedelta
 
+from config.task_metrics import record_task_items
+
 
 @shared_task
 def deactivate_inactive_users():
@@ -21,4 +23,69 @@ def deactivate_inactive_users():
         last_login__lt=threshold,
         is_active=True,
     ).update(is_active=False)
+    record_task_items('users_deactivated', updated)
+    return updated
+
+
+@shared_task
+def generate_avatar_variants(user_id: int, force: bool = False):
+    """Генерирует уменьшенные копии аватара (config/images.py); идемпотентна."""
+    from config.images import process_image_field
+    from .models import User
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is None:
+        return False
+    changed = process_image_field(user, 'avatar', force=force)
+    record_task_items('images_processed', int(changed))
+    return changed
+
+
+@shared_task
+def cleanup_upload_sessions():
+    """
+    Удаляет брошенные сессии загрузки частями (старше UPLOAD_SESSION_TTL)
+    вместе с временными файлами. Запускается по расписанию celery-beat.
+    """
+    from django.conf import settings
+    from .models import UploadSession
+
+    threshold = timezone.now() - settings.UPLOAD_SESSION_TTL
+    removed = 0
+    for upload in UploadSession.objects.filter(updated_at__lt=threshold).iterator():
+        upload.discard()
+        removed += 1
+    record_task_items('upload_sessions_removed', removed)
+    return removed
+
+
+@shared_task
+def cleanup_idempotency_keys():
+    """Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL."""
+    from django.conf import settings
+    from .models import IdempotencyKey
+
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=timezone.now() - settings.IDEMPOTENCY_KEY_TTL).delete()
+    record_task_items('idempotency_keys_removed', deleted)
+    return deleted
+
+
+@shared_task
+def set_users_active(user_ids: list, active: bool):
+    """Массовая блокировка/разблокировка пользователей из админки (config/admin_tools.py)."""
+    from .models import User
+
+    updated = User.objects.filter(pk__in=user_ids).exclude(is_active=active).update(is_active=active)
+    record_task_items('users_updated', updated)
     return updated
+
+
+@shared_task
+def delete_payments(payment_ids: list):
+    """Массовое удаление платежей из админки (config/admin_tools.py)."""
+    from .models import Payment
+
+    # Через ORM: сигналы уменьшают счётчики оплат курсов
+    deleted, _ = Payment.objects.filter(pk__in=payment_ids).delete()
+    record_task_items('payments_deleted', deleted)
+    return deleted
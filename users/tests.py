@@ -1 +1,466 @@
 """Пакет тестов приложения users (используются в других модулях)."""
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from prometheus_client import REGISTRY
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from config import throttling
+from config.pagination import EstimatedCountPaginator
+from materials.models import Course, Lesson, OutboxMessage
+from materials.tasks import dispatch_outbox
+from .models import IdempotencyKey, User, Payment, UploadSession
+from .views import UploadSessionAPIView
+
+
+class UserListTests(APITestCase):
+    """
+    Тесты keyset-пагинации, фильтров и NDJSON-выгрузки списка пользователей.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.admin = User.objects.create_user(email="admin@example.com", password="pass12345", is_staff=True)
+        self.users = [
+            User.objects.create_user(email=f"user{i}@example.com", password="pass12345", city="Moscow")
+            for i in range(3)
+        ]
+        self.inactive = User.objects.create_user(
+            email="inactive@example.com", password="pass12345", city="Kazan", is_active=False,
+        )
+        Payment.objects.create(user=self.users[0], amount=100, payment_method="cash")
+
+    def test_list_is_cursor_paginated(self):
+        self.client.force_authenticate(user=self.users[0])
+        url = reverse("user-list")
+        response = self.client.get(url, {"page_size": 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNotNone(response.data["next"])
+
+        seen = [row["id"] for row in response.data["results"]]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            seen += [row["id"] for row in response.data["results"]]
+        self.assertEqual(seen, sorted(User.objects.values_list("id", flat=True)))
+
+    def test_list_filters(self):
+        self.client.force_authenticate(user=self.users[0])
+        url = reverse("user-list")
+
+        response = self.client.get(url, {"city": "Kazan"})
+        self.assertEqual([row["email"] for row in response.data["results"]], ["inactive@example.com"])
+
+        response = self.client.get(url, {"is_active": "false"})
+        self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get(url, {"email": "user1@example.com"})
+        self.assertEqual(response.data["results"][0]["id"], self.users[1].id)
+
+    def test_export_streams_ndjson_for_staff(self):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse("user-export")
+        response = self.client.get(url, {"city": "Moscow"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], [user.id for user in self.users])
+        self.assertEqual(len(rows[0]["payments"]), 1)
+
+    def test_export_forbidden_for_regular_user(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse("user-export"))
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_payments_route_not_shadowed_by_user_detail(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.get(reverse("payment-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_PROCESS_POOL_SIZE=0)
+class AvatarVariantsBackfillTests(APITestCase):
+    """
+    Тесты догоняющей генерации вариантов аватаров (уже загруженные файлы).
+    """
+
+    def test_backfill_processes_only_missing(self):
+        buffer = BytesIO()
+        Image.new("RGB", (500, 400), (10, 120, 200)).save(buffer, "PNG")
+        user = User.objects.create_user(email="avatar@example.com", password="pass12345")
+        # Файл загружен до появления конвейера: сохраняем без сигналов
+        user.avatar.save("avatar.png", ContentFile(buffer.getvalue()), save=False)
+        User.objects.filter(pk=user.pk).update(avatar=user.avatar.name)
+
+        out = StringIO()
+        call_command("generate_image_variants", "--model", "user", "--sync", stdout=out)
+        self.assertIn("1", out.getvalue())
+        user.refresh_from_db()
+        self.assertEqual(set(user.avatar_variants["sizes"]), {"small", "medium"})
+
+        self.client.force_authenticate(user=user)
+        data = self.client.get(reverse("user-detail", args=[user.id])).data["avatar_variants"]
+        self.assertTrue(data["small"]["jpeg"].endswith(".jpg"))
+
+        out = StringIO()
+        call_command("generate_image_variants", "--model", "user", "--sync", stdout=out)
+        self.assertIn(": обработано 0", out.getvalue())
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), UPLOAD_TMP_DIR=tempfile.mkdtemp(),
+    UPLOAD_CHUNK_MAX_SIZE=4096, IMAGE_PROCESS_POOL_SIZE=0,
+)
+class ChunkedUploadTests(APITestCase):
+    """
+    Тесты загрузки изображений частями.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.user = User.objects.create_user(email="uploader@example.com", password="pass12345")
+        self.client.force_authenticate(user=self.user)
+        buffer = BytesIO()
+        Image.effect_noise((120, 90), 50).convert("RGB").save(buffer, "PNG")
+        self.content = buffer.getvalue()
+
+    def initiate(self, **overrides):
+        data = {
+            "target": "user_avatar", "object_id": self.user.id, "filename": "me.png",
+            "content_type": "image/png", "size": len(self.content), **overrides,
+        }
+        return self.client.post(reverse("upload-create"), data, format="json")
+
+    def put_chunk(self, upload_id, offset, chunk):
+        return self.client.put(
+            reverse("upload-detail", args=[upload_id]), data=chunk,
+            content_type="application/octet-stream", HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_in_chunks_and_resume(self):
+        response = self.initiate()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_id, chunk_size = response.data["id"], response.data["chunk_size"]
+        self.assertGreater(len(self.content), chunk_size)
+
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content[:chunk_size]).data["offset"], chunk_size)
+        # Повтор уже принятой части — конфликт с текущим смещением для продолжения
+        conflict = self.put_chunk(upload_id, 0, self.content[:chunk_size])
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(conflict.data["offset"], chunk_size)
+
+        offset = self.client.get(reverse("upload-detail", args=[upload_id])).data["offset"]
+        while offset < len(self.content):
+            response = self.put_chunk(upload_id, offset, self.content[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            offset = response.data["offset"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("upload-complete", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        with self.user.avatar.open("rb") as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertIn("small", self.user.avatar_variants["sizes"])
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_limits_checked_before_content(self):
+        self.assertEqual(self.initiate(size=10 ** 9).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.initiate(content_type="application/pdf").status_code, status.HTTP_400_BAD_REQUEST)
+
+        upload_id = self.initiate().data["id"]
+        too_big = self.put_chunk(upload_id, 0, self.content[:4097])
+        self.assertEqual(too_big.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        wrong_type = self.put_chunk(upload_id, 0, b"%PDF-1.4" + b"\0" * 100)
+        self.assertEqual(wrong_type.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+
+    def test_type_checked_once_signature_is_complete(self):
+        upload_id = self.initiate().data["id"]
+        self.assertEqual(self.put_chunk(upload_id, 0, self.content[:5]).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.put_chunk(upload_id, 5, self.content[5:100]).data["offset"], 100)
+
+        upload_id = self.initiate().data["id"]
+        self.assertEqual(self.put_chunk(upload_id, 0, b"%PDF").status_code, status.HTTP_200_OK)
+        wrong_type = self.put_chunk(upload_id, 4, b"-1.4" + b"\0" * 100)
+        self.assertEqual(wrong_type.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertFalse(UploadSession.objects.filter(pk=upload_id).exists())
+
+    def test_racing_chunk_does_not_overwrite_accepted_bytes(self):
+        upload_id = self.initiate().data["id"]
+        stale = UploadSession.objects.get(pk=upload_id)
+        self.put_chunk(upload_id, 0, self.content[:100])
+
+        # Параллельный запрос прочитал сессию до того, как первая часть была принята
+        with mock.patch.object(UploadSessionAPIView, "get_object", return_value=stale):
+            conflict = self.put_chunk(upload_id, 0, self.content[:50] + b"\0" * 50)
+
+        self.assertEqual(conflict.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(conflict.data["offset"], 100)
+        self.assertEqual(stale.tmp_path.read_bytes(), self.content[:100])
+        self.assertEqual(list(stale.tmp_path.parent.glob(f"{upload_id}.*.chunk")), [])
+
+    def test_incomplete_upload_and_foreign_target(self):
+        upload_id = self.initiate().data["id"]
+        self.put_chunk(upload_id, 0, self.content[:100])
+        response = self.client.post(reverse("upload-complete", args=[upload_id]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        course = Course.objects.create(title="Чужой курс", owner=User.objects.create_user(email="owner@example.com"))
+        forbidden = self.initiate(target="course_preview", object_id=course.id)
+        self.assertEqual(forbidden.status_code, status.HTTP_403_FORBIDDEN)
+
+
+THROTTLES = {
+    "token_obtain": {"rate": "2/min", "keys": ["ip", "login"]},
+    "payment_create": {"rate": "60/min", "burst": 2, "keys": ["user", "ip"]},
+}
+
+
+@override_settings(THROTTLES=THROTTLES)
+class ThrottlingTests(APITestCase):
+    """
+    Ограничение частоты: получение токена и создание платежа.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        throttling.reset()
+        self.user = User.objects.create_user(email="user@example.com", password="pass12345")
+
+    def test_token_obtain_limited_per_ip_and_login(self):
+        url = reverse("token_obtain_pair")
+        rejected = {"scope": "token_obtain", "key": "login"}
+        before = REGISTRY.get_sample_value("http_throttled_total", rejected) or 0
+        for _ in range(2):
+            response = self.client.post(url, {"email": "user@example.com", "password": "wrong"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post(url, {"email": "USER@example.com", "password": "pass12345"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(REGISTRY.get_sample_value("http_throttled_total", rejected), before + 1)
+
+        # Другой адрес и другой логин — свои вёдра
+        response = self.client.post(
+            url, {"email": "other@example.com", "password": "x"}, format="json", REMOTE_ADDR="10.0.0.9",
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_only_payment_create_is_limited(self):
+        self.client.force_authenticate(user=self.user)
+        url = reverse("payment-list")
+        codes = [
+            self.client.post(url, {"amount": 100, "payment_method": "cash"}, format="json").status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(codes, [status.HTTP_201_CREATED, status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+class IdempotencyKeyTests(APITestCase):
+    """
+    Заголовок Idempotency-Key при создании платежа.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        throttling.reset()
+        self.user = User.objects.create_user(email="payer@example.com", password="pass12345")
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse("payment-list")
+
+    def post(self, data, key):
+        return self.client.post(self.url, data, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.post({"amount": "150.00", "payment_method": "cash"}, "retry-1")
+        second = self.post({"amount": "150.00", "payment_method": "cash"}, "retry-1")
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Payment.objects.filter(user=self.user).count(), 1)
+
+        # Другой ключ — новый платёж
+        self.post({"amount": "150.00", "payment_method": "cash"}, "retry-2")
+        self.assertEqual(Payment.objects.filter(user=self.user).count(), 2)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.post({"amount": "10.00", "payment_method": "cash"}, "same")
+        response = self.post({"amount": "99.00", "payment_method": "cash"}, "same")
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Payment.objects.filter(user=self.user).count(), 1)
+
+    def test_failed_request_does_not_consume_key(self):
+        response = self.post({"amount": "oops", "payment_method": "cash"}, "fix-and-retry")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        response = self.post({"amount": "oops", "payment_method": "cash"}, "fix-and-retry")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PaymentArchiveTests(APITestCase):
+    """
+    Архивирование старых платежей в NDJSON.gz и восстановление (users/archive.py).
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.dir = Path(tempfile.mkdtemp())
+        self.user = User.objects.create_user(email="payer@example.com", password="pass12345")
+        self.course = Course.objects.create(title="Course")
+        self.old = [
+            Payment.objects.create(user=self.user, paid_course=self.course, amount=100 + i, payment_method="cash")
+            for i in range(2)
+        ]
+        self.old_date = timezone.now() - timedelta(days=450)
+        Payment.objects.filter(pk__in=[p.pk for p in self.old]).update(payment_date=self.old_date)
+        self.recent = Payment.objects.create(user=self.user, paid_course=self.course, amount=50, payment_method="cash")
+
+    def archive(self):
+        call_command("archive_payments", "--months", "12", "--dir", str(self.dir), stdout=StringIO())
+        return json.loads((self.dir / "manifest.json").read_text())["archives"]
+
+    def test_archive_and_restore_round_trip(self):
+        archives = self.archive()
+
+        self.assertEqual(len(archives), 1)
+        self.assertEqual(archives[0]["month"], self.old_date.strftime("%Y-%m"))
+        self.assertEqual(archives[0]["count"], 2)
+        with gzip.open(self.dir / archives[0]["file"], "rt") as fh:
+            rows = [json.loads(line) for line in fh]
+        self.assertEqual(sorted(row["id"] for row in rows), sorted(p.pk for p in self.old))
+        self.assertEqual(list(Payment.objects.values_list("pk", flat=True)), [self.recent.pk])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.paid_count, 1)
+
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(len(self.client.get(reverse("payment-list")).data), 1)
+
+        # Повторный запуск ничего не выгружает
+        self.assertEqual(self.archive(), archives)
+
+        call_command("restore_payments", "--dir", str(self.dir), stdout=StringIO())
+
+        restored = Payment.objects.get(pk=self.old[1].pk)
+        self.assertEqual((restored.amount, restored.payment_date), (self.old[1].amount, self.old_date))
+        self.assertEqual(Payment.objects.count(), 3)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.paid_count, 3)
+        self.assertEqual(json.loads((self.dir / "manifest.json").read_text())["archives"], [])
+        self.assertFalse((self.dir / archives[0]["file"]).exists())
+
+    def test_restore_verifies_checksum_and_missing_references(self):
+        archives = self.archive()
+        self.course.delete()
+
+        with self.assertRaises(CommandError):
+            call_command("restore_payments", "2000-01", "--dir", str(self.dir), stdout=StringIO())
+
+        call_command("restore_payments", archives[0]["month"], "--dir", str(self.dir), "--keep-files",
+                     stdout=StringIO())
+        self.assertEqual(Payment.objects.filter(pk__in=[p.pk for p in self.old], paid_course=None).count(), 2)
+        self.assertTrue((self.dir / archives[0]["file"]).exists())
+
+        archives = self.archive()
+        path = self.dir / archives[0]["file"]
+        path.write_bytes(path.read_bytes()[:-1] + b"x")
+        with self.assertRaisesMessage(CommandError, "Контрольная сумма"):
+            call_command("restore_payments", "--dir", str(self.dir), stdout=StringIO())
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+@override_settings(ADMIN_BULK_CHUNK_SIZE=2)
+class AdminChangelistTests(APITestCase):
+    """
+    Списки админки на больших таблицах: без точных COUNT, без N+1, массовые действия в фоне.
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.admin = User.objects.create_superuser(email="root@example.com", password="pass12345")
+        self.client.force_login(self.admin)
+        self.users = [User.objects.create_user(email=f"buyer{i}@example.com") for i in range(3)]
+
+    def add_payments(self, count):
+        for i in range(count):
+            course = Course.objects.create(title=f"Course {i}")
+            lesson = Lesson.objects.create(title=f"Lesson {i}", course=course)
+            Payment.objects.create(user=self.users[i % 3], paid_course=course, paid_lesson=lesson,
+                                   amount=10, payment_method="cash")
+
+    def changelist_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("admin:users_payment_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_payment_changelist_is_constant_in_queries_without_full_count(self):
+        self.add_payments(1)
+        _, before = self.changelist_queries()
+        self.add_payments(5)
+        response, after = self.changelist_queries()
+
+        self.assertEqual(after, before)
+        changelist = response.context["cl"]
+        self.assertIsNone(changelist.full_result_count)
+        self.assertIsInstance(changelist.paginator, EstimatedCountPaginator)
+        self.assertEqual(changelist.result_count, 6)
+
+    def test_fk_autocomplete(self):
+        self.add_payments(2)
+        response = self.client.get(reverse("admin:autocomplete"), {
+            "app_label": "users", "model_name": "payment", "field_name": "paid_course", "term": "course 1",
+        })
+
+        self.assertEqual([item["text"] for item in response.json()["results"]], ["Course 1"])
+
+    def test_bulk_actions_run_in_background(self):
+        url = reverse("admin:users_user_changelist")
+        response = self.client.post(url, {
+            "action": "deactivate_users", "_selected_action": [user.pk for user in self.users],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+        self.assertEqual(User.objects.filter(is_active=False).count(), 0)
+        dispatch_outbox.delay()
+        self.assertEqual(User.objects.filter(is_active=False).count(), 3)
+
+        # «Выбрать все» по фильтру: id идут в задачу пачками, без страницы подтверждения
+        self.add_payments(3)
+        response = self.client.post(reverse("admin:users_payment_changelist"), {
+            "action": "delete_payments_background", "select_across": "1", "_selected_action": ["0"],
+        })
+        self.assertEqual(response.status_code, 302)
+        dispatch_outbox.delay()
+        self.assertFalse(Payment.objects.exists())
+        self.assertNotContains(self.client.get(url), 'value="delete_selected"')
@@ -1,6 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserViewSet, PaymentViewSet, UserRegistrationAPIView, PaymentStatusAPIView
+from .views import (
+    UserViewSet,
+    PaymentViewSet,
+    UserRegistrationAPIView,
+    PaymentStatusAPIView,
+    UploadSessionCreateAPIView,
+    UploadSessionAPIView,
+    UploadSessionCompleteAPIView,
+)
+from .async_views import AsyncPaymentStatusView
 
 router = DefaultRouter()
 router.register(r'', UserViewSet, basename='user')
@@ -9,5 +18,9 @@ router.register(r'payments', PaymentViewSet, basename='payment')
 urlpatterns = [
     path('register/', UserRegistrationAPIView.as_view(), name='user-register'),
     path('payments/status/', PaymentStatusAPIView.as_view(), name='payment-status'),
+    path('payments/status/async/', AsyncPaymentStatusView.as_view(), name='async-payment-status'),
+    path('uploads/', UploadSessionCreateAPIView.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionAPIView.as_view(), name='upload-detail'),
+    path('uploads/<uuid:pk>/complete/', UploadSessionCompleteAPIView.as_view(), name='upload-complete'),
     path('', include(router.urls)),
 ]
@@ -1,28 +1,72 @@
+import json
+import os
+import shutil
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, generics, status
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.filters import OrderingFilter
 from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
-from drf_yasg.utils import swagger_auto_schema
+from drf_yasg.utils import no_body, swagger_auto_schema
 from drf_yasg import openapi
-from .models import User, Payment
-from .serializers import UserSerializer, PaymentSerializer, UserRegistrationSerializer, UserPublicSerializer
+from rest_framework_simplejwt.views import TokenObtainPairView
+from config.idempotency import IdempotentCreateMixin
+from config.images import has_updated_at, sniff_image_type
+from config.profiling import ServerTimingMixin
+from config.throttling import BucketThrottle
+from materials.permissions import IsOwnerOrModerator
+from .models import User, Payment, UploadSession
+from .serializers import (
+    UserSerializer,
+    PaymentSerializer,
+    UserRegistrationSerializer,
+    UserPublicSerializer,
+    UploadSessionSerializer,
+)
 from .permissions import IsOwnerOrReadOnly
+from .paginators import UserCursorPagination
 from .services import retrieve_stripe_checkout_session
 
 
-class UserRegistrationAPIView(generics.CreateAPIView):
+class ThrottledTokenObtainPairView(TokenObtainPairView):
+    """Получение JWT с ограничением частоты по IP и логину (хэширование пароля дорогое)"""
+    throttle_classes = [BucketThrottle]
+    throttle_scope = 'token_obtain'
+    throttle_login_field = User.USERNAME_FIELD
+
+
+class UserRegistrationAPIView(ServerTimingMixin, generics.CreateAPIView):
     """Регистрация нового пользователя"""
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
     permission_classes = [AllowAny]
 
 
-class UserViewSet(viewsets.ModelViewSet):
-    """ViewSet для работы с пользователями (CRUD)"""
-    queryset = User.objects.all()
+class UserViewSet(ServerTimingMixin, viewsets.ModelViewSet):
+    """
+    ViewSet для работы с пользователями (CRUD).
+    Список отдаётся keyset-пагинацией с фильтрами email/city/is_active,
+    полная выгрузка — потоково в NDJSON (GET /api/users/export/, только staff).
+    """
+    queryset = User.objects.prefetch_related('payments')
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = UserCursorPagination
+    # Без OrderingFilter: keyset-пагинации нужен стабильный уникальный порядок по id
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['email', 'city', 'is_active']
+    # Только числовые id, иначе маршрут детали перехватывает /api/users/payments/
+    lookup_value_regex = r'\d+'
+    export_chunk_size = 500
 
     def get_serializer_class(self):
         """Выбор сериализатора в зависимости от действия"""
@@ -39,16 +83,37 @@ class UserViewSet(viewsets.ModelViewSet):
         if self.action == 'create':
             # Создание через регистрацию (AllowAny)
             permission_classes = [AllowAny]
+        elif self.action == 'export':
+            # Полная выгрузка — только для администраторов и бэк-офиса
+            permission_classes = [IsAuthenticated, IsAdminUser]
         else:
             # Остальные действия требуют авторизации
             permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
         return [permission() for permission in permission_classes]
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Потоковая выгрузка пользователей в NDJSON (одна JSON-запись на строку).
+        Строки читаются из БД порциями через iterator(), поэтому память воркера
+        не зависит от числа пользователей. Фильтры те же, что и у списка.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        context = self.get_serializer_context()
 
-class PaymentViewSet(viewsets.ModelViewSet):
+        def rows():
+            for user in queryset.iterator(chunk_size=self.export_chunk_size):
+                data = UserSerializer(user, context=context).data
+                yield json.dumps(data, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+
+class PaymentViewSet(ServerTimingMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet для работы с платежами (CRUD) с фильтрацией.
     При payment_method=stripe возвращает payment_link.
+    Создание поддерживает заголовок Idempotency-Key (config/idempotency.py).
     """
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
@@ -57,16 +122,24 @@ class PaymentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['paid_course', 'paid_lesson', 'payment_method']
     ordering_fields = ['payment_date']
     ordering = ['-payment_date']
+    throttle_scope = 'payment_create'
+    idempotency_scope = 'payment_create'
 
     def get_queryset(self):
         """Пользователь видит только свои платежи."""
         return Payment.objects.filter(user=self.request.user)
 
+    def get_throttles(self):
+        # Создание платежа обращается к Stripe — ограничиваем только его
+        if self.action == 'create':
+            return [BucketThrottle()]
+        return super().get_throttles()
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class PaymentStatusAPIView(APIView):
+class PaymentStatusAPIView(ServerTimingMixin, APIView):
     """
     Проверка статуса платежа Stripe по id сессии (Session Retrieve).
     GET /api/users/payments/status/?session_id=cs_xxx
@@ -129,3 +202,169 @@ class PaymentStatusAPIView(APIView):
                 'status': session_data.get('status'),
             },
         )
+
+
+# Куда прикрепляется загруженный файл: модель, ImageField и право на изменение объекта
+UPLOAD_TARGETS = {
+    'user_avatar': ('users.User', 'avatar', IsOwnerOrReadOnly),
+    'course_preview': ('materials.Course', 'preview', IsOwnerOrModerator),
+    'lesson_preview': ('materials.Lesson', 'preview', IsOwnerOrModerator),
+}
+UPLOAD_READ_SIZE = 64 * 1024
+# Байтов от начала файла достаточно для сигнатуры любого допустимого типа (см. sniff_image_type)
+UPLOAD_SNIFF_SIZE = 12
+
+
+def _upload_target(view, request, target, object_id):
+    """Объект загрузки и имя поля; 404/403 — как при изменении объекта через API."""
+    model_label, field_name, permission_class = UPLOAD_TARGETS[target]
+    obj = get_object_or_404(apps.get_model(model_label), pk=object_id)
+    if not permission_class().has_object_permission(request, view, obj):
+        view.permission_denied(request)
+    return obj, field_name
+
+
+class UploadSessionCreateAPIView(ServerTimingMixin, generics.CreateAPIView):
+    """
+    Начало загрузки изображения частями.
+    POST /api/users/uploads/ {target, object_id, filename, content_type, size}
+    Далее: PUT /api/users/uploads/<id>/ с заголовком Upload-Offset и телом-частью,
+    POST /api/users/uploads/<id>/complete/ — прикрепление файла к объекту.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def perform_create(self, serializer):
+        data = serializer.validated_data
+        _upload_target(self, self.request, data['target'], data['object_id'])
+        upload = serializer.save(user=self.request.user)
+        upload.tmp_path.parent.mkdir(parents=True, exist_ok=True)
+        upload.tmp_path.touch()
+
+
+class UploadSessionAPIView(ServerTimingMixin, APIView):
+    """
+    Сессия загрузки: GET — текущее смещение (для продолжения после обрыва),
+    PUT — очередная часть, DELETE — отмена.
+    Часть пишется во временный файл потоково, без буферизации всего тела запроса.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self, pk):
+        return get_object_or_404(UploadSession, pk=pk, user=self.request.user)
+
+    def get(self, request, pk):
+        return Response(UploadSessionSerializer(self.get_object(pk)).data)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('Upload-Offset', openapi.IN_HEADER, type=openapi.TYPE_INTEGER, required=True,
+                              description='Смещение части в файле (должно совпадать с offset сессии)'),
+        ],
+        request_body=openapi.Schema(type=openapi.TYPE_STRING, format=openapi.FORMAT_BINARY),
+        responses={200: UploadSessionSerializer, 409: 'Смещение не совпадает', 413: 'Превышен лимит размера',
+                   415: 'Содержимое не является допустимым изображением'},
+    )
+    def put(self, request, pk):
+        upload = self.get_object(pk)
+        offset = request.headers.get('Upload-Offset', '')
+        length = request.META.get('CONTENT_LENGTH') or ''
+        if not offset.isdigit() or not length.isdigit():
+            return Response({'error': 'Нужны заголовки Upload-Offset и Content-Length.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        offset, length = int(offset), int(length)
+        # Лимиты проверяются до чтения тела
+        if offset != upload.offset:
+            return Response({'error': 'Смещение не совпадает с загруженным.', 'offset': upload.offset},
+                            status=status.HTTP_409_CONFLICT)
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE or offset + length > upload.size:
+            return Response({'error': 'Часть превышает допустимый размер.'},
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        # Тело читается в отдельный файл запроса: параллельная часть с тем же
+        # смещением не может перезаписать уже принятые байты общего файла
+        chunk_path = upload.tmp_path.with_name(f'{upload.id}.{uuid.uuid4().hex}.chunk')
+        stream = request._request
+        written = 0
+        try:
+            with open(chunk_path, 'wb') as f:
+                while written < length:
+                    piece = stream.read(min(UPLOAD_READ_SIZE, length - written))
+                    if not piece:
+                        break
+                    f.write(piece)
+                    written += len(piece)
+            return self._accept_chunk(upload.pk, offset, chunk_path, written)
+        finally:
+            chunk_path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _accept_chunk(pk, offset, chunk_path, written):
+        """Под блокировкой строки сессии сверяет смещение и дописывает часть в файл."""
+        with transaction.atomic():
+            upload = get_object_or_404(UploadSession.objects.select_for_update(), pk=pk)
+            if offset != upload.offset:
+                return Response({'error': 'Смещение не совпадает с загруженным.', 'offset': upload.offset},
+                                status=status.HTTP_409_CONFLICT)
+            end = offset + written
+            sniff_size = min(UPLOAD_SNIFF_SIZE, upload.size)
+            with open(chunk_path, 'rb') as src, open(upload.tmp_path, 'r+b') as dst:
+                # Тип проверяется, как только накоплены первые байты файла:
+                # часть может быть короче сигнатуры
+                if offset < sniff_size <= end:
+                    head = dst.read(offset) + src.read(sniff_size - offset)
+                    if sniff_image_type(head) != upload.content_type:
+                        upload.discard()
+                        return Response({'error': 'Содержимое файла не соответствует типу изображения.'},
+                                        status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+                    src.seek(0)
+                dst.seek(offset)
+                shutil.copyfileobj(src, dst, UPLOAD_READ_SIZE)
+            upload.offset = end
+            upload.save(update_fields=['offset', 'updated_at'])
+        return Response(UploadSessionSerializer(upload).data)
+
+    def delete(self, request, pk):
+        self.get_object(pk).discard()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionCompleteAPIView(ServerTimingMixin, APIView):
+    """Завершение загрузки: проверка файла и прикрепление к ImageField объекта."""
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        request_body=no_body,
+        responses={200: 'URL прикреплённого файла', 409: 'Файл загружен не полностью'},
+    )
+    def post(self, request, pk):
+        from PIL import Image
+
+        upload = get_object_or_404(UploadSession, pk=pk, user=request.user)
+        if upload.offset != upload.size or os.path.getsize(upload.tmp_path) != upload.size:
+            return Response({'error': 'Файл загружен не полностью.', 'offset': upload.offset},
+                            status=status.HTTP_409_CONFLICT)
+        obj, field_name = _upload_target(self, request, upload.target, upload.object_id)
+        try:
+            with Image.open(upload.tmp_path) as image:
+                image.verify()
+        except Exception:
+            upload.discard()
+            return Response({'error': 'Файл повреждён или не является изображением.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        field_file = getattr(obj, field_name)
+        with open(upload.tmp_path, 'rb') as f:
+            field_file.save(os.path.basename(upload.filename), File(f), save=False)
+        # post_save запускает генерацию вариантов изображения (config/images.py);
+        # updated_at — чтобы новое превью попало в дельта-синхронизацию
+        update_fields = [field_name]
+        if has_updated_at(type(obj)):
+            update_fields.append('updated_at')
+        obj.save(update_fields=update_fields)
+        upload.discard()
+        return Response({
+            'target': upload.target,
+            'object_id': upload.object_id,
+            field_name: request.build_absolute_uri(field_file.url),
+        })